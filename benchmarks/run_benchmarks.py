@@ -0,0 +1,199 @@
+"""
+Benchmark suite for the cliExecutor actions against a local fake Homebridge UI.
+
+Each action is timed cold (all process-wide caches and connection pools
+cleared, fresh executor and session stores) and warm (same executor, caches
+populated). Results are written as a JSON report that can be compared with a
+report from another commit:
+
+    python benchmarks/run_benchmarks.py --accessories 400 --latency 5 -o report.json
+    python benchmarks/run_benchmarks.py --compare baseline.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from classes import hbApi
+from classes.accessory_cache import clearAccessoryCaches
+from classes.resilience import clearCircuitBreakers
+from classes.resolution_cache import clearResolutionCaches
+from classes.cliExecutorRefactored import cliExecutor
+from classes.concrete_providers import FileStorageProvider, FileUserSessionProvider
+from tests.fake_homebridge import FakeHomebridge, write_swagger
+
+ACTIONS = ['authorize', 'request', 'setaccessorychar', 'accessorycharvalues', 'listaccessorychars']
+
+
+def reset_process_state() -> None:
+    """Forget everything a fresh CLI process would not have."""
+    hbApi._specCache.clear()
+    hbApi.closeSessions()
+    clearAccessoryCaches()
+    clearCircuitBreakers()
+    clearResolutionCaches()
+
+
+def make_executor(workdir: str) -> cliExecutor:
+    return cliExecutor(
+        storage_provider=FileStorageProvider(os.path.join(workdir, '.sessionStore')),
+        user_session_provider=FileUserSessionProvider(os.path.join(workdir, '.authStore')),
+        # on-disk caches start empty with each run, as on a fresh install
+        resolution_cache_dir=os.path.join(workdir, '.hbCache'),
+        snapshot_dir=os.path.join(workdir, '.hbCache'),
+        breaker_state_dir=os.path.join(workdir, '.hbCache')
+    )
+
+
+def action_args(server: FakeHomebridge, session_id: str, target: str) -> Dict[str, argparse.Namespace]:
+    return {
+        'authorize': argparse.Namespace(action='authorize', configFile=None, host=server.host, port=server.port,
+                                        username=server.username, password=server.password, secure=False),
+        'request': argparse.Namespace(action='request', endpoint='/api/accessories', method='get',
+                                      requestBody='{}', parameters='{}', sessionId=session_id),
+        'setaccessorychar': argparse.Namespace(action='setaccessorychar', name=target, charSet=['Brightness', '50'],
+                                               sessionId=session_id),
+        'accessorycharvalues': argparse.Namespace(action='accessorycharvalues', name=target,
+                                                  charSet=['On', 'Brightness'], sessionId=session_id),
+        'listaccessorychars': argparse.Namespace(action='listaccessorychars', name=target, sessionId=session_id)
+    }
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        'min_ms': ordered[0] * 1000,
+        'median_ms': statistics.median(ordered) * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))] * 1000,
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'samples': len(ordered)
+    }
+
+
+def run_suite(accessories: int, latency_ms: float, iterations: int) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix='hbbench-')
+    previous_cwd = os.getcwd()
+    server = FakeHomebridge(accessory_count=accessories, latency=latency_ms / 1000).start()
+    target = f"Light {accessories // 2}"
+    results = {}
+
+    try:
+        # hbApi reads swagger.json from the working directory
+        os.chdir(workdir)
+        write_swagger(workdir)
+
+        for action in ACTIONS:
+            cold, warm = [], []
+
+            for i in range(iterations):
+                reset_process_state()
+                run_dir = tempfile.mkdtemp(dir=workdir)
+                executor = make_executor(run_dir)
+
+                if action != 'authorize':
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        session_id = executor.authorize(action_args(server, '', target)['authorize'])['sessionId']
+                    reset_process_state()
+                    executor = make_executor(run_dir)
+                else:
+                    session_id = ''
+
+                args = action_args(server, session_id, target)[action]
+                cold.append(timed(lambda: executor.processArgs(args)))
+                warm.append(timed(lambda: executor.processArgs(args)))
+
+            results[action] = {'cold': summarize(cold), 'warm': summarize(warm)}
+    finally:
+        os.chdir(previous_cwd)
+        server.stop()
+        reset_process_state()
+        shutil.rmtree(workdir)
+
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> bool:
+    """Print median ratios against a baseline report; return False on any regression."""
+    ok = True
+    print(f"{'action':<22}{'mode':<6}{'baseline ms':>13}{'current ms':>13}{'ratio':>8}")
+    for action, modes in report['results'].items():
+        for mode, stats in modes.items():
+            base = baseline.get('results', {}).get(action, {}).get(mode)
+            if base is None:
+                continue
+            ratio = stats['median_ms'] / base['median_ms'] if base['median_ms'] else float('inf')
+            flag = '  REGRESSION' if ratio > threshold else ''
+            ok = ok and ratio <= threshold
+            print(f"{action:<22}{mode:<6}{base['median_ms']:>13.2f}{stats['median_ms']:>13.2f}{ratio:>8.2f}{flag}")
+    return ok
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accessories', type=int, default=100, help='Number of fake accessories (default: 100)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Injected server latency per request in ms')
+    parser.add_argument('--iterations', type=int, default=10, help='Samples per action and mode (default: 10)')
+    parser.add_argument('-o', '--output', help='Write the JSON report to this file (default: stdout)')
+    parser.add_argument('--compare', help='Baseline JSON report to compare medians against')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Median ratio above which a comparison counts as a regression (default: 1.2)')
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'accessories': args.accessories,
+            'latency_ms': args.latency,
+            'iterations': args.iterations
+        },
+        'results': run_suite(args.accessories, args.latency, args.iterations)
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    elif not args.compare:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        return 0 if compare(report, baseline, args.threshold) else 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
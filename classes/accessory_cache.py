@@ -0,0 +1,127 @@
+import threading
+import time
+from typing import Dict, Any, Callable, Optional, List, Tuple, Union
+
+from .accessory_model import Service, Characteristic, build_services
+
+
+class AccessorySnapshot:
+    """One download of /api/accessories as model objects, with a serviceName -> services index."""
+
+    __slots__ = ('accessories', 'byName', 'fetchedAt', '_byNameAndType')
+
+    def __init__(self, accessories: List[Union[Dict[str, Any], Service]], fetchedAt: Optional[float] = None):
+        # raw payload entries are converted; already built services are used as they are
+        if accessories and not isinstance(accessories[0], Service):
+            accessories = build_services(accessories)
+        self.accessories: List[Service] = accessories
+        self.fetchedAt = time.monotonic() if fetchedAt is None else fetchedAt
+
+        byName: Dict[str, List[Service]] = {}
+        for service in accessories:
+            byName.setdefault(service.serviceName, []).append(service)
+        self.byName = byName
+        self._byNameAndType: Optional[Dict[Tuple[str, str], List[Tuple[Service, Characteristic]]]] = None
+
+    def findByName(self, name: str) -> Optional[List[Service]]:
+        """Return the services with the given serviceName, or None if there are none."""
+        services = self.byName.get(name)
+        return list(services) if services else None
+
+    def findCharacteristics(self, name: str, charType: str) -> Optional[List[Tuple[Service, Characteristic]]]:
+        """
+        Return (service, characteristic) pairs for a serviceName and characteristic type, or None.
+
+        Served from a (serviceName, type) index built on the first call, so each
+        lookup costs the same however many services and characteristics there are.
+        """
+        index = self._byNameAndType
+        if index is None:
+            index = {}
+            for service in self.accessories:
+                for characteristic in service.serviceCharacteristics:
+                    index.setdefault((service.serviceName, characteristic.type), []).append((service, characteristic))
+            self._byNameAndType = index
+
+        matches = index.get((name, charType))
+        return list(matches) if matches else None
+
+    def age(self) -> float:
+        """Seconds since the snapshot was downloaded."""
+        return time.monotonic() - self.fetchedAt
+
+
+class AccessoryCache:
+    """
+    Holds the most recent accessory snapshot for one host, valid for `ttl` seconds.
+
+    A live source (such as an AccessoryMirror) can be attached; while it
+    returns a snapshot, that snapshot is served regardless of age.
+    """
+
+    def __init__(self, ttl: float = 5.0):
+        self.ttl = ttl
+        self._snapshot: Optional[AccessorySnapshot] = None
+        self._source: Optional[Callable[[], Optional[AccessorySnapshot]]] = None
+        self._lock = threading.Lock()
+
+    def attach(self, source: Callable[[], Optional[AccessorySnapshot]]) -> None:
+        """Serve snapshots from a live source instead of downloaded ones."""
+        self._source = source
+
+    def detach(self, source: Callable[[], Optional[AccessorySnapshot]]) -> None:
+        """Stop serving from `source` if it is the attached one."""
+        if self._source == source:
+            self._source = None
+
+    def get(self, maxAge: Optional[float] = None) -> Optional[AccessorySnapshot]:
+        """Return the cached snapshot if it is younger than `maxAge` (default: the TTL)."""
+        source = self._source
+        if source is not None:
+            live = source()
+            if live is not None:
+                return live
+
+        maxAge = self.ttl if maxAge is None else maxAge
+        snapshot = self._snapshot
+        if snapshot is None or maxAge <= 0 or snapshot.age() > maxAge:
+            return None
+        return snapshot
+
+    def put(self, accessories: List[Dict[str, Any]], fetchedAt: Optional[float] = None) -> AccessorySnapshot:
+        """Index an accessory list (fresh unless `fetchedAt` says otherwise) and make it the current snapshot."""
+        snapshot = AccessorySnapshot(accessories, fetchedAt)
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def invalidate(self) -> None:
+        """Drop the current snapshot, e.g. after writing a characteristic."""
+        with self._lock:
+            self._snapshot = None
+
+
+# process-wide caches, keyed by (host, port, secure)
+_caches: Dict[Tuple[str, int, bool], AccessoryCache] = {}
+_cachesLock = threading.Lock()
+
+
+def getAccessoryCache(host: str, port: int = 8581, secure: bool = False, ttl: float = 5.0) -> AccessoryCache:
+    """Get the shared accessory cache for a host, creating it on first use."""
+    key = (host, int(port), bool(secure))
+    cache = _caches.get(key)
+
+    if cache is None:
+        with _cachesLock:
+            cache = _caches.get(key)
+            if cache is None:
+                cache = AccessoryCache(ttl)
+                _caches[key] = cache
+
+    return cache
+
+
+def clearAccessoryCaches() -> None:
+    """Forget every cached snapshot."""
+    with _cachesLock:
+        _caches.clear()
@@ -0,0 +1,273 @@
+"""
+Live in-memory mirror of Homebridge accessories.
+
+Homebridge UI pushes accessory state over socket.io (namespace `/accessories`).
+AccessoryMirror subscribes to it over a plain websocket, keeps every service
+and characteristic up to date, and plugs into the shared AccessoryCache so
+lookups through hbApi are answered from memory without any HTTP calls.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import socket
+import ssl
+import struct
+import threading
+from typing import Dict, Any, Optional, List, Tuple
+
+from .accessory_cache import AccessorySnapshot, getAccessoryCache
+from .accessory_model import Service, build_services
+
+CA_BUNDLE = "/etc/ssl/certs/ca-certificates.crt"
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class WebSocket:
+    """Minimal blocking RFC 6455 client, enough for the socket.io text protocol."""
+
+    def __init__(self, host: str, port: int, path: str, secure: bool = False, timeout: float = 10.0):
+        sock = socket.create_connection((host, port), timeout=timeout)
+        if secure:
+            cafile = CA_BUNDLE if os.path.exists(CA_BUNDLE) else None
+            sock = ssl.create_default_context(cafile=cafile).wrap_socket(sock, server_hostname=host)
+        self.sock = sock
+        self._buffer = b''
+
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = (f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+                   f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n")
+        self.sock.sendall(request.encode())
+
+        while b'\r\n\r\n' not in self._buffer:
+            self._fill()
+        head, self._buffer = self._buffer.split(b'\r\n\r\n', 1)
+        lines = head.decode('latin-1').split('\r\n')
+
+        if len(lines[0].split()) < 2 or lines[0].split()[1] != '101':
+            raise ConnectionError(f"Websocket upgrade refused: {lines[0]}")
+
+        headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(':') for l in lines[1:])}
+        expected = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        if headers.get('sec-websocket-accept') != expected:
+            raise ConnectionError("Websocket handshake failed")
+
+    def _fill(self) -> None:
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            raise ConnectionError("Websocket closed")
+        self._buffer += chunk
+
+    def _read(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            self._fill()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _send_frame(self, opcode: int, payload: bytes) -> None:
+        header = bytes([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header += bytes([0x80 | length])
+        elif length < 65536:
+            header += bytes([0x80 | 126]) + struct.pack('!H', length)
+        else:
+            header += bytes([0x80 | 127]) + struct.pack('!Q', length)
+        mask = os.urandom(4)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        self.sock.sendall(header + mask + masked)
+
+    def send(self, text: str) -> None:
+        self._send_frame(0x1, text.encode())
+
+    def recv(self) -> str:
+        """Return the next text message, answering pings along the way."""
+        message = b''
+        while True:
+            first, second = self._read(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', self._read(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', self._read(8))[0]
+            mask = self._read(4) if second & 0x80 else None
+            payload = self._read(length)
+            if mask:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+            if opcode == 0x8:
+                raise ConnectionError("Websocket closed by server")
+            if opcode == 0x9:
+                self._send_frame(0xA, payload)
+                continue
+            if opcode == 0xA:
+                continue
+
+            message += payload
+            if first & 0x80:
+                return message.decode('utf-8')
+
+    def close(self) -> None:
+        try:
+            self._send_frame(0x8, b'')
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class AccessoryMirror:
+    """
+    Keeps a live copy of all accessories for one host from socket.io push events.
+
+    Once started, the mirror is attached to the host's shared AccessoryCache,
+    so `hbApi.findAccessoriesByName` and the executor actions read from it.
+    The connection is re-established automatically if it drops.
+    """
+
+    def __init__(self, host: str, port: int = 8581, secure: bool = False,
+                 token: Optional[str] = None, namespace: str = '/accessories',
+                 reconnect_delay: float = 2.0):
+        self.host = host
+        self.port = port
+        self.secure = secure
+        self.token = token
+        self.namespace = namespace
+        self.reconnect_delay = reconnect_delay
+        self.cache = getAccessoryCache(host, port, secure)
+
+        self._services: Dict[str, Service] = {}
+        self._snapshot: Optional[AccessorySnapshot] = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._ws: Optional[WebSocket] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'AccessoryMirror':
+        """Connect in a background thread and attach to the shared cache."""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=f"AccessoryMirror-{self.host}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Disconnect and detach from the shared cache."""
+        self._stopped.set()
+        self.cache.detach(self.snapshot)
+        ws = self._ws
+        if ws is not None:
+            ws.close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the first full accessory list has been received."""
+        return self._ready.wait(timeout)
+
+    def snapshot(self) -> Optional[AccessorySnapshot]:
+        """Current accessories as an indexed snapshot, or None before the first sync."""
+        if not self._ready.is_set():
+            return None
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = AccessorySnapshot(list(self._services.values()))
+            return self._snapshot
+
+    def apply(self, services: List[Dict[str, Any]], replace: bool = False) -> None:
+        """Merge services from an `accessories-data` event into the mirror."""
+        with self._lock:
+            if replace:
+                self._services = {}
+            for service in build_services(services):
+                self._services[service.uniqueId] = service
+            self._snapshot = None
+
+    def _emit(self, event: str, *data: Any) -> None:
+        self._ws.send(f"42{self.namespace}," + json.dumps([event, *data]))
+
+    def _connect(self) -> None:
+        query = "EIO=4&transport=websocket"
+        if self.token:
+            query += "&token=" + self.token
+        self._ws = WebSocket(self.host, self.port, "/socket.io/?" + query, self.secure)
+
+        # engine.io open packet, then join the namespace
+        packet = self._ws.recv()
+        if not packet.startswith('0'):
+            raise ConnectionError("Unexpected engine.io handshake")
+
+        # the server pings every pingInterval, so silence beyond that means the link is dead
+        handshake = json.loads(packet[1:])
+        self._ws.sock.settimeout((handshake.get('pingInterval', 25000) + handshake.get('pingTimeout', 20000)) / 1000)
+        self._ws.send(f"40{self.namespace}," + json.dumps({'token': self.token}))
+
+    def _handle(self, packet: str, synced: List[bool]) -> None:
+        if packet == '2':
+            self._ws.send('3')
+            return
+
+        prefix = f"4{{}}{self.namespace},"
+        if packet.startswith(prefix.format(0)):
+            # namespace joined: ask for the full list
+            self._emit('get-accessories')
+        elif packet.startswith(prefix.format(4)):
+            raise ConnectionError("Namespace connection refused: " + packet[len(prefix.format(4)):])
+        elif packet.startswith(prefix.format(2)):
+            event = json.loads(packet[len(prefix.format(2)):])
+            if event[0] == 'accessories-data':
+                # the first message after (re)connecting is the full list
+                self.apply(event[1], replace=not synced[0])
+                if not synced[0]:
+                    synced[0] = True
+                    self._ready.set()
+                    self.cache.attach(self.snapshot)
+            elif event[0] == 'accessories-reload-required':
+                synced[0] = False
+                self._emit('get-accessories')
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            synced = [False]
+            try:
+                self._connect()
+                while not self._stopped.is_set():
+                    self._handle(self._ws.recv(), synced)
+            except Exception:
+                pass
+            finally:
+                if self._ws is not None:
+                    self._ws.close()
+
+            # serve from the network again until the mirror has resynchronised
+            self._ready.clear()
+            self.cache.detach(self.snapshot)
+            self._stopped.wait(self.reconnect_delay)
+
+
+# process-wide mirrors, keyed by (host, port, secure)
+_mirrors: Dict[Tuple[str, int, bool], AccessoryMirror] = {}
+_mirrorsLock = threading.Lock()
+
+
+def ensureMirror(host: str, port: int = 8581, secure: bool = False, token: Optional[str] = None) -> AccessoryMirror:
+    """Start the mirror for a host if it is not already running, and return it."""
+    key = (host, int(port), bool(secure))
+    with _mirrorsLock:
+        mirror = _mirrors.get(key)
+        if mirror is None:
+            mirror = AccessoryMirror(host, port, secure, token).start()
+            _mirrors[key] = mirror
+        elif token:
+            mirror.token = token
+        return mirror
+
+
+def stopMirrors() -> None:
+    """Stop every running mirror."""
+    with _mirrorsLock:
+        mirrors = list(_mirrors.values())
+        _mirrors.clear()
+    for mirror in mirrors:
+        mirror.stop()
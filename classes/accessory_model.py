@@ -0,0 +1,187 @@
+"""
+Compact in-memory model of the Homebridge UI /api/accessories payload.
+
+Each entry of the payload is a service; services that share an `aid` on the
+same bridge belong to one accessory, which holds the accessory information
+and bridge instance they have in common. All objects use __slots__, and the
+strings that repeat across hundreds of services (characteristic types,
+formats, service names, permissions) are interned, so a large home costs a
+fraction of the memory of the parsed JSON.
+
+The objects also support read-only dict-style access with the payload's
+keys (`service['serviceCharacteristics']`, `characteristic['value']`), so
+code written against the raw payload keeps working.
+"""
+
+import json
+from sys import intern
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+def _intern(value: Any) -> Any:
+    return intern(value) if type(value) is str else value
+
+
+class _Record:
+    """Read-only dict-style access to a slotted model object."""
+
+    __slots__ = ()
+
+    # payload keys stored as attributes of the same name
+    _fields: Tuple[str, ...] = ()
+
+    def _lookup(self, key: str) -> Any:
+        if key in self._fields:
+            return getattr(self, key)
+        extra = self.extra
+        if extra is not None and key in extra:
+            return extra[key]
+        raise KeyError(key)
+
+    def __getitem__(self, key: str) -> Any:
+        return self._lookup(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self._lookup(key)
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self._lookup(key)
+            return True
+        except KeyError:
+            return False
+
+    def keys(self) -> List[str]:
+        return list(self._fields) + list(self.extra or ())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+
+class Characteristic(_Record):
+    """One characteristic of a service."""
+
+    _fields = ('aid', 'iid', 'uuid', 'type', 'serviceType', 'serviceName', 'description',
+               'value', 'format', 'perms', 'canRead', 'canWrite', 'ev')
+
+    __slots__ = _fields + ('extra',)
+
+    def __init__(self, data: Dict[str, Any]):
+        self.aid = data.get('aid')
+        self.iid = data.get('iid')
+        self.uuid = _intern(data.get('uuid'))
+        self.type = _intern(data.get('type'))
+        self.serviceType = _intern(data.get('serviceType'))
+        self.serviceName = _intern(data.get('serviceName'))
+        self.description = _intern(data.get('description'))
+        self.value = data.get('value')
+        self.format = _intern(data.get('format'))
+        perms = data.get('perms')
+        self.perms = tuple(_intern(p) for p in perms) if perms is not None else None
+        self.canRead = data.get('canRead')
+        self.canWrite = data.get('canWrite')
+        self.ev = data.get('ev')
+        self.extra = {intern(k): v for k, v in data.items() if k not in self._fields} or None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {key: getattr(self, key) for key in self._fields}
+        if self.perms is not None:
+            data['perms'] = list(self.perms)
+        data.update(self.extra or {})
+        return data
+
+
+class Accessory:
+    """The parts of a set of services that belong to the accessory rather than to each service."""
+
+    __slots__ = ('aid', 'information', 'instance', 'services')
+
+    def __init__(self, aid: Any, information: Optional[Dict[str, Any]], instance: Optional[Dict[str, Any]]):
+        self.aid = aid
+        self.information = information
+        self.instance = instance
+        self.services: List['Service'] = []
+
+
+class Service(_Record):
+    """One entry of the /api/accessories payload."""
+
+    _fields = ('iid', 'uuid', 'type', 'humanType', 'serviceName', 'uniqueId', 'serviceCharacteristics')
+
+    __slots__ = _fields + ('accessory', 'extra')
+
+    # payload keys served from the accessory or derived from the characteristics
+    _derived = ('aid', 'accessoryInformation', 'instance', 'values')
+
+    def __init__(self, data: Dict[str, Any], accessory: Accessory):
+        self.accessory = accessory
+        self.iid = data.get('iid')
+        self.uuid = _intern(data.get('uuid'))
+        self.type = _intern(data.get('type'))
+        self.humanType = _intern(data.get('humanType'))
+        self.serviceName = _intern(data.get('serviceName'))
+        self.uniqueId = data.get('uniqueId')
+        self.serviceCharacteristics = tuple(Characteristic(c) for c in data.get('serviceCharacteristics') or ())
+        self.extra = {intern(k): v for k, v in data.items()
+                      if k not in self._fields and k not in self._derived} or None
+
+    def _lookup(self, key: str) -> Any:
+        if key == 'aid':
+            return self.accessory.aid
+        if key == 'accessoryInformation':
+            return self.accessory.information
+        if key == 'instance':
+            return self.accessory.instance
+        if key == 'values':
+            return self.values
+        return super()._lookup(key)
+
+    @property
+    def values(self) -> Dict[str, Any]:
+        """Characteristic type -> current value, as in the payload's `values`."""
+        return {c.type: c.value for c in self.serviceCharacteristics}
+
+    def keys(self) -> List[str]:
+        return list(self._fields) + list(self._derived) + list(self.extra or ())
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {key: self._lookup(key) for key in self.keys()}
+        data['serviceCharacteristics'] = [c.to_dict() for c in self.serviceCharacteristics]
+        return data
+
+
+def _shared(value: Any, pool: Dict[str, Any]) -> Any:
+    # identical nested objects (e.g. the bridge instance) are kept once
+    if not isinstance(value, dict):
+        return value
+    key = json.dumps(value, sort_keys=True)
+    shared = pool.get(key)
+    if shared is None:
+        shared = {intern(k): _intern(v) for k, v in value.items()}
+        pool[key] = shared
+    return shared
+
+
+def build_services(payload: List[Dict[str, Any]]) -> List[Service]:
+    """Build the model for an /api/accessories payload (or part of one), in payload order."""
+    accessories: Dict[Tuple[Any, Any], Accessory] = {}
+    pool: Dict[str, Any] = {}
+    services = []
+
+    for data in payload:
+        instance = _shared(data.get('instance'), pool)
+        key = ((instance or {}).get('username'), data.get('aid'))
+
+        accessory = accessories.get(key)
+        if accessory is None:
+            accessory = Accessory(data.get('aid'), _shared(data.get('accessoryInformation'), pool), instance)
+            accessories[key] = accessory
+
+        service = Service(data, accessory)
+        accessory.services.append(service)
+        services.append(service)
+
+    return services
@@ -0,0 +1,371 @@
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Any, Optional, List
+
+from .auth_providers import StorageProvider, UserSessionProvider
+from .concrete_providers import (
+    FileStorageProvider,
+    FileUserSessionProvider,
+    generate_session_id,
+    token_expires_at
+)
+from .async_hb_api import AsyncHbApi
+from .file_lock import FileLock
+
+
+class AsyncCliExecutor:
+    """
+    asyncio variant of cliExecutor.
+
+    Actions are coroutines that take the same argparse-style arguments as the
+    blocking executor. Loaded sessions keep their AsyncHbApi client, so any
+    number of actions against one or more sessions can run concurrently in a
+    single event loop (see `run`).
+    """
+
+    def __init__(self,
+                 storage_provider: Optional[StorageProvider] = None,
+                 user_session_provider: Optional[UserSessionProvider] = None,
+                 spec_path: str = "swagger.json",
+                 pool_size: int = 10,
+                 token_expiry_margin: float = 60.0,
+                 lock_dir: Optional[str] = None,
+                 login_lock_timeout: float = 30.0):
+        """
+        Initialize the async executor with pluggable providers.
+
+        Args:
+            storage_provider: Provider for session storage
+            user_session_provider: Provider for user-to-session mappings
+            spec_path: Path to the Homebridge UI swagger definition
+            pool_size: Maximum concurrent connections per session client
+            token_expiry_margin: Seconds before token expiry at which the
+                token is re-checked against the server instead of trusted locally
+            lock_dir: Directory for the per-user@host login lock files
+                (default: the user session provider's directory, or .authStore)
+            login_lock_timeout: Seconds to wait for another process's login
+                before logging in regardless
+        """
+        self.storage_provider = storage_provider or FileStorageProvider()
+        self.user_session_provider = user_session_provider or FileUserSessionProvider()
+        self.spec_path = spec_path
+        self.pool_size = pool_size
+        self.token_expiry_margin = token_expiry_margin
+        self.lock_dir = lock_dir or getattr(self.user_session_provider, 'base_dir', '.authStore')
+        self.login_lock_timeout = login_lock_timeout
+        self._clients: Dict[str, AsyncHbApi] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    async def processArgs(self, args):
+        """Entry point which awaits the requested action."""
+        actionMethod = getattr(self, args.action, None)
+        if actionMethod is None:
+            return "Invalid Action"
+        return await actionMethod(args)
+
+    async def run(self, argsList: List[Any]) -> List[Any]:
+        """Run several actions concurrently and return their results in order."""
+        return await asyncio.gather(*(self.processArgs(args) for args in argsList))
+
+    async def authorize(self, args):
+        """Process authorization request and maintain sessions per user/host."""
+        try:
+            if args.configFile is None:
+                config = {
+                    'host': args.host,
+                    'port': args.port,
+                    'username': args.username,
+                    'password': args.password,
+                    'secure': getattr(args, 'secure', False)
+                }
+            else:
+                with open(args.configFile, "r") as f:
+                    config = json.loads(f.read())
+
+            if config.get('host') is None:
+                raise Exception("Host required for Authorization request")
+
+            if config.get('username') is None:
+                raise Exception("Username required for Authorization request")
+
+            if config.get('password') is None:
+                raise Exception("Password required for Authorization request")
+
+            port = config.get('port') or 8581
+            secure = config.get('secure') or False
+
+            # Reuse the stored session for this user@host while the server still accepts its token
+            session_id = await self._valid_session(config['username'], config['host'])
+
+            if session_id is None:
+                # Only one process logs in per user@host; the others wait here and reuse its token
+                lock = FileLock(os.path.join(self.lock_dir, f"{config['username']}@{config['host']}.lock"),
+                                self.login_lock_timeout)
+                await self._acquire(lock)
+                try:
+                    session_id = await self._valid_session(config['username'], config['host'])
+                    if session_id is None:
+                        session_id = await self._login(config, port, secure)
+                finally:
+                    lock.release()
+
+            result = {'sessionId': session_id}
+            print(json.dumps(result))
+            return result
+
+        except Exception as inst:
+            print(inst)
+
+    async def _acquire(self, lock: FileLock) -> bool:
+        """Take a file lock within its timeout, waiting on the event loop rather than in a worker thread."""
+        give_up_at = time.monotonic() + lock.timeout
+        while not lock.acquire(timeout=0):
+            if time.monotonic() >= give_up_at:
+                return False
+            await asyncio.sleep(lock.poll_interval)
+        return True
+
+    async def _valid_session(self, username: str, host: str) -> Optional[str]:
+        """
+        Return the stored session ID for user@host if the server still accepts its token.
+
+        The token is checked over the network even if it has not expired, so a
+        token revoked on the server is replaced instead of handed out again.
+        """
+        session_id = self.user_session_provider.get_session_id(username, host)
+
+        if session_id and self.storage_provider.session_exists(session_id):
+            hb = await self.loadSession(session_id)
+            if hb is not None:
+                auth_check = await hb.apiRequest("/api/auth/check", "get")
+                if auth_check['status_code'] == 200:
+                    return session_id
+
+        return None
+
+    async def _login(self, config: Dict[str, Any], port: int, secure: bool) -> str:
+        """Authenticate and store the new token, keeping the user's session ID if there is one."""
+        session_id = self.user_session_provider.get_session_id(config['username'], config['host'])
+        if not session_id:
+            session_id = generate_session_id()
+
+        hb = AsyncHbApi(config['host'], port, secure, specPath=self.spec_path, poolSize=self.pool_size)
+        await hb.authorize(config['username'], config['password'])
+
+        if not hb.authorization or hb.authorization['status_code'] != 201:
+            await hb.close()
+            raise Exception('Authorization failure')
+
+        hb.authorization['secure'] = secure
+
+        if not self.storage_provider.save_session(session_id, hb.authorization):
+            raise Exception('Failed to save session')
+
+        if not self.user_session_provider.set_session_id(config['username'], config['host'], session_id):
+            raise Exception('Failed to save user session mapping')
+
+        await self._replace_client(session_id, hb)
+        return session_id
+
+    async def request(self, args):
+        """Process a direct API request."""
+        try:
+            hb = await self.loadSession(args.sessionId)
+            if hb is None:
+                raise Exception('Session load failed')
+
+            request_body = json.loads(args.requestBody) if args.requestBody else {}
+            parameters = json.loads(args.parameters) if args.parameters else {}
+
+            request_result = await hb.apiRequest(args.endpoint, args.method, requestBody=request_body, parameters=parameters)
+
+            if args.method != 'get':
+                hb.invalidateAccessories()
+
+            if request_result['status_code'] != 200:
+                error_msg = f"HTTP Status {request_result['status_code']}"
+                if 'body' in request_result and 'error' in request_result['body']:
+                    error_msg += f" {request_result['body']['error']}: {request_result['body']['message']}"
+                raise Exception(error_msg)
+
+            print(json.dumps(request_result))
+            return request_result
+
+        except Exception as inst:
+            print(inst)
+
+    async def setaccessorychar(self, args):
+        """Set the characteristics of an accessory."""
+        try:
+            formatted_char_val = int(args.charSet[1]) if args.charSet[1].isnumeric() else args.charSet[1]
+
+            char_data = {
+                'characteristicType': args.charSet[0],
+                'value': formatted_char_val
+            }
+
+            hb = await self.loadSession(args.sessionId)
+            if hb is None:
+                raise Exception('Session load failed')
+
+            found = await hb.findCharacteristics(args.name, [args.charSet[0]])
+
+            if found is None:
+                raise Exception("No accessories found")
+
+            matches = found[args.charSet[0]]
+            if matches:
+                set_result = await hb.apiRequest(
+                    '/api/accessories/{uniqueId}',
+                    'put',
+                    requestBody=char_data,
+                    parameters={'uniqueId': matches[0][0].uniqueId}
+                )
+
+                # The cached snapshot no longer reflects this accessory
+                hb.invalidateAccessories()
+
+                if set_result['status_code'] != 200:
+                    error_msg = f"HTTP Status {set_result['status_code']}"
+                    if 'body' in set_result and 'error' in set_result['body']:
+                        error_msg += f" {set_result['body']['error']}: {set_result['body']['message']}"
+                    print(error_msg)
+                    return None
+
+                print(json.dumps(set_result))
+                return set_result
+
+        except Exception as inst:
+            print(inst)
+
+    async def accessorycharvalues(self, args):
+        """Get accessory characteristic values."""
+        try:
+            hb = await self.loadSession(args.sessionId)
+            if hb is None:
+                raise Exception('Session load failed')
+
+            found = await hb.findCharacteristics(args.name, args.charSet)
+
+            if found is not None:
+                results = {char_type: matches[-1][1].value for char_type, matches in found.items() if matches}
+
+                print(json.dumps(results))
+                return results
+
+        except Exception as inst:
+            print(inst)
+
+    async def listaccessorychars(self, args):
+        """List accessory characteristics."""
+        try:
+            hb = await self.loadSession(args.sessionId)
+            if hb is None:
+                raise Exception('Session load failed')
+
+            find_accessories = await hb.findAccessoriesByName(args.name)
+
+            if find_accessories is None:
+                raise Exception("No accessories found")
+
+            results = {}
+            lines = ["\tCharacteristic\tValue\tRead\tWrite\n"]
+            for accessory in find_accessories:
+                lines.append(accessory.serviceName)
+                for characteristic in accessory.serviceCharacteristics:
+                    lines.append(f"\t{characteristic.type}\t{characteristic.value}\t{characteristic.canRead}\t{characteristic.canWrite}")
+                    results[characteristic.type] = characteristic.value
+
+            # Print the table in one go so concurrent actions don't interleave rows
+            print("\n".join(lines))
+            return results
+
+        except Exception as inst:
+            print(inst)
+
+    async def loadSession(self, session_id: str) -> Optional[AsyncHbApi]:
+        """
+        Load a session and return its client, or None if it is missing or expired.
+
+        The auth check runs once per session; concurrent callers share it and
+        later callers reuse the loaded client.
+        """
+        hb = self._clients.get(session_id)
+        if hb is not None and not hb.authRejected:
+            return hb
+
+        # The server refused the cached client's token, so load the session afresh
+        if hb is not None:
+            self._clients.pop(session_id, None)
+            await hb.close()
+
+        pending = self._loading.get(session_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load_client(session_id))
+            self._loading[session_id] = pending
+            pending.add_done_callback(lambda _: self._loading.pop(session_id, None))
+
+        return await asyncio.shield(pending)
+
+    async def close(self):
+        """Stop the worker threads of every loaded session's client; pooled connections stay open for reuse."""
+        clients, self._clients = self._clients, {}
+        for hb in clients.values():
+            await hb.close()
+
+    async def _replace_client(self, session_id: str, hb: AsyncHbApi) -> None:
+        previous = self._clients.get(session_id)
+        self._clients[session_id] = hb
+        if previous is not None and previous is not hb:
+            await previous.close()
+
+    async def _load_client(self, session_id: str) -> Optional[AsyncHbApi]:
+        try:
+            session_data = self.storage_provider.load_session(session_id)
+            if not session_data:
+                print("Session ID not found")
+                return None
+
+            hb = AsyncHbApi(
+                session_data.get('host'),
+                session_data.get('port', 8581),
+                session_data.get('secure', False),
+                specPath=self.spec_path,
+                poolSize=self.pool_size
+            )
+            hb.authorization = session_data
+
+            # Trust the token's own expiry unless it is unknown or close
+            expires_at = token_expires_at(session_data)
+            remaining = None if expires_at is None else expires_at - time.time()
+
+            if remaining is None or 0 < remaining <= self.token_expiry_margin:
+                auth_check = await hb.apiRequest("/api/auth/check", "get")
+                valid = auth_check['status_code'] == 200
+            else:
+                valid = remaining > 0
+
+            if not valid:
+                await hb.close()
+                print("Authorization is no longer valid")
+                return None
+
+            self._clients[session_id] = hb
+            return hb
+
+        except Exception as e:
+            print(f"Error loading session: {e}")
+            return None
+
+
+def create_async_executor(storage_provider: StorageProvider = None,
+                          user_session_provider: UserSessionProvider = None,
+                          **kwargs) -> AsyncCliExecutor:
+    """Create an AsyncCliExecutor, defaulting to file-based providers."""
+    return AsyncCliExecutor(
+        storage_provider=storage_provider,
+        user_session_provider=user_session_provider,
+        **kwargs
+    )
@@ -0,0 +1,84 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from . import hbApi
+
+
+def _forward(name):
+    # read and write an attribute of the wrapped hbApi client
+    return property(lambda self: getattr(self.client, name),
+                    lambda self, value: setattr(self.client, name, value))
+
+
+class AsyncHbApi:
+    """
+    asyncio counterpart of hbApi.
+
+    Each call runs the blocking hbApi client on the client's own pool of
+    `poolSize` worker threads, so both share one request path: the pooled
+    keep-alive session, retries, the circuit breaker, GET coalescing and
+    timings. Up to `poolSize` requests are in flight at once from a single
+    event loop, whatever the size of the loop's default executor.
+    """
+    host = _forward('host')
+    port = _forward('port')
+    secure = _forward('secure')
+    authorization = _forward('authorization')
+    authRejected = _forward('authRejected')
+    deadline = _forward('deadline')
+    accessoryCache = _forward('accessoryCache')
+    accessoryCacheTtl = _forward('accessoryCacheTtl')
+    spec = _forward('spec')
+    apiJsonDef = _forward('apiJsonDef')
+
+    def __init__(self,host,port=8581,secure=False,specPath="swagger.json",poolSize=10,accessoryCacheTtl=5.0,timeout=30.0,retryPolicy=None,coalesce=True,connectTimeout=5.0,breakerStateDir=None):
+        self.client = hbApi.hbApi(host, port, secure, specPath=specPath, poolSize=poolSize,
+                                  accessoryCacheTtl=accessoryCacheTtl, connectTimeout=connectTimeout,
+                                  readTimeout=timeout, retryPolicy=retryPolicy, coalesce=coalesce,
+                                  breakerStateDir=breakerStateDir)
+        self.poolSize = poolSize
+        self._workers = None
+
+    # run a blocking client call on one of the client's worker threads
+    async def _run(self, fn, *args):
+        if self._workers is None:
+            self._workers = ThreadPoolExecutor(max_workers=self.poolSize, thread_name_prefix="AsyncHbApi")
+
+        return await asyncio.get_running_loop().run_in_executor(self._workers, functools.partial(fn, *args))
+
+    # apiRequest method to handle and validate all requests to an endpoint, within the optional (or client's) deadline
+    async def apiRequest(self, path, method, requestBody={}, parameters={}, deadline=None):
+        return await self._run(self.client.apiRequest, path, method, requestBody, parameters, deadline)
+
+    # authorization
+    async def authorize(self,username,password,otp=""):
+        await self._run(self.client.authorize, username, password, otp)
+
+    # get the accessory snapshot, downloading /api/accessories only when the cached one is older than maxAge (default: accessoryCacheTtl)
+    async def getAccessorySnapshot(self, maxAge=None):
+        return await self._run(self.client.getAccessorySnapshot, maxAge)
+
+    # drop the cached accessory snapshot, call after writing to an accessory
+    def invalidateAccessories(self):
+        self.client.invalidateAccessories()
+
+    #helper method to find uniqueId for an accessory based on the serviceName
+    async def findAccessoriesByName(self, name, maxAge=None):
+        return await self._run(self.client.findAccessoriesByName, name, maxAge)
+
+    # find characteristics of the services with a serviceName by type, None if no service has that name
+    async def findCharacteristics(self, name, charTypes, maxAge=None):
+        return await self._run(self.client.findCharacteristics, name, charTypes, maxAge)
+
+    # stop the client's worker threads once their calls finish; connections stay in the pool shared with hbApi
+    async def close(self):
+        workers, self._workers = self._workers, None
+        if workers is not None:
+            await asyncio.get_running_loop().run_in_executor(None, workers.shutdown)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 
 class AuthProvider(ABC):
     """Abstract base class for authentication providers."""
@@ -37,6 +37,18 @@ class AuthProvider(ABC):
         """
         pass
     
+    def verify(self) -> bool:
+        """
+        Check the token with the server rather than trusting what is known locally.
+        
+        Used before handing out a stored session in place of logging in.
+        Defaults to `is_valid`.
+        
+        Returns:
+            True if token is valid, False otherwise
+        """
+        return self.is_valid()
+    
     @abstractmethod
     def refresh_token(self) -> bool:
         """
@@ -160,3 +172,15 @@ class UserSessionProvider(ABC):
             True if successful, False otherwise
         """
         pass
+    
+    def list_user_sessions(self) -> List[Tuple[str, str, str]]:
+        """
+        List all user-to-session mappings.
+        
+        Not abstract so existing providers keep working; providers that
+        can enumerate their mappings should override it.
+        
+        Returns:
+            List of (username, host, session_id) tuples
+        """
+        return []
@@ -1,14 +1,36 @@
+import io
+import os
+import sys
 import json
-from typing import Dict, Any, Optional
+import argparse
+import time
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List
 
 from .auth_providers import AuthProvider, StorageProvider, UserSessionProvider
 from .concrete_providers import (
     HomebridgeAuthProvider, 
     FileStorageProvider, 
     FileUserSessionProvider,
-    generate_session_id
+    generate_session_id,
+    token_expires_at
 )
 from . import hbApi
+from .accessory_mirror import ensureMirror
+from .timings import TimingRecorder
+from .deadline import Deadline, parse_duration
+from .resilience import RetryPolicy
+from .file_lock import FileLock
+from .command_spec import DEFAULT_SPEC_PATH, load_command_spec, action_options
+from .resolution_cache import DEFAULT_CACHE_DIR, ResolutionCache, getResolutionCache, host_cache_path
+from .snapshot_store import SnapshotStore
+from .snapshot_refresh import refresh_snapshot, spawn_refresh
+
+# actions that can be run across several sessions at once, or as commands of a batch
+FANOUT_ACTIONS = ('request', 'setaccessorychar', 'accessorycharvalues', 'listaccessorychars')
+BATCH_ACTIONS = FANOUT_ACTIONS
 
 
 class cliExecutor:
@@ -22,7 +44,21 @@ class cliExecutor:
     def __init__(self, 
                  auth_provider: Optional[AuthProvider] = None,
                  storage_provider: Optional[StorageProvider] = None,
-                 user_session_provider: Optional[UserSessionProvider] = None):
+                 user_session_provider: Optional[UserSessionProvider] = None,
+                 token_expiry_margin: float = 60.0,
+                 live_mirror: bool = False,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 lock_dir: Optional[str] = None,
+                 login_lock_timeout: float = 30.0,
+                 resolution_cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 snapshot_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 max_stale: float = 0.0,
+                 accessory_cache_ttl: float = 5.0,
+                 spec_path: str = "swagger.json",
+                 breaker_state_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 detach_refresh: bool = False):
         """
         Initialize the CLI executor with pluggable providers.
         
@@ -30,6 +66,34 @@ class cliExecutor:
             auth_provider: Provider for authentication logic
             storage_provider: Provider for session storage
             user_session_provider: Provider for user-to-session mappings
+            token_expiry_margin: Seconds before token expiry at which the
+                token is re-checked against the server instead of trusted locally
+            live_mirror: Keep a live socket.io mirror of each host's accessories
+                so lookups are served from memory (for long-running processes)
+            connect_timeout: Seconds to wait for a connection to Homebridge
+            read_timeout: Seconds to wait for Homebridge to respond
+            retry_policy: Retries for transient failures of idempotent
+                requests (default: up to 3 attempts with jittered backoff)
+            lock_dir: Directory for the per-user@host login lock files
+                (default: the user session provider's directory, or .authStore)
+            login_lock_timeout: Seconds to wait for another process's login
+                before logging in regardless
+            resolution_cache_dir: Directory for the on-disk name -> uniqueId
+                cache that lets setaccessorychar skip the accessory list
+                (None disables it)
+            snapshot_dir: Directory where the last accessory list of each host
+                is kept between invocations (None disables it)
+            max_stale: Seconds old a snapshot may be for accessorycharvalues and
+                listaccessorychars to answer from it while it is refreshed in
+                the background (0 always reads fresh; --max-stale overrides)
+            accessory_cache_ttl: Seconds a downloaded accessory list is reused
+                by later lookups in this process (0 disables the cache)
+            spec_path: Path to the Homebridge UI swagger definition
+            breaker_state_dir: Directory where each host's circuit breaker
+                state is shared between invocations (None keeps it per process)
+            detach_refresh: Refresh stale snapshots in a detached child process
+                instead of a background thread, so a one-shot CLI process can
+                exit as soon as it has answered
         """
         # Use default file-based providers if none specified (backward compatibility)
         self.storage_provider = storage_provider or FileStorageProvider()
@@ -37,12 +101,56 @@ class cliExecutor:
         
         # Auth provider will be created per-request since it needs host/port info
         self._auth_provider = auth_provider
+        self.token_expiry_margin = token_expiry_margin
+        self.live_mirror = live_mirror
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retry_policy = retry_policy
+        self.lock_dir = lock_dir or getattr(self.user_session_provider, 'base_dir', '.authStore')
+        self.login_lock_timeout = login_lock_timeout
+        self.resolution_cache_dir = resolution_cache_dir
+        self.snapshot_dir = snapshot_dir
+        self.max_stale = max_stale
+        self.accessory_cache_ttl = accessory_cache_ttl
+        self.spec_path = spec_path
+        self.breaker_state_dir = breaker_state_dir
+        self.detach_refresh = detach_refresh
+        self.deadline = None
         self.hb = None
+        # streams the actions print to; None means whatever sys.stdout/sys.stderr is at the time
+        self.out = None
+        self.err = None
+        # parsed commands.json, loaded on first use unless set by the caller
+        self.command_list = None
+        # session a batch runs on; loadSession keeps using the loaded client for it
+        self._pinned_session = None
+        # set when a read served an aging snapshot; the action ends by refreshing it
+        self._revalidate = False
+        self._refresh_thread = None
+        self._refresh_process = None
     
     def processArgs(self, args):
         """Entry point from the main class which calls the actions."""
         actionMethod = getattr(self, args.action, lambda: "Invalid Action")
-        actionMethod(args)
+        
+        # The deadline covers every request the action makes, from loading the session on
+        try:
+            self.deadline = Deadline.parse(getattr(args, 'deadline', None))
+        except ValueError as inst:
+            print(inst, file=self.out)
+            return
+        
+        # Several sessions or hosts given: run the action for each of them in parallel
+        if getattr(args, 'sessionIds', None) or getattr(args, 'hosts', None):
+            actionMethod = self.fanout
+        
+        if getattr(args, 'timings', False):
+            # Report where each request spent its time once the action is done
+            with TimingRecorder() as recorder:
+                actionMethod(args)
+            recorder.summary(self.err)
+        else:
+            actionMethod(args)
     
     def authorize(self, args):
         """Process authorization request and maintain sessions per user/host."""
@@ -76,63 +184,90 @@ class cliExecutor:
             
             # Create or use provided auth provider
             if self._auth_provider is None:
-                auth_provider = HomebridgeAuthProvider(config['host'], port, secure)
+                auth_provider = HomebridgeAuthProvider(config['host'], port, secure, self.token_expiry_margin, self.spec_path,
+                                                       self.connect_timeout, self.read_timeout)
             else:
                 auth_provider = self._auth_provider
             
-            # Check if we have an existing session for this user@host
-            existing_session_id = self.user_session_provider.get_session_id(
-                config['username'], config['host']
-            )
-            
-            session_id = existing_session_id
-            auth_data = None
+            # The login request only gets whatever is left of the command's deadline
+            if hasattr(auth_provider, 'deadline'):
+                auth_provider.deadline = self.deadline
             
-            # Try to load existing session
-            if session_id and self.storage_provider.session_exists(session_id):
-                auth_data = self.storage_provider.load_session(session_id)
-                if auth_data:
-                    auth_provider.set_token(auth_data)
-                    
-                    # Check if the existing token is still valid
-                    if auth_provider.is_valid():
-                        result = {'sessionId': session_id}
-                        print(json.dumps(result))
-                        return result
-            
-            # Generate new session ID if needed
-            if not session_id:
-                session_id = generate_session_id()
+            # Reuse the stored session for this user@host while the server still accepts its token
+            session_id = self._valid_session(auth_provider, config['username'], config['host'])
             
-            # Perform authentication
-            credentials = {
-                'username': config['username'],
-                'password': config['password']
-            }
-            
-            auth_result = auth_provider.authenticate(credentials)
-            
-            if auth_result.get('status_code') != 201:
-                raise Exception('Authorization failure')
-            
-            # Save the session
-            if not self.storage_provider.save_session(session_id, auth_result):
-                raise Exception('Failed to save session')
-            
-            # Update user-to-session mapping
-            if not self.user_session_provider.set_session_id(
-                config['username'], config['host'], session_id
-            ):
-                raise Exception('Failed to save user session mapping')
+            if session_id is None:
+                # Only one process logs in per user@host; the others wait here and reuse its token
+                timeout = self.login_lock_timeout
+                if self.deadline is not None:
+                    timeout = min(timeout, self.deadline.remaining())
+                
+                lock_path = os.path.join(self.lock_dir, f"{config['username']}@{config['host']}.lock")
+                with FileLock(lock_path, timeout):
+                    session_id = self._valid_session(auth_provider, config['username'], config['host'])
+                    if session_id is None:
+                        session_id = self._login(auth_provider, config)
             
             result = {'sessionId': session_id}
-            print(json.dumps(result))
+            print(json.dumps(result), file=self.out)
             return result
             
         except Exception as inst:
-            print(inst)
+            print(inst, file=self.out)
         except:
-            print("Unknown error processing authorization")
+            print("Unknown error processing authorization", file=self.out)
+    
+    def _valid_session(self, auth_provider: AuthProvider, username: str, host: str) -> Optional[str]:
+        """
+        Return the stored session ID for user@host if the server still accepts its token.
+        
+        The token is checked over the network even if it has not expired, so a
+        token revoked on the server is replaced instead of handed out again.
+        """
+        session_id = self.user_session_provider.get_session_id(username, host)
+        
+        if session_id and self.storage_provider.session_exists(session_id):
+            auth_data = self.storage_provider.load_session(session_id)
+            if auth_data:
+                auth_provider.set_token(auth_data)
+                if getattr(auth_provider, 'hb_api', None) is not None:
+                    auth_provider.hb_api.deadline = self.deadline
+                
+                if auth_provider.verify():
+                    return session_id
+        
+        return None
+    
+    def _login(self, auth_provider: AuthProvider, config: Dict[str, Any]) -> str:
+        """Authenticate and store the new token, keeping the user's session ID if there is one."""
+        session_id = self.user_session_provider.get_session_id(config['username'], config['host'])
+        
+        # Generate new session ID if needed
+        if not session_id:
+            session_id = generate_session_id()
+        
+        # Perform authentication
+        credentials = {
+            'username': config['username'],
+            'password': config['password']
+        }
+        
+        auth_result = auth_provider.authenticate(credentials)
+        
+        if auth_result.get('status_code') != 201:
+            raise Exception('Authorization failure')
+        
+        # Save the session
+        if not self.storage_provider.save_session(session_id, auth_result):
+            raise Exception('Failed to save session')
+        
+        # Update user-to-session mapping
+        if not self.user_session_provider.set_session_id(
+            config['username'], config['host'], session_id
+        ):
+            raise Exception('Failed to save user session mapping')
+        
+        return session_id
     
     def request(self, args):
         """Process a direct API request."""
@@ -150,16 +285,20 @@ class cliExecutor:
                 parameters=parameters
             )
             
+            if args.method != 'get':
+                self._invalidate_accessories()
+            
             if request_result['status_code'] != 200:
                 error_msg = f"HTTP Status {request_result['status_code']}"
                 if 'body' in request_result and 'error' in request_result['body']:
                     error_msg += f" {request_result['body']['error']}: {request_result['body']['message']}"
                 raise Exception(error_msg)
             
-            print(json.dumps(request_result))
+            print(json.dumps(request_result), file=self.out)
+            return request_result
             
         except Exception as inst:
-            print(inst)
+            print(inst, file=self.out)
     
     def setaccessorychar(self, args):
         """Set the characteristics of an accessory."""
@@ -175,38 +314,76 @@ class cliExecutor:
             if not self.loadSession(args.sessionId):
                 raise Exception('Session load failed')
             
-            find_accessories = self.hb.findAccessoriesByName(args.name)
+            char_type = args.charSet[0]
+            resolutions = self._resolution_cache()
+            unique_id = None
             
-            if find_accessories is not None:
-                for accessory in find_accessories:
-                    for characteristic in accessory['serviceCharacteristics']:
-                        if characteristic['type'] == args.charSet[0]:
-                            parameters = {'uniqueId': accessory['uniqueId']}
-                            
-                            set_result = self.hb.apiRequest(
-                                '/api/accessories/{uniqueId}', 
-                                'put', 
-                                requestBody=char_data, 
-                                parameters=parameters
-                            )
-                            
-                            if set_result['status_code'] != 200:
-                                error_msg = f"HTTP Status {set_result['status_code']}"
-                                if 'body' in set_result and 'error' in set_result['body']:
-                                    error_msg += f" {set_result['body']['error']}: {set_result['body']['message']}"
-                                print(error_msg)
-                            else:
-                                print(json.dumps(set_result))
-                                return set_result
-                            break
-                    else:
-                        continue
-                    break
+            # A remembered uniqueId saves downloading the accessory list, unless a fresh one is already at hand
+            if resolutions is not None and self.hb.accessoryCache.get(self.hb.accessoryCacheTtl) is None:
+                unique_id = resolutions.get(args.name, char_type)
+            
+            if unique_id is not None:
+                set_result = self._put_characteristic(unique_id, char_data)
+                if set_result['status_code'] == 404:
+                    # The accessory is gone or was re-added under a new id; resolve the name again
+                    resolutions.discard(args.name, char_type)
+                    unique_id = None
+            
+            if unique_id is None:
+                found = self.hb.findCharacteristics(args.name, [char_type])
+                
+                if found is None:
+                    raise Exception("No accessories found")
+                
+                matches = found[char_type]
+                if not matches:
+                    return None
+                
+                unique_id = matches[0][0].uniqueId
+                set_result = self._put_characteristic(unique_id, char_data)
+                
+                if resolutions is not None and set_result['status_code'] == 200:
+                    resolutions.put(args.name, char_type, unique_id)
+            
+            if set_result['status_code'] != 200:
+                error_msg = f"HTTP Status {set_result['status_code']}"
+                if 'body' in set_result and 'error' in set_result['body']:
+                    error_msg += f" {set_result['body']['error']}: {set_result['body']['message']}"
+                print(error_msg, file=self.out)
             else:
-                raise Exception("No accessories found")
+                print(json.dumps(set_result), file=self.out)
+                return set_result
                 
         except Exception as inst:
-            print(inst)
+            print(inst, file=self.out)
+    
+    def _put_characteristic(self, unique_id: str, char_data: Dict[str, Any]) -> Dict[str, Any]:
+        set_result = self.hb.apiRequest(
+            '/api/accessories/{uniqueId}', 
+            'put', 
+            requestBody=char_data, 
+            parameters={'uniqueId': unique_id}
+        )
+        
+        # The cached snapshot no longer reflects this accessory
+        self._invalidate_accessories()
+        return set_result
+    
+    def _invalidate_accessories(self) -> None:
+        self.hb.invalidateAccessories()
+        
+        # other invocations may be answering stale reads from the saved snapshot
+        if self.hb.snapshotStore is None and self.snapshot_dir is not None:
+            self._snapshot_store().discard()
+    
+    def _snapshot_store(self) -> SnapshotStore:
+        return SnapshotStore(host_cache_path(self.snapshot_dir, self.hb.host, self.hb.port, '.snapshot'))
+    
+    def _resolution_cache(self) -> Optional[ResolutionCache]:
+        """The name -> uniqueId cache for the loaded session's host, or None if disabled."""
+        if self.resolution_cache_dir is None:
+            return None
+        return getResolutionCache(self.resolution_cache_dir, self.hb.host, self.hb.port)
     
     def accessorycharvalues(self, args):
         """Get accessory characteristic values."""
@@ -214,21 +391,28 @@ class cliExecutor:
             if not self.loadSession(args.sessionId):
                 raise Exception('Session load failed')
             
-            find_accessories = self.hb.findAccessoriesByName(args.name)
-            results = {}
+            found = self.hb.findCharacteristics(args.name, args.charSet, self._serve_stale(args))
             
-            if find_accessories is not None:
-                for accessory in find_accessories:
-                    for characteristic in accessory['serviceCharacteristics']:
-                        for char_type in args.charSet:
-                            if char_type == characteristic['type']:
-                                results[characteristic['type']] = characteristic['value']
+            if found is not None:
+                if getattr(args, 'format', None) == 'ndjson':
+                    return self._write_ndjson(
+                        {'serviceName': accessory.serviceName, 'uniqueId': accessory.uniqueId,
+                         'type': characteristic.type, 'value': characteristic.value}
+                        for matches in found.values()
+                        for accessory, characteristic in matches
+                    )
+                
+                # with several matching services the last one wins, as it always has
+                results = {char_type: matches[-1][1].value for char_type, matches in found.items() if matches}
                 
-                print(json.dumps(results))
+                print(json.dumps(results), file=self.out)
                 return results
                 
         except Exception as inst:
-            print(inst)
+            print(inst, file=self.out)
+        
+        finally:
+            self._revalidate_in_background()
     
     def listaccessorychars(self, args):
         """List accessory characteristics."""
@@ -236,65 +420,468 @@ class cliExecutor:
             if not self.loadSession(args.sessionId):
                 raise Exception('Session load failed')
             
-            find_accessories = self.hb.findAccessoriesByName(args.name)
-            results = {}
+            find_accessories = self.hb.findAccessoriesByName(args.name, self._serve_stale(args))
             
             if find_accessories is not None:
-                print("\tCharacteristic\tValue\tRead\tWrite\n")
+                if getattr(args, 'format', None) == 'ndjson':
+                    return self._write_ndjson(
+                        {'serviceName': accessory.serviceName, 'uniqueId': accessory.uniqueId,
+                         'type': characteristic.type, 'value': characteristic.value,
+                         'canRead': characteristic.canRead, 'canWrite': characteristic.canWrite}
+                        for accessory in find_accessories
+                        for characteristic in accessory.serviceCharacteristics
+                    )
+                
+                results = {}
+                print("\tCharacteristic\tValue\tRead\tWrite\n", file=self.out)
                 for accessory in find_accessories:
-                    print(accessory['serviceName'])
+                    print(accessory.serviceName, file=self.out)
                     
-                    for characteristic in accessory['serviceCharacteristics']:
-                        print(f"\t{characteristic['type']}\t{characteristic['value']}\t{characteristic['canRead']}\t{characteristic['canWrite']}")
-                        results[characteristic['type']] = characteristic['value']
+                    for characteristic in accessory.serviceCharacteristics:
+                        print(f"\t{characteristic.type}\t{characteristic.value}\t{characteristic.canRead}\t{characteristic.canWrite}", file=self.out)
+                        results[characteristic.type] = characteristic.value
                 
                 return results
             else:
                 raise Exception("No accessories found")
                 
         except Exception as inst:
-            print(inst)
+            print(inst, file=self.out)
+        
+        finally:
+            self._revalidate_in_background()
+    
+    def _serve_stale(self, args) -> Optional[float]:
+        """
+        How old a snapshot this read may use, loading the on-disk one if it is young enough.
+        
+        Returns None (the usual cache TTL) unless --max-stale or max_stale
+        allows more. When the snapshot served is past the TTL, a background
+        refresh is started once the action has printed its result.
+        """
+        value = getattr(args, 'maxStale', None)
+        max_stale = self.max_stale if value is None else parse_duration(value, 'max-stale')
+        
+        # a live mirror is always current
+        if not max_stale or self.live_mirror:
+            return None
+        
+        # downloads are only saved to disk while stale reads are in use
+        if self.hb.snapshotStore is None and self.snapshot_dir is not None:
+            self.hb.snapshotStore = self._snapshot_store()
+        
+        cache = self.hb.accessoryCache
+        snapshot = cache.get(max_stale)
+        store = self.hb.snapshotStore
+        
+        if snapshot is None and store is not None:
+            stored = store.load()
+            if stored is not None:
+                age = time.time() - stored[0]
+                if 0 <= age <= max_stale:
+                    snapshot = cache.put(stored[1], fetchedAt=time.monotonic() - age)
+        
+        if snapshot is not None and snapshot.age() > self.hb.accessoryCacheTtl:
+            self._revalidate = True
+        
+        return max_stale
+    
+    def _revalidate_in_background(self) -> None:
+        if not self._revalidate:
+            return
+        self._revalidate = False
+        
+        (self.out or sys.stdout).flush()
+        
+        if self.detach_refresh and self.hb.snapshotStore is not None:
+            # the refresh outlives this process, which exits as soon as it has answered
+            self._refresh_process = spawn_refresh({
+                'host': self.hb.host,
+                'port': self.hb.port,
+                'secure': self.hb.secure,
+                'authorization': self.hb.authorization,
+                'snapshotPath': os.path.abspath(self.hb.snapshotStore.path),
+                'specPath': os.path.abspath(self.spec_path),
+                'connectTimeout': self.connect_timeout,
+                'readTimeout': self.read_timeout,
+                'breakerStateDir': None if self.breaker_state_dir is None else os.path.abspath(self.breaker_state_dir)
+            })
+        else:
+            # a daemon thread, so it never holds up the exit of the process
+            self._refresh_thread = threading.Thread(
+                target=refresh_snapshot, args=(self.hb,), name=f"hbCli-refresh-{self.hb.host}", daemon=True
+            )
+            self._refresh_thread.start()
+    
+    def _write_ndjson(self, records, flush_every: int = 64) -> int:
+        """Write records one JSON line each as they are produced; returns how many were written."""
+        out = self.out or sys.stdout
+        count = 0
+        
+        for record in records:
+            out.write(json.dumps(record) + "\n")
+            count += 1
+            # let a consumer at the other end of a pipe start before the listing is done
+            if count % flush_every == 0:
+                out.flush()
+        
+        out.flush()
+        return count
+    
+    def fanout(self, args, max_workers: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Run one action against several sessions in parallel.
+        
+        Targets are taken from args.sessionIds and from args.hosts, which holds
+        user@host entries that are resolved through the user session provider.
+        Each target runs on its own worker executor, and so on its host's
+        pooled client. The workers share this executor's providers and deadline.
+        Prints and returns one result per target, in the order given.
+        """
+        try:
+            if args.action not in FANOUT_ACTIONS:
+                raise Exception(f"Action {args.action} cannot run across several sessions")
+            
+            targets = [(session_id, session_id) for session_id in getattr(args, 'sessionIds', None) or []]
+            for target in getattr(args, 'hosts', None) or []:
+                username, _, host = target.rpartition('@')
+                targets.append((target, self.user_session_provider.get_session_id(username, host)))
+            
+            if max_workers is None:
+                max_workers = int(getattr(args, 'parallel', None) or 8)
+            
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets) or 1))) as pool:
+                results = list(pool.map(lambda t: self._run_target(args, *t), targets))
+            
+            print(json.dumps(results), file=self.out)
+            return results
+            
+        except Exception as inst:
+            print(inst, file=self.out)
+    
+    def _run_target(self, args, target: str, session_id: Optional[str]) -> Dict[str, Any]:
+        """Run args.action for one session on a worker executor, capturing its output."""
+        entry = {'target': target, 'sessionId': session_id, 'host': None, 'ok': False, 'result': None, 'output': ''}
+        
+        if not session_id:
+            entry['output'] = f"No session found for {target}"
+            return entry
+        
+        worker = cliExecutor(
+            auth_provider=self._auth_provider,
+            storage_provider=self.storage_provider,
+            user_session_provider=self.user_session_provider,
+            token_expiry_margin=self.token_expiry_margin,
+            live_mirror=self.live_mirror,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            retry_policy=self.retry_policy,
+            lock_dir=self.lock_dir,
+            login_lock_timeout=self.login_lock_timeout,
+            resolution_cache_dir=self.resolution_cache_dir,
+            snapshot_dir=self.snapshot_dir,
+            max_stale=self.max_stale,
+            accessory_cache_ttl=self.accessory_cache_ttl,
+            spec_path=self.spec_path,
+            breaker_state_dir=self.breaker_state_dir,
+            detach_refresh=self.detach_refresh
+        )
+        worker.deadline = self.deadline
+        worker.out = io.StringIO()
+        
+        worker_args = copy.copy(args)
+        worker_args.sessionId = session_id
+        worker_args.sessionIds = None
+        worker_args.hosts = None
+        
+        result = getattr(worker, args.action)(worker_args)
+        
+        entry['host'] = worker.hb.host if worker.hb is not None else None
+        entry['ok'] = result is not None
+        entry['result'] = result
+        entry['output'] = worker.out.getvalue()
+        return entry
+    
+    def batch(self, args):
+        """
+        Run newline-delimited JSON commands over one loaded session.
+        
+        Each line is an object with an "action" and that action's options by
+        their commands.json dest names, e.g.
+        {"action": "accessorycharvalues", "name": "Lamp", "charSet": ["On"]}.
+        Every command uses the batch's session. A command's "deadline" and
+        "timings" apply to that command alone; the batch's --deadline is the
+        budget of each command that sets none. One NDJSON result line is
+        written per command, in order, as soon as the command finishes.
+        """
+        try:
+            if self.command_list is None:
+                self.command_list = load_command_spec(DEFAULT_SPEC_PATH)
+            
+            if not self.loadSession(args.sessionId):
+                raise Exception('Session load failed')
+            
+            out = self.out or sys.stdout
+            source = sys.stdin if args.inputFile in (None, '-') else open(args.inputFile, 'r')
+            self._pinned_session = args.sessionId
+            batch_deadline = self.deadline
+            count = 0
+            
+            try:
+                for index, line in enumerate(source):
+                    if not line.strip():
+                        continue
+                    
+                    entry = self._run_batch_command(index, line, args.sessionId, batch_deadline)
+                    out.write(json.dumps(entry) + "\n")
+                    out.flush()
+                    count += 1
+            finally:
+                self._pinned_session = None
+                self.deadline = batch_deadline
+                if source is not sys.stdin:
+                    source.close()
+            
+            return count
+            
+        except Exception as inst:
+            print(inst, file=self.out)
+    
+    def _run_batch_command(self, index: int, line: str, session_id: str,
+                           batch_deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Run one batch line within its own deadline, capturing what the action prints."""
+        entry = {'line': index + 1, 'action': None, 'ok': False, 'result': None, 'output': ''}
+        
+        try:
+            command = json.loads(line)
+            if not isinstance(command, dict):
+                raise ValueError("Command must be a JSON object")
+            
+            action = command.get('action')
+            entry['action'] = action
+            options = action_options(self.command_list, action) if action in BATCH_ACTIONS else None
+            if options is None:
+                raise ValueError(f"Action {action} cannot be used in a batch")
+            
+            # the batch decides the session; anything else the action does not know is a mistake
+            for dest in sorted(set(command) - {'action'}):
+                if dest in ('sessionId', 'sessionIds', 'hosts'):
+                    raise ValueError(f"Option {dest} cannot be used in a batch, every command uses the batch's session")
+                if dest not in options:
+                    raise ValueError(f"Option {dest} cannot be used with {action}")
+            
+            if command.get('deadline') is not None:
+                deadline = Deadline.parse(command['deadline'])
+            elif batch_deadline is not None:
+                deadline = Deadline(batch_deadline.seconds)
+            else:
+                deadline = None
+            
+            values = {}
+            for dest, kwargs in options.items():
+                if dest in command:
+                    values[dest] = command[dest]
+                elif kwargs.get('required') and dest != 'sessionId':
+                    raise ValueError(f"Missing required option {dest}")
+                else:
+                    values[dest] = kwargs.get('default', False if kwargs.get('action') == 'store_true' else None)
+            
+            values.update(action=action, sessionId=session_id, sessionIds=None, hosts=None)
+            command_args = argparse.Namespace(**values)
+        except ValueError as inst:
+            entry['output'] = str(inst)
+            return entry
+        
+        self.deadline = deadline
+        self.hb.deadline = deadline
+        previous_out = self.out
+        self.out = io.StringIO()
+        try:
+            if command_args.timings:
+                with TimingRecorder() as recorder:
+                    result = getattr(self, action)(command_args)
+                recorder.summary(self.err)
+            else:
+                result = getattr(self, action)(command_args)
+        finally:
+            entry['output'] = self.out.getvalue()
+            self.out = previous_out
+        
+        entry['ok'] = result is not None
+        entry['result'] = result
+        return entry
+    
+    def sessions(self, args):
+        """Validate every stored session in parallel and prune the expired or invalid ones."""
+        try:
+            workers = int(getattr(args, 'workers', None) or 8)
+            if workers < 1:
+                raise Exception("Workers must be at least 1")
+            
+            session_ids = self.storage_provider.list_sessions()
+            
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                statuses = dict(zip(session_ids, pool.map(self._check_session, session_ids)))
+            
+            result = {'checked': len(session_ids)}
+            for status in ('valid', 'expired', 'invalid', 'unreachable'):
+                result[status] = sorted(i for i, s in statuses.items() if s == status)
+            
+            # Unreachable hosts say nothing about the token, so those sessions are kept
+            prune = set(result['expired'] + result['invalid'])
+            remaining = set(session_ids) - prune
+            mappings = [(u, h) for u, h, i in self.user_session_provider.list_user_sessions() if i not in remaining]
+            
+            dry_run = bool(getattr(args, 'dryRun', False))
+            if not dry_run:
+                for session_id in prune:
+                    self.storage_provider.delete_session(session_id)
+                for username, host in mappings:
+                    self.user_session_provider.remove_user_session(username, host)
+            
+            result['pruned'] = sorted(prune)
+            result['mappingsRemoved'] = sorted(f"{u}@{h}" for u, h in mappings)
+            result['dryRun'] = dry_run
+            
+            print(json.dumps(result), file=self.out)
+            return result
+            
+        except Exception as inst:
+            print(inst, file=self.out)
+    
+    def _check_session(self, session_id: str) -> str:
+        """Classify a stored session as valid, expired, invalid or unreachable."""
+        session_data = self.storage_provider.load_session(session_id)
+        if not session_data or not session_data.get('host') or not session_data.get('body'):
+            return 'invalid'
+        
+        # Trust the token's own expiry unless it is unknown or close
+        expires_at = token_expires_at(session_data)
+        if expires_at is not None:
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                return 'expired'
+            if remaining > self.token_expiry_margin:
+                return 'valid'
+        
+        hb = hbApi.hbApi(
+            session_data.get('host'),
+            session_data.get('port', 8581),
+            session_data.get('secure', False),
+            specPath=self.spec_path,
+            connectTimeout=self.connect_timeout,
+            readTimeout=self.read_timeout,
+            retryPolicy=self.retry_policy,
+            accessoryCacheTtl=self.accessory_cache_ttl,
+            breakerStateDir=self.breaker_state_dir,
+            out=self.out
+        )
+        hb.authorization = session_data
+        hb.deadline = self.deadline
+        
+        auth_check = hb.apiRequest("/api/auth/check", "get")
+        if auth_check['status_code'] == 200:
+            return 'valid'
+        if auth_check['status_code'] == 401:
+            return 'invalid'
+        return 'unreachable'
     
     def loadSession(self, session_id: str) -> bool:
         """Load a session from storage and set up the API client."""
         try:
+            if not session_id:
+                print("Session ID required (-S/--session, --sessions or --hosts)", file=self.out)
+                return False
+            
+            # Within a batch the client loaded for its session is reused
+            if session_id == self._pinned_session and self.hb is not None and not self.hb.authRejected:
+                self.hb.deadline = self.deadline
+                self.hb.out = self.out
+                return True
+            
             # Load session data
             session_data = self.storage_provider.load_session(session_id)
             if not session_data:
-                print("Session ID not found")
+                print("Session ID not found", file=self.out)
                 return False
             
+            previous = self.hb
+            
             # Create API client with session data
             self.hb = hbApi.hbApi(
                 session_data.get('host'),
                 session_data.get('port', 8581),
-                session_data.get('secure', False)
+                session_data.get('secure', False),
+                specPath=self.spec_path,
+                connectTimeout=self.connect_timeout,
+                readTimeout=self.read_timeout,
+                retryPolicy=self.retry_policy,
+                accessoryCacheTtl=self.accessory_cache_ttl,
+                breakerStateDir=self.breaker_state_dir,
+                out=self.out
             )
             self.hb.authorization = session_data
+            self.hb.deadline = self.deadline
+            
+            # A token the server has already refused is checked again rather than trusted by its expiry
+            if previous is not None and previous.authRejected and \
+                    _access_token(previous.authorization) == _access_token(session_data):
+                self.hb.authRejected = True
             
-            # Create auth provider and check if token is still valid
+            # Check if the token is still valid, locally unless it is close to expiry
             auth_provider = HomebridgeAuthProvider(
                 session_data.get('host'),
                 session_data.get('port', 8581),
-                session_data.get('secure', False)
+                session_data.get('secure', False),
+                self.token_expiry_margin,
+                self.spec_path,
+                self.connect_timeout,
+                self.read_timeout
             )
+            auth_provider.hb_api = self.hb
             auth_provider.set_token(session_data)
             
             if auth_provider.is_valid():
+                if self.live_mirror:
+                    ensureMirror(
+                        self.hb.host,
+                        self.hb.port,
+                        self.hb.secure,
+                        session_data['body']['access_token']
+                    )
                 return True
             else:
-                print("Authorization is no longer valid")
+                print("Authorization is no longer valid", file=self.out)
                 return False
                 
         except Exception as e:
-            print(f"Error loading session: {e}")
+            print(f"Error loading session: {e}", file=self.out)
             return False
 
 
+def _access_token(auth_data: Optional[Dict[str, Any]]) -> Optional[str]:
+    return ((auth_data or {}).get('body') or {}).get('access_token')
+
+
 # Factory functions for easy instantiation
-def create_default_executor() -> cliExecutor:
-    """Create a cliExecutor with default file-based providers (backward compatible)."""
-    return cliExecutor()
+def create_default_executor(base_dir: Optional[str] = None) -> cliExecutor:
+    """
+    Create a cliExecutor with default file-based providers (backward compatible).
+    
+    With `base_dir`, the session stores, caches and swagger definition are
+    looked up there instead of in the working directory.
+    """
+    if base_dir is None:
+        return cliExecutor()
+    
+    return cliExecutor(
+        storage_provider=FileStorageProvider(os.path.join(base_dir, '.sessionStore')),
+        user_session_provider=FileUserSessionProvider(os.path.join(base_dir, '.authStore')),
+        resolution_cache_dir=os.path.join(base_dir, DEFAULT_CACHE_DIR),
+        snapshot_dir=os.path.join(base_dir, DEFAULT_CACHE_DIR),
+        spec_path=os.path.join(base_dir, 'swagger.json'),
+        breaker_state_dir=os.path.join(base_dir, DEFAULT_CACHE_DIR)
+    )
 
 
 def create_memory_executor() -> cliExecutor:
@@ -307,6 +894,16 @@ def create_memory_executor() -> cliExecutor:
     )
 
 
+def create_sqlite_executor(db_path: str = '.hbCli.db') -> cliExecutor:
+    """Create a cliExecutor that keeps sessions and user mappings in one SQLite database."""
+    from .sqlite_providers import SQLiteStorageProvider, SQLiteUserSessionProvider
+    
+    return cliExecutor(
+        storage_provider=SQLiteStorageProvider(db_path),
+        user_session_provider=SQLiteUserSessionProvider(db_path)
+    )
+
+
 def create_custom_executor(auth_provider: AuthProvider = None,
                           storage_provider: StorageProvider = None,
                           user_session_provider: UserSessionProvider = None) -> cliExecutor:
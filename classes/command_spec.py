@@ -0,0 +1,104 @@
+"""
+Loading of the commands.json CLI definition for hbCli.py.
+
+The parsed definition is cached in marshal form next to the JSON file and
+reused until the JSON file's mtime or size changes. Parsers can be built for
+a single action so a normal invocation only pays for the subcommand it runs.
+"""
+
+import json
+import marshal
+import os
+from typing import Any, Dict, List, Optional
+
+CACHE_VERSION = 1
+
+# commands.json at the root of the checkout
+DEFAULT_SPEC_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'commands.json')
+
+# options accepted by every action, in the same [flags, kwargs] form as commands.json
+COMMON_OPTIONS = [
+    [["--timings"], {"help": "Print per-request phase timings to stderr", "dest": "timings", "action": "store_true"}],
+    [["--deadline"], {"help": "Time budget for the whole command, e.g. 2s or 500ms", "dest": "deadline"}]
+]
+
+
+def _cache_path(path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, '__pycache__', name + '.cache')
+
+
+def load_command_spec(path: str) -> List[Any]:
+    """Load the command definition, using the marshal cache while it is current."""
+    stat = os.stat(path)
+    key = (CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+    cache_path = _cache_path(path)
+
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = marshal.load(f)
+        if cached[0] == key:
+            return cached[1]
+    except (OSError, EOFError, ValueError, TypeError, IndexError):
+        pass
+
+    with open(path, 'r') as f:
+        command_list = json.loads(f.read())
+
+    # Best effort: a read-only checkout simply goes without the cache
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            marshal.dump((key, command_list), f)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass
+
+    return command_list
+
+
+def action_options(command_list: List[Any], action: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Map each option dest of an action, common options included, to its argparse kwargs.
+
+    Returns None if the action is not defined.
+    """
+    for i in command_list:
+        if i[0][0] == action:
+            options = {}
+            for flags, kwargs in i[2] + COMMON_OPTIONS:
+                dest = kwargs.get('dest') or flags[-1].lstrip('-').replace('-', '_')
+                options[dest] = kwargs
+            return options
+
+    return None
+
+
+def build_parser(command_list: List[Any], only: Optional[str] = None):
+    """
+    Build the argparse parser for the CLI.
+
+    Args:
+        command_list: Parsed commands.json definition
+        only: If given and it names an action, only that subparser is built
+
+    Returns:
+        argparse.ArgumentParser
+    """
+    import argparse
+
+    if only is not None and not any(i[0][0] == only for i in command_list):
+        only = None
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='action', title='actions')
+
+    for i in command_list:
+        if only is not None and i[0][0] != only:
+            continue
+        subparser = subparsers.add_parser(*i[0], **i[1])
+        for c in i[2] + COMMON_OPTIONS:
+            subparser.add_argument(*c[0], **c[1])
+
+    return parser
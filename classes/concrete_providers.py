@@ -1,8 +1,12 @@
 import os
+import copy
 import json
+import time
+import base64
+import threading
 import random
 import string
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple, Union
 
 from .auth_providers import AuthProvider, StorageProvider, UserSessionProvider
 from . import hbApi
@@ -11,10 +15,18 @@ from . import hbApi
 class HomebridgeAuthProvider(AuthProvider):
     """Concrete implementation for Homebridge UI API authentication."""
     
-    def __init__(self, host: str, port: int = 8581, secure: bool = False):
+    def __init__(self, host: str, port: int = 8581, secure: bool = False,
+                 expiry_margin: float = 60.0, spec_path: str = "swagger.json",
+                 connect_timeout: float = 5.0, read_timeout: float = 30.0):
         self.host = host
         self.port = port
         self.secure = secure
+        self.expiry_margin = expiry_margin
+        self.spec_path = spec_path
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # Deadline the login request must finish within, if any
+        self.deadline = None
         self.hb_api = None
         self._current_token = None
         
@@ -29,7 +41,9 @@ class HomebridgeAuthProvider(AuthProvider):
             Authentication result dictionary
         """
         try:
-            self.hb_api = hbApi.hbApi(self.host, self.port, self.secure)
+            self.hb_api = hbApi.hbApi(self.host, self.port, self.secure, specPath=self.spec_path,
+                                      connectTimeout=self.connect_timeout, readTimeout=self.read_timeout)
+            self.hb_api.deadline = self.deadline
             self.hb_api.authorize(credentials['username'], credentials['password'])
             
             if self.hb_api.authorization and self.hb_api.authorization['status_code'] == 201:
@@ -52,13 +66,46 @@ class HomebridgeAuthProvider(AuthProvider):
         return self._current_token
     
     def is_valid(self) -> bool:
-        """Check if the current token is valid by making an auth check request."""
+        """
+        Check if the current token is valid.
+        
+        The token's expiry is checked locally; the network auth check only runs
+        when the expiry is unknown, within `expiry_margin` seconds, or after the
+        server has rejected the token with a 401.
+        """
         if not self.hb_api or not self._current_token:
             return False
+        
+        if not self.hb_api.authRejected:
+            expires_at = token_expires_at(self._current_token)
+            if expires_at is not None:
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    return False
+                if remaining > self.expiry_margin:
+                    return True
             
+        return self._check_with_server()
+    
+    def verify(self) -> bool:
+        """Check the token with the server unless it has already expired locally."""
+        if not self.hb_api or not self._current_token:
+            return False
+        
+        expires_at = token_expires_at(self._current_token)
+        if expires_at is not None and expires_at <= time.time():
+            return False
+        
+        return self._check_with_server()
+    
+    def _check_with_server(self) -> bool:
         try:
             auth_check = self.hb_api.apiRequest("/api/auth/check", "get")
-            return auth_check['status_code'] == 200
+            if auth_check['status_code'] == 200:
+                # accepted again, so its expiry can be trusted from here on
+                self.hb_api.authRejected = False
+                return True
+            return False
         except:
             return False
     
@@ -76,11 +123,42 @@ class HomebridgeAuthProvider(AuthProvider):
             self.hb_api = hbApi.hbApi(
                 token_data.get('host', self.host),
                 token_data.get('port', self.port),
-                token_data.get('secure', self.secure)
+                token_data.get('secure', self.secure),
+                specPath=self.spec_path,
+                connectTimeout=self.connect_timeout,
+                readTimeout=self.read_timeout
             )
         self.hb_api.authorization = token_data
 
 
+def atomic_write(file_path: str, data: Union[str, bytes]) -> None:
+    """Write a file via a temporary file and rename, so readers never see a partial write."""
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _file_signature(stat: os.stat_result) -> tuple:
+    # a rename swaps the inode, so this changes even within one mtime tick
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+# absolute session file path -> (file signature, parsed data), reused while the file is unchanged;
+# process-wide so providers created per request (e.g. by the daemon) share it
+_sessionCache: Dict[str, Tuple[tuple, Dict[str, Any]]] = {}
+
+
+def clear_session_cache() -> None:
+    """Forget every parsed session file; they are read again on next use."""
+    _sessionCache.clear()
+
+
 class FileStorageProvider(StorageProvider):
     """File-based storage provider for session data."""
     
@@ -97,25 +175,40 @@ class FileStorageProvider(StorageProvider):
         """Get the file path for a session."""
         return os.path.join(self.base_dir, f"{session_id}.json")
     
+    def _cache_key(self, session_id: str) -> str:
+        return os.path.abspath(self._get_session_file_path(session_id))
+    
     def save_session(self, session_id: str, auth_data: Dict[str, Any]) -> bool:
-        """Save session data to a JSON file."""
+        """Save session data to a JSON file, atomically replacing any previous version."""
         try:
             file_path = self._get_session_file_path(session_id)
-            with open(file_path, 'w') as f:
-                json.dump(auth_data, f, indent=2)
+            atomic_write(file_path, json.dumps(auth_data, indent=2))
+            _sessionCache[self._cache_key(session_id)] = (_file_signature(os.stat(file_path)), copy.deepcopy(auth_data))
             return True
         except Exception as e:
+            _sessionCache.pop(self._cache_key(session_id), None)
             print(f"Error saving session {session_id}: {e}")
             return False
     
     def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """Load session data from a JSON file."""
+        """Load session data from a JSON file, skipping the parse if the file is unchanged."""
         try:
             file_path = self._get_session_file_path(session_id)
-            if os.path.exists(file_path):
+            key = self._cache_key(session_id)
+            try:
+                signature = _file_signature(os.stat(file_path))
+            except FileNotFoundError:
+                _sessionCache.pop(key, None)
+                return None
+            
+            cached = _sessionCache.get(key)
+            if cached is None or cached[0] != signature:
                 with open(file_path, 'r') as f:
-                    return json.load(f)
-            return None
+                    cached = (signature, json.load(f))
+                _sessionCache[key] = cached
+            
+            # callers get their own copy so the cached data stays as on disk
+            return copy.deepcopy(cached[1])
         except Exception as e:
             print(f"Error loading session {session_id}: {e}")
             return None
@@ -124,6 +217,7 @@ class FileStorageProvider(StorageProvider):
         """Delete session data file."""
         try:
             file_path = self._get_session_file_path(session_id)
+            _sessionCache.pop(self._cache_key(session_id), None)
             if os.path.exists(file_path):
                 os.remove(file_path)
             return True
@@ -184,8 +278,7 @@ class FileUserSessionProvider(UserSessionProvider):
         """Set the session ID for a user@host combination."""
         try:
             file_path = self._get_user_file_path(username, host)
-            with open(file_path, 'w') as f:
-                f.write(session_id)
+            atomic_write(file_path, session_id)
             return True
         except Exception as e:
             print(f"Error setting session ID for {username}@{host}: {e}")
@@ -201,6 +294,23 @@ class FileUserSessionProvider(UserSessionProvider):
         except Exception as e:
             print(f"Error removing session for {username}@{host}: {e}")
             return False
+    
+    def list_user_sessions(self) -> List[Tuple[str, str, str]]:
+        """List all user@host mappings (files named user@host)."""
+        try:
+            mappings = []
+            for filename in os.listdir(self.base_dir):
+                # skip login locks and in-progress atomic writes
+                if '@' not in filename or filename.endswith(('.lock', '.tmp')):
+                    continue
+                username, host = filename.rsplit('@', 1)
+                session_id = self.get_session_id(username, host)
+                if session_id:
+                    mappings.append((username, host, session_id))
+            return mappings
+        except Exception as e:
+            print(f"Error listing user sessions: {e}")
+            return []
 
 
 class MemoryStorageProvider(StorageProvider):
@@ -260,6 +370,33 @@ class MemoryUserSessionProvider(UserSessionProvider):
         if key in self._user_sessions:
             del self._user_sessions[key]
         return True
+    
+    def list_user_sessions(self) -> List[Tuple[str, str, str]]:
+        """List all user@host mappings in memory."""
+        return [tuple(key.rsplit('@', 1)) + (session_id,) for key, session_id in self._user_sessions.items()]
+
+
+def token_expires_at(token_data: Dict[str, Any]) -> Optional[float]:
+    """
+    Work out when a stored token expires, as a Unix timestamp.
+    
+    Uses the access token's JWT `exp` claim, falling back to the stored
+    `expires_in` counted from `issued_at`. Returns None if neither is available.
+    """
+    body = token_data.get('body') or {}
+    
+    try:
+        payload = body['access_token'].split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims['exp'])
+    except Exception:
+        pass
+    
+    if body.get('expires_in') is not None and token_data.get('issued_at') is not None:
+        return float(token_data['issued_at']) + float(body['expires_in'])
+    
+    return None
 
 
 def generate_session_id() -> str:
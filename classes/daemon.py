@@ -0,0 +1,280 @@
+"""
+Resident daemon for hbCli.py and the thin client that forwards to it.
+
+The daemon keeps the process-wide state (the shared swagger spec, pooled
+connections and accessory caches) warm, and runs CLI invocations received
+over a Unix domain socket. Only the client half is needed on the hot path, so
+this module must stay free of heavy imports at module level.
+"""
+
+import contextlib
+import errno
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from .deadline import parse_duration
+
+DEFAULT_SOCKET = '.hbCli.sock'
+
+# seconds the client waits beyond the command's --deadline for the daemon to reply
+REPLY_GRACE = 5.0
+
+# options holding paths that must resolve against the client's working directory
+_PATH_OPTIONS = ('configFile', 'inputFile')
+
+
+def socket_path() -> str:
+    """Socket used by the daemon, overridable with the HBCLI_SOCKET environment variable."""
+    return os.environ.get('HBCLI_SOCKET', DEFAULT_SOCKET)
+
+
+def _recv_all(sock: socket.socket) -> bytes:
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def runs_locally(argv: List[str]) -> bool:
+    """
+    Whether an invocation must run in the calling process rather than be forwarded.
+
+    That is the daemon itself and anything whose output streams (batches and
+    --format ndjson reads), since a forwarded command's output only comes back
+    as one reply once it has finished.
+    """
+    if argv and argv[0] in ('daemon', 'batch'):
+        return True
+
+    for i, arg in enumerate(argv):
+        if (arg == '--format' and argv[i + 1:i + 2] == ['ndjson']) or arg == '--format=ndjson':
+            return True
+    return False
+
+
+def reply_timeout(argv: List[str]) -> Optional[float]:
+    """
+    Seconds to wait for the daemon's reply: the command's --deadline plus a
+    grace period, or None (no limit) when the command has no deadline.
+    """
+    value = None
+    for i, arg in enumerate(argv):
+        if arg == '--deadline' and i + 1 < len(argv):
+            value = argv[i + 1]
+        elif arg.startswith('--deadline='):
+            value = arg.split('=', 1)[1]
+
+    try:
+        seconds = parse_duration(value)
+    except ValueError:
+        # the daemon reports the bad value itself
+        return None
+    return None if seconds is None else seconds + REPLY_GRACE
+
+
+def _connect(path: str, timeout: float = 1.0) -> Optional[socket.socket]:
+    # None when nothing is listening; any other failure is raised
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        return sock
+    except OSError as e:
+        sock.close()
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+
+
+def forward(argv: List[str], path: Optional[str] = None,
+            timeout: Optional[float] = None) -> Optional[Tuple[str, str, int]]:
+    """
+    Send a CLI invocation to a running daemon.
+
+    Returns the daemon's (stdout, stderr, exit code), or None if no daemon is
+    listening, in which case the caller runs the command itself. Once the
+    command has been sent it is never reported as not run: a daemon that
+    fails to reply gives an error instead, since it may still be running it.
+
+    Args:
+        argv: Command line arguments, without the program name
+        path: Socket path (default: `socket_path()`)
+        timeout: Seconds to wait for the reply (default: from the command's
+            --deadline, or no limit)
+    """
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+
+    try:
+        sock = _connect(path)
+    except OSError as e:
+        return '', f"Unable to reach the hbCli daemon at {path}: {e}\n", 1
+    if sock is None:
+        return None
+
+    try:
+        with sock:
+            sock.settimeout(reply_timeout(argv) if timeout is None else timeout)
+            sock.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd()}).encode() + b'\n')
+            sock.shutdown(socket.SHUT_WR)
+            reply = json.loads(_recv_all(sock))
+    except (OSError, ValueError) as e:
+        return '', f"No reply from the hbCli daemon ({e or type(e).__name__}); the command may still have run\n", 1
+
+    return reply.get('stdout', ''), reply.get('stderr', ''), reply.get('exitCode', 0)
+
+
+class _ThreadStreams:
+    """
+    Stand-in for sys.stdout/sys.stderr that sends each thread's writes to the
+    stream it is capturing into, or to the original stream otherwise.
+
+    Lets the daemon collect what argparse and the API client print for one
+    invocation without redirecting the streams of the whole process.
+    """
+
+    def __init__(self, fallback):
+        self._fallback = fallback
+        self._local = threading.local()
+
+    def _target(self):
+        return getattr(self._local, 'stream', None) or self._fallback
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+    @contextlib.contextmanager
+    def capture(self, stream):
+        previous = getattr(self._local, 'stream', None)
+        self._local.stream = stream
+        try:
+            yield
+        finally:
+            self._local.stream = previous
+
+
+@contextlib.contextmanager
+def _captured(stdout: io.StringIO, stderr: io.StringIO):
+    with contextlib.ExitStack() as stack:
+        for stream, target in ((sys.stdout, stdout), (sys.stderr, stderr)):
+            if isinstance(stream, _ThreadStreams):
+                stack.enter_context(stream.capture(target))
+        yield
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.read())
+            stdout, stderr, exit_code = self.server.hb_daemon.run(request['argv'], request.get('cwd'))
+        except Exception as e:
+            stdout, stderr, exit_code = '', f"Daemon error: {e}\n", 1
+
+        self.wfile.write(json.dumps({'stdout': stdout, 'stderr': stderr, 'exitCode': exit_code}).encode())
+
+
+class hbCliDaemon:
+    """
+    Serves hbCli.py invocations over a Unix domain socket.
+
+    Each invocation gets its own executor, built for the client's working
+    directory, that prints into buffers returned to the client. Requests are
+    still handled one at a time, because --timings collects the records of
+    every request made in the process while it runs.
+    """
+
+    def __init__(self, executor_factory: Callable[[str], object], parser, path: Optional[str] = None):
+        """
+        Args:
+            executor_factory: Called with the client's working directory,
+                returns the executor that runs one invocation
+            parser: argparse parser for the CLI subcommands
+            path: Socket path (default: `socket_path()`)
+        """
+        self.executor_factory = executor_factory
+        self.parser = parser
+        self.path = path or socket_path()
+        self._server = None
+
+    def run(self, argv: List[str], cwd: Optional[str] = None) -> Tuple[str, str, int]:
+        """
+        Parse and execute one invocation, returning its stdout, stderr and exit code.
+
+        Relative paths (session stores, config files) resolve against the
+        client's working directory, exactly as if it had run the command itself.
+        """
+        stdout, stderr = io.StringIO(), io.StringIO()
+        exit_code = 0
+        cwd = cwd or os.getcwd()
+
+        with _captured(stdout, stderr):
+            try:
+                args = self.parser.parse_args(argv)
+                if args.action is None or args.action in ('daemon', 'batch'):
+                    self.parser.print_usage()
+                    exit_code = 2
+                else:
+                    for option in _PATH_OPTIONS:
+                        value = getattr(args, option, None)
+                        if value and value != '-' and not os.path.isabs(value):
+                            setattr(args, option, os.path.join(cwd, value))
+
+                    executor = self.executor_factory(cwd)
+                    executor.out = stdout
+                    executor.err = stderr
+                    executor.processArgs(args)
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 1
+
+        return stdout.getvalue(), stderr.getvalue(), exit_code
+
+    def serve_forever(self) -> None:
+        """Bind the socket and serve until interrupted or `shutdown` is called."""
+        if os.path.exists(self.path):
+            # A leftover socket from a daemon that is no longer running
+            sock = _connect(self.path)
+            if sock is not None:
+                sock.close()
+                raise Exception(f"A daemon is already listening on {self.path}")
+            os.remove(self.path)
+
+        previous_umask = os.umask(0o177)
+        try:
+            self._server = socketserver.UnixStreamServer(self.path, _DaemonHandler)
+        finally:
+            os.umask(previous_umask)
+
+        self._server.hb_daemon = self
+        streams = (sys.stdout, sys.stderr)
+        sys.stdout, sys.stderr = _ThreadStreams(streams[0]), _ThreadStreams(streams[1])
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sys.stdout, sys.stderr = streams
+            self._server.server_close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def shutdown(self) -> None:
+        """Stop a daemon running `serve_forever` in another thread."""
+        if self._server is not None:
+            self._server.shutdown()
@@ -0,0 +1,70 @@
+import re
+import time
+from typing import Optional, Tuple
+
+
+_DURATION = re.compile(r'^\s*(\d+(?:\.\d*)?|\.\d+)\s*(ms|s|m)?\s*$')
+
+
+def parse_duration(value: Optional[str], name: str = 'duration') -> Optional[float]:
+    """
+    Seconds in a duration such as '2s', '500ms', '1m' or '1.5'.
+
+    Returns None for an empty value; raises ValueError for an invalid one.
+    """
+    if value is None or str(value).strip() == '':
+        return None
+
+    match = _DURATION.match(str(value))
+    if match is None:
+        raise ValueError(f"Invalid {name} '{value}', expected e.g. 2s, 500ms or 1m")
+
+    amount = float(match.group(1))
+    unit = match.group(2) or 's'
+    return amount * {'ms': 0.001, 's': 1.0, 'm': 60.0}[unit]
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a command runs out of its time budget."""
+    pass
+
+
+class Deadline:
+    """
+    Absolute time budget for a multi-step command.
+
+    Passed down to every request the command makes, so each one only waits
+    for whatever is left of the budget.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def parse(cls, value: Optional[str]) -> Optional['Deadline']:
+        """
+        Build a deadline from a duration such as '2s', '500ms', '1m' or '1.5'.
+
+        Returns None for an empty value; raises ValueError for an invalid one.
+        """
+        seconds = parse_duration(value, 'deadline')
+        return None if seconds is None else cls(seconds)
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self) -> None:
+        """Raise DeadlineExceeded if no time is left."""
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.seconds:g}s exceeded")
+
+    def cap(self, timeout: Tuple[float, float]) -> Tuple[float, float]:
+        """Shorten a (connect, read) timeout so neither outlasts the deadline."""
+        self.check()
+        remaining = self.remaining()
+        return (min(timeout[0], remaining), min(timeout[1], remaining))
@@ -0,0 +1,65 @@
+import os
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; locking becomes a no-op there
+    fcntl = None
+
+
+class FileLock:
+    """
+    Advisory lock on a file, shared between processes.
+
+    Uses flock(), so it also excludes other threads of the same process as
+    long as each one opens its own FileLock. Acquiring gives up after
+    `timeout` seconds and reports failure instead of blocking forever.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0, poll_interval: float = 0.05):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.acquired = False
+        self._fd: Optional[int] = None
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Try to take the lock within the timeout; returns whether it was taken."""
+        if fcntl is None:
+            return False
+
+        timeout = self.timeout if timeout is None else timeout
+        give_up_at = time.monotonic() + timeout
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        while True:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.acquired = True
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= give_up_at:
+                    os.close(self._fd)
+                    self._fd = None
+                    return False
+                time.sleep(self.poll_interval)
+
+    def release(self) -> None:
+        if self._fd is not None:
+            if self.acquired:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self.acquired = False
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
@@ -1,15 +1,243 @@
+import os
+import time
+import threading
+import types
 import requests
-import jsonref
+import urllib3
 import json
 
+from .accessory_cache import getAccessoryCache
+from .deadline import DeadlineExceeded
+from .resilience import RetryPolicy, CircuitOpenError, getCircuitBreaker, errorResponse
+from . import timings
+
+# process-wide cache of parsed swagger definitions, keyed by absolute file path
+_specCache = {}
+_specCacheLock = threading.Lock()
+
+def _freeze(value):
+    # recursively convert a parsed JSON document into read-only containers
+    if isinstance(value, dict):
+        return types.MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+# time spent establishing connections by the request running on this thread
+_connectTiming = threading.local()
+
+class _TimedHTTPConnection(urllib3.connection.HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connectTiming.seconds = getattr(_connectTiming, 'seconds', 0.0) + time.perf_counter() - start
+
+class _TimedHTTPSConnection(urllib3.connection.HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connectTiming.seconds = getattr(_connectTiming, 'seconds', 0.0) + time.perf_counter() - start
+
+class _TimedHTTPConnectionPool(urllib3.connectionpool.HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(urllib3.connectionpool.HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+# adapter whose connections report how long connecting (and the TLS handshake) took
+class _TimedAdapter(requests.adapters.HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+# process-wide registry of pooled keep-alive sessions, keyed by (host, port, secure)
+_sessionPool = {}
+_sessionPoolLock = threading.Lock()
+
+# get the shared session for a host, creating its connection pool on first use
+# and growing it if a client asks for more connections than it keeps
+def getSession(host, port=8581, secure=False, poolSize=10):
+    key = (host, int(port), bool(secure))
+    session = _sessionPool.get(key)
+
+    if session is None or session.poolSize < poolSize:
+        with _sessionPoolLock:
+            session = _sessionPool.get(key)
+
+            if session is None:
+                session = requests.Session()
+                session.poolSize = 0
+                _sessionPool[key] = session
+
+            if session.poolSize < poolSize:
+                # the replaced adapter's idle connections are closed; requests in flight finish on them
+                adapter = _TimedAdapter(pool_connections=1, pool_maxsize=poolSize)
+                previous = session.get_adapter("https://" if secure else "http://") if session.poolSize else None
+                session.mount("https://" if secure else "http://", adapter)
+                session.poolSize = poolSize
+                if previous is not None:
+                    previous.close()
+
+    return session
+
+# close every pooled session, e.g. before forking or on shutdown
+def closeSessions():
+    with _sessionPoolLock:
+        for session in _sessionPool.values():
+            session.close()
+        _sessionPool.clear()
+
+# GET requests currently in flight, keyed by (host, port, secure, path, authorization)
+_inflight = {}
+_inflightLock = threading.Lock()
+
+# accessory snapshots currently being fetched and built, keyed by (host, port, secure, access token)
+_snapshotFlights = {}
+
+class _Flight:
+    __slots__ = ('done', 'response', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+class hbRoute:
+    """Swagger operation compiled once into a template that a call only fills in."""
+    __slots__ = ('path', 'method', 'segments', 'staticPath', 'paramNames',
+                 'bodyRequired', 'contentType', 'securitySchemes')
+
+    def __init__(self, path, method, opDef):
+        self.path = path
+        self.method = method
+
+        # split the path into literal text and {parameter} placeholders
+        self.segments = []
+        rest = path
+        while True:
+            start = rest.find("{")
+            end = rest.find("}", start)
+            if start == -1 or end == -1:
+                break
+            if start > 0:
+                self.segments.append((False, rest[:start]))
+            self.segments.append((True, rest[start + 1:end]))
+            rest = rest[end + 1:]
+        if rest:
+            self.segments.append((False, rest))
+        self.segments = tuple(self.segments)
+
+        self.paramNames = frozenset(i['name'] for i in opDef.get('parameters', ()))
+        self.staticPath = path if len(self.paramNames) == 0 else None
+
+        # the body content type is the last one listed for the operation
+        self.bodyRequired = False
+        self.contentType = None
+        if 'requestBody' in opDef:
+            self.bodyRequired = opDef['requestBody'].get('required') == True
+            for key in opDef['requestBody'].get('content', {}).keys():
+                self.contentType = key
+
+        self.securitySchemes = frozenset(key.lower() for i in opDef.get('security', ()) for key in i.keys())
+
+    def buildPath(self, parameters):
+        if self.staticPath is not None:
+            return self.staticPath
+
+        if len(parameters) == 0:
+            raise Exception("Parameters are required for endpoint")
+
+        parts = []
+        for isParam, text in self.segments:
+            if isParam:
+                if text not in self.paramNames or text not in parameters:
+                    raise Exception("Problem processing parameters")
+                parts.append(str(parameters[text]))
+            else:
+                parts.append(text)
+
+        return "".join(parts)
+
+    def authHeader(self, authorization):
+        if not self.securitySchemes:
+            return None
+
+        if authorization == None:
+            raise Exception("Not authenticated")
+
+        tokenType = authorization['body']['token_type']
+        if tokenType.lower() in self.securitySchemes:
+            return tokenType + " " + authorization['body']['access_token']
+
+        return None
+
+class hbApiSpec:
+    """Immutable, pre-indexed view of the Homebridge UI swagger definition."""
+    __slots__ = ('path', 'swaggerDoc', 'operations', 'routes')
+
+    def __init__(self, path, swaggerDoc):
+        self.path = path
+        self.swaggerDoc = _freeze(swaggerDoc)
+
+        operations = {}
+        for opPath, methods in self.swaggerDoc.get('paths', {}).items():
+            for method, opDef in methods.items():
+                operations[(opPath, method.lower())] = opDef
+
+        self.operations = types.MappingProxyType(operations)
+        self.routes = types.MappingProxyType({key: hbRoute(key[0], key[1], opDef) for key, opDef in operations.items()})
+
+    def operation(self, path, method):
+        return self.operations.get((path, method.lower()))
+
+    def route(self, path, method):
+        return self.routes.get((path, method.lower()))
+
+# load the swagger definition once per process and share it between all clients
+def loadSpec(specPath="swagger.json"):
+    key = os.path.abspath(specPath)
+    spec = _specCache.get(key)
+
+    if spec is None:
+        with _specCacheLock:
+            spec = _specCache.get(key)
+
+            if spec is None:
+                with open(key, "r") as f:
+                    swaggerDef = json.loads(f.read())
+
+                spec = hbApiSpec(key, swaggerDef['swaggerDoc'])
+                _specCache[key] = spec
+
+    return spec
+
 class hbApi:
     apiJsonDef = None
     authorization = None
+    authRejected = False
+    spec = None
+    # optional SnapshotStore that keeps the last accessory list on disk
+    snapshotStore = None
+    # stream the client reports its errors on; None means sys.stdout
+    out = None
 
-    def __init__(self,host,port=8581,secure=False):
+    def __init__(self,host,port=8581,secure=False,specPath="swagger.json",poolSize=10,keepAlive=True,accessoryCacheTtl=5.0,connectTimeout=5.0,readTimeout=30.0,retryPolicy=None,coalesce=True,breakerStateDir=None,out=None):
         self.host = host
+        self.out = out
         self.port = port
         self.secure = secure
+        self.keepAlive = keepAlive
+        self.timeout = (connectTimeout, readTimeout)
+        self.deadline = None
+        self.retryPolicy = retryPolicy or RetryPolicy()
+        # shared with other processes through a file in breakerStateDir, if given
+        self.breaker = getCircuitBreaker(host, port, breakerStateDir)
+        self.coalesce = coalesce
+        self.session = getSession(host, port, secure, poolSize)
+        # the cache is shared by every client of the host, so each keeps its own TTL
+        self.accessoryCache = getAccessoryCache(host, port, secure)
+        self.accessoryCacheTtl = accessoryCacheTtl
+        self.baseUrl = ("http://" if secure == False else "https://") + host + ":" + str(port)
         self.typeMap = {"<class 'str'>":'string',
                         "<class 'int'>":'number',
                         "<class 'bool'>":'boolean'}
@@ -18,137 +246,285 @@ class hbApi:
             # pathToJson = "http://" + self.host + ":" + str(self.port) +"/swagger/json"
             #r = requests.get(pathToJson)
             #self.apiJsonDef = jsonref.loads(r.text)
-            
-            with open("swagger.json", "r") as f:
-                swaggerDef = json.loads(f.read())
 
-            self.apiJsonDef = swaggerDef['swaggerDoc']
+            self.spec = loadSpec(specPath)
+            self.apiJsonDef = self.spec.swaggerDoc
             
         except:
-            print("Unable to open Homebridge UI API JSON definition")
+            print("Unable to open Homebridge UI API JSON definition", file=self.out)
 
-    # apiRequest method to handle and validate all requests to an endpoint
-    def apiRequest(self, path, method, requestBody={}, parameters={}):
+    # apiRequest method to handle and validate all requests to an endpoint, within the optional (or client's) deadline
+    def apiRequest(self, path, method, requestBody={}, parameters={}, deadline=None):
+        started = time.perf_counter()
+        deadline = deadline or self.deadline
+        timing = {"method":method, "path":path, "status_code":None, "attempt":1}
         headers = {"accept":"*/*"}
+        route = None
+
+        if self.keepAlive == False:
+            headers['Connection'] = "close"
 
         try:
-            pathDef = self.apiJsonDef['paths'][path][method]
+            route = self.spec.route(path, method)
+            if route is None:
+                raise KeyError(path)
         except:
-            print("Path and method not found")
+            print("Path and method not found", file=self.out)
 
         try:
-            # process paramters
-            if 'parameters' in pathDef:
-                if len(pathDef['parameters']) > 0 and len(parameters) == 0:
-                    raise Exception("Parameters are required for endpoint")
-
-                for i in pathDef['parameters']:
-                    for key in parameters.keys():
-                        if i['name'] == key:
-                            path = path.replace("{"+key+"}",parameters[key])
-                
-                if path.find("{") != -1:
-                    raise Exception("Problem processing parameters")
+            if route is not None:
+                # fill in the pre-split path template
+                path = route.buildPath(parameters)
 
-            # process the body
-            if 'requestBody' in pathDef:
-                if pathDef['requestBody']['required'] == True and len(requestBody) == 0:
+                # check the body against the compiled requirements
+                if route.bodyRequired and len(requestBody) == 0:
                     raise Exception("requestBody required for endpoint")
-                
-                for key in pathDef['requestBody']['content'].keys():
-                    contentType = key
-                
-                # add the content type to the header
-                headers['Content-Type'] = contentType
-                
-                schemaDef = pathDef['requestBody']['content'][contentType]['schema']
-                
-                #for i in schemaDef['required']:
-                #    if i not in requestBody:
-                #        raise Exception("Missing required property '"+ i +"' in the requestBody")
-
-                #for key in requestBody.keys():
-                #    if key not in schemaDef['properties']:
-                #        raise Exception("'"+ key +"' is not an accepted property for this method")
-                    
-                    #turns out the schemaDef is not reliable for the required type
-                    #if self.typeMap[str(type(requestBody[key]))] != schemaDef['properties'][key]['type']:
-                        #raise Exception("Data type for '" + key + "' property is not correct: '"+ self.typeMap[str(type(requestBody[key]))] +"' provided, '" + schemaDef['properties'][key]['type'] +"' expected")
-
-            # process security
-            if 'security' in pathDef:
-                if self.authorization == None:
-                    raise Exception("Not authenticated")
-
-                for i in pathDef['security']:
-                    for key in i.keys():
-                        if self.authorization['body']['token_type'].lower() == key:
-                            headers['Authorization'] = self.authorization['body']['token_type'] + " " + self.authorization['body']['access_token']
+
+                if route.contentType is not None:
+                    headers['Content-Type'] = route.contentType
+
+                # add the authorization header if the route is secured
+                authHeader = route.authHeader(self.authorization)
+                if authHeader is not None:
+                    headers['Authorization'] = authHeader
 
         except Exception as inst:
-            print(str(inst))
+            print(str(inst), file=self.out)
 
         except:
-            print('Unkown error processing method')
+            print('Unkown error processing method', file=self.out)
+
+        # identical GETs already in flight from any client in this process share one response
+        if method == "get" and self.coalesce:
+            return self._coalesced(path, headers, deadline, started, timing)
+
+        return self._perform(method, path, requestBody, headers, deadline, started, timing)
+
+    # join the in-flight GET for the same URL and credentials, or make it and let others join
+    def _coalesced(self, path, headers, deadline, started, timing):
+        key = (self.host, int(self.port), bool(self.secure), path, headers.get('Authorization'))
+
+        with _inflightLock:
+            flight = _inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                _inflight[key] = flight
 
-        # compile all the details and then make the callout
+        if not leader:
+            if not flight.done.wait(None if deadline is None else deadline.remaining()):
+                return errorResponse(self.host, self.port, "Deadline exceeded", f"Deadline of {deadline.seconds:g}s exceeded")
+
+            if flight.response['status_code'] == 401 and 'Authorization' in headers:
+                self.authRejected = True
+            return dict(flight.response)
+
+        try:
+            flight.response = self._perform("get", path, {}, headers, deadline, started, timing)
+        finally:
+            with _inflightLock:
+                del _inflight[key]
+            if flight.response is None:
+                flight.response = errorResponse(self.host, self.port, "Request failed", "Coalesced request did not complete")
+            flight.done.set()
+
+        return flight.response
+
+    # compile all the details and then make the callout, retrying transient failures of idempotent methods
+    def _perform(self, method, path, requestBody, headers, deadline, started, timing):
         requestBodyString = json.dumps(requestBody)
-        protocol = "https://"
-        if self.secure == False: 
-            protocol = "http://"
-            
-        endpoint = protocol + self.host + ":" + str(self.port) + path
-        callout = None
+        endpoint = self.baseUrl + path
+        attempts = self.retryPolicy.attempts if self.retryPolicy.retryable(method) else 1
         response = None
 
-        try:
-            methods = {"post": requests.post,"get": requests.get, "put": requests.put, "delete":requests.delete}
-            # TODO: need to make option for configuring the certificate store 
-            callout = methods[method](url=endpoint, data=requestBodyString, headers=headers, verify="/etc/ssl/certs/ca-certificates.crt")
-            
-            response = {"status_code":callout.status_code,
-                        "host":self.host,
-                        "port":self.port,
-                        "body":json.loads(callout.text)}
+        for attempt in range(attempts):
+            if attempt > 0:
+                started = time.perf_counter()
+                timing = {"method":method, "path":timing['path'], "status_code":None, "attempt":attempt + 1}
+            retry = False
 
-        except Exception as inst:
-            print(inst)
+            try:
+                response = self._callout(method, endpoint, requestBodyString, headers, deadline, started, timing)
+                retry = response['status_code'] in self.retryPolicy.retryStatuses
+
+            except DeadlineExceeded as inst:
+                response = errorResponse(self.host, self.port, "Deadline exceeded", str(inst))
+
+            except CircuitOpenError as inst:
+                response = errorResponse(self.host, self.port, "Circuit open", str(inst))
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError) as inst:
+                if deadline is not None and deadline.expired():
+                    response = errorResponse(self.host, self.port, "Deadline exceeded", str(inst))
+                else:
+                    response = errorResponse(self.host, self.port, "Connection error", str(inst))
+                    retry = True
+
+            except Exception as inst:
+                response = errorResponse(self.host, self.port, "Request failed", str(inst))
+
+            timing['total'] = time.perf_counter() - started
+            timings.emit(timing)
+
+            if not retry or attempt + 1 == attempts:
+                break
+
+            # back off, but never past the deadline
+            delay = self.retryPolicy.delay(attempt)
+            if deadline is not None and deadline.remaining() <= delay:
+                break
+            time.sleep(delay)
 
-        except:
-            print("Unknown error with HTTP request")
-        
         return response
+
+    # make a single attempt at a prepared request and record its phase timings
+    def _callout(self, method, endpoint, requestBodyString, headers, deadline, started, timing):
+        if method not in ("post", "get", "put", "delete"):
+            raise Exception("Unsupported method: " + method)
+
+        timeout = self.timeout if deadline is None else deadline.cap(self.timeout)
+
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {self.host}:{self.port}, retry in {self.breaker.retryAfter():.1f}s")
+
+        # TODO: need to make option for configuring the certificate store 
+        _connectTiming.seconds = 0.0
+        sent = time.perf_counter()
+        timing['route'] = sent - started
+
+        try:
+            # stream so the headers arrive first and the body download can be timed on its own
+            callout = self.session.request(method.upper(), url=endpoint, data=requestBodyString, headers=headers, verify="/etc/ssl/certs/ca-certificates.crt", stream=True, timeout=timeout)
+            firstByte = time.perf_counter()
+            timing['status_code'] = callout.status_code
+            timing['connect'] = _connectTiming.seconds
+            timing['ttfb'] = firstByte - sent - _connectTiming.seconds
+
+            text = callout.text
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError):
+            # a timeout forced by the caller's deadline says nothing about the host's health
+            if deadline is not None and deadline.expired():
+                self.breaker.release()
+            else:
+                self.breaker.recordFailure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        downloaded = time.perf_counter()
+        timing['download'] = downloaded - firstByte
+
+        if callout.status_code in self.retryPolicy.retryStatuses:
+            self.breaker.recordFailure()
+        else:
+            self.breaker.recordSuccess()
+
+        # remember that the server refused our token so it gets re-checked
+        if callout.status_code == 401 and 'Authorization' in headers:
+            self.authRejected = True
+
+        try:
+            body = json.loads(text)
+        except ValueError:
+            body = {"error": "Invalid response body", "message": text[:200]}
+
+        timing['decode'] = time.perf_counter() - downloaded
+
+        return {"status_code":callout.status_code,
+                "host":self.host,
+                "port":self.port,
+                "body":body}
     
     # authorization
     def authorize(self,username,password,otp=""):
+        issuedAt = time.time()
         self.authorization = self.apiRequest("/api/auth/login","post",requestBody={"username":username,"password":password})
-        
+        self.authRejected = False
+
+        if self.authorization['status_code'] == 201:
+            # keep the login time so expires_in can be checked locally
+            self.authorization['issued_at'] = issuedAt
+
         if self.authorization['status_code'] != 201:
-            print("Error with authorization: "+ json.dumps(self.authorization['body']))
+            print("Error with authorization: "+ json.dumps(self.authorization['body']), file=self.out)
 
-    #helper method to find uniqueId for an accessory based on the serviceName
-    def findAccessoriesByName(self, name):
-        try: 
-            accessoryQuery = self.apiRequest("/api/accessories","get")
+    # get the accessory snapshot, downloading /api/accessories only when the cached one is older than maxAge (default: accessoryCacheTtl)
+    def getAccessorySnapshot(self, maxAge=None):
+        maxAge = self.accessoryCacheTtl if maxAge is None else maxAge
+        snapshot = self.accessoryCache.get(maxAge)
+        if snapshot is not None or not self.coalesce:
+            return snapshot or self._fetchAccessorySnapshot()
 
-            if accessoryQuery['status_code'] != 200:
-                message = "Callout error trying to find accessory:"+ json.dumps(accessory['body'])
-                raise Exception(message)
-            
-            else:
-                results = []
+        # concurrent callers share one download, one model build and one disk write
+        body = (self.authorization or {}).get('body')
+        key = (self.host, int(self.port), bool(self.secure), body.get('access_token') if isinstance(body, dict) else None)
 
-                for i in accessoryQuery['body']:
-                    if i['serviceName'] == name:
-                        results.append(i)
-                
-                if len(results) > 0:
-                    return results
+        with _inflightLock:
+            flight = _snapshotFlights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                _snapshotFlights[key] = flight
 
+        if not leader:
+            deadline = self.deadline
+            if not flight.done.wait(None if deadline is None else deadline.remaining()):
+                raise DeadlineExceeded(f"Deadline of {deadline.seconds:g}s exceeded")
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+
+        try:
+            # the previous flight may have finished since the cache was checked
+            flight.response = self.accessoryCache.get(maxAge) or self._fetchAccessorySnapshot()
         except Exception as inst:
-            print(inst)
+            flight.error = inst
+            raise
+        finally:
+            with _inflightLock:
+                del _snapshotFlights[key]
+            if flight.response is None and flight.error is None:
+                flight.error = Exception("Accessory snapshot fetch did not complete")
+            flight.done.set()
+
+        return flight.response
+
+    # download /api/accessories and make it the cached (and stored) snapshot
+    def _fetchAccessorySnapshot(self):
+        accessoryQuery = self.apiRequest("/api/accessories","get")
+
+        if accessoryQuery['status_code'] != 200:
+            raise Exception("Callout error trying to find accessory:"+ json.dumps(accessoryQuery['body']))
+
+        if self.snapshotStore is not None:
+            self.snapshotStore.save(accessoryQuery['body'])
+
+        return self.accessoryCache.put(accessoryQuery['body'])
+
+    # drop the cached accessory snapshot, call after writing to an accessory
+    def invalidateAccessories(self):
+        self.accessoryCache.invalidate()
+        if self.snapshotStore is not None:
+            self.snapshotStore.discard()
+
+    #helper method to find characteristics of the services with a serviceName by type, None if no service has that name
+    def findCharacteristics(self, name, charTypes, maxAge=None):
+        try:
+            snapshot = self.getAccessorySnapshot(maxAge)
+            if name not in snapshot.byName:
+                return None
+            return {charType: snapshot.findCharacteristics(name, charType) or [] for charType in charTypes}
+
+        except Exception as inst:
+            print(inst, file=self.out)
+
+    #helper method to find uniqueId for an accessory based on the serviceName
+    def findAccessoriesByName(self, name, maxAge=None):
+        try: 
+            return self.getAccessorySnapshot(maxAge).findByName(name)
+
+        except Exception as inst:
+            print(inst, file=self.out)
 
         except:
-            print("Unkown error trying to find accessory")
-    
-        
\ No newline at end of file
+            print("Unkown error trying to find accessory", file=self.out)
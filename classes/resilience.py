@@ -0,0 +1,209 @@
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .file_lock import FileLock
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit breaker is open."""
+    pass
+
+
+class RetryPolicy:
+    """
+    Retry with jittered exponential backoff for idempotent requests.
+
+    Only methods in `methods` are retried, after a connection error, a timeout
+    or one of `retryStatuses`. The wait before retry n is drawn uniformly from
+    [0, min(maxDelay, baseDelay * 2**n)] ("full jitter").
+    """
+
+    def __init__(self, attempts: int = 3, baseDelay: float = 0.2, maxDelay: float = 2.0,
+                 retryStatuses=(502, 503, 504), methods=('get', 'put', 'delete')):
+        self.attempts = attempts
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.retryStatuses = frozenset(retryStatuses)
+        self.methods = frozenset(methods)
+
+    def retryable(self, method: str) -> bool:
+        return method in self.methods
+
+    def delay(self, attempt: int) -> float:
+        """Backoff before retrying after the given (zero-based) attempt."""
+        return random.uniform(0, min(self.maxDelay, self.baseDelay * (2 ** attempt)))
+
+
+# a policy that never retries
+NO_RETRY = RetryPolicy(attempts=1)
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker.
+
+    After `failureThreshold` consecutive failures the circuit opens and calls
+    fail fast for `resetTimeout` seconds. Then a single trial call is let
+    through (half-open); its success closes the circuit, its failure reopens it.
+    A trial that ends without telling either way must call `release`; one that
+    never reports back is given up on after another `resetTimeout`.
+
+    With a `statePath`, the state is shared through that file by every
+    process using the host, so failures seen by separate one-shot CLI
+    invocations add up and trip the breaker for all of them. Each update
+    reads, changes and writes the file under an exclusive lock on
+    `statePath + '.lock'`, so concurrent invocations neither lose failures
+    nor each get a trial call.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    _persisted = ('state', 'failures', 'openedAt', 'trialStartedAt')
+    # seconds to wait for another process's update before going ahead regardless
+    lockTimeout = 2.0
+
+    def __init__(self, failureThreshold: int = 5, resetTimeout: float = 10.0, statePath: Optional[str] = None):
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.statePath = statePath
+        self.state = self.CLOSED
+        self.failures = 0
+        # wall-clock times, so they mean the same in every process sharing the state
+        self.openedAt = 0.0
+        self.trialStartedAt = 0.0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _update(self):
+        # the thread lock orders this process's threads, the file lock the other processes
+        with self._lock:
+            if self.statePath is None:
+                yield
+                return
+            with FileLock(self.statePath + '.lock', self.lockTimeout):
+                self._load()
+                yield
+
+    def _load(self) -> None:
+        # pick up what other processes recorded since
+        try:
+            with open(self.statePath, 'r') as f:
+                data = json.load(f)
+            for key in self._persisted:
+                setattr(self, key, data[key])
+        except FileNotFoundError:
+            self.state, self.failures = self.CLOSED, 0
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def _save(self) -> None:
+        if self.statePath is None:
+            return
+        from .concrete_providers import atomic_write
+        try:
+            os.makedirs(os.path.dirname(self.statePath) or '.', exist_ok=True)
+            atomic_write(self.statePath, json.dumps({key: getattr(self, key) for key in self._persisted}))
+        except OSError:
+            # the breaker keeps working for this process
+            pass
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now."""
+        with self._update():
+            if self.state == self.CLOSED:
+                return True
+            now = time.time()
+            if (self.state == self.OPEN and now - self.openedAt >= self.resetTimeout) or \
+                    (self.state == self.HALF_OPEN and now - self.trialStartedAt >= self.resetTimeout):
+                self.state = self.HALF_OPEN
+                self.trialStartedAt = now
+                self._save()
+                return True
+            return False
+
+    def retryAfter(self) -> float:
+        """Seconds until an open circuit lets a (further) trial call through."""
+        since = self.trialStartedAt if self.state == self.HALF_OPEN else self.openedAt
+        return max(0.0, self.resetTimeout - (time.time() - since))
+
+    def recordSuccess(self) -> None:
+        if self.state == self.CLOSED and self.failures == 0 and self.statePath is None:
+            return
+        with self._update():
+            if self.state != self.CLOSED or self.failures != 0:
+                self.state = self.CLOSED
+                self.failures = 0
+                self._save()
+
+    def release(self) -> None:
+        """End a call that says nothing about the host's health, freeing the trial slot if it held it."""
+        with self._update():
+            if self.state == self.HALF_OPEN:
+                # still open, but the next call may try again straight away
+                self.state = self.OPEN
+                self.openedAt = time.time() - self.resetTimeout
+                self._save()
+
+    def recordFailure(self) -> None:
+        with self._update():
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failureThreshold:
+                self.state = self.OPEN
+                self.openedAt = time.time()
+            self._save()
+
+
+# process-wide breakers, keyed by (host, port, state directory)
+_breakers: Dict[Tuple[str, int, Optional[str]], CircuitBreaker] = {}
+_breakersLock = threading.Lock()
+
+
+def getCircuitBreaker(host: str, port: int = 8581, stateDir: Optional[str] = None) -> CircuitBreaker:
+    """
+    Get the shared circuit breaker for a host, creating it on first use.
+
+    With `stateDir`, the breaker's state is kept in a file there and shared
+    with other processes; without it the breaker lives only in this process.
+    """
+    stateDir = None if stateDir is None else os.path.abspath(stateDir)
+    key = (host, int(port), stateDir)
+    breaker = _breakers.get(key)
+
+    if breaker is None:
+        with _breakersLock:
+            breaker = _breakers.get(key)
+            if breaker is None:
+                statePath = None
+                if stateDir is not None:
+                    from .resolution_cache import host_cache_path
+                    statePath = host_cache_path(stateDir, host, port, '.breaker.json')
+                breaker = CircuitBreaker(statePath=statePath)
+                _breakers[key] = breaker
+
+    return breaker
+
+
+def clearCircuitBreakers() -> None:
+    """Forget the in-memory state of every breaker; state files are left alone."""
+    with _breakersLock:
+        _breakers.clear()
+
+
+def errorResponse(host: str, port: int, error: str, message: str) -> Dict:
+    """
+    Response dict for a request that got no usable HTTP response.
+
+    Has the same shape as a real response so callers can check
+    `status_code` as usual; status_code 0 means no response was received.
+    """
+    return {"status_code": 0,
+            "host": host,
+            "port": port,
+            "body": {"error": error, "message": message}}
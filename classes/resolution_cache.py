@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from .concrete_providers import atomic_write
+
+DEFAULT_CACHE_DIR = '.hbCache'
+
+
+def host_cache_path(cache_dir: str, host: str, port: int, suffix: str) -> str:
+    """Path of a per-host cache file, with the host made safe for a file name."""
+    safe_host = "".join(c if c.isalnum() or c in '.-' else '_' for c in str(host))
+    return os.path.join(cache_dir, f"{safe_host}_{port}{suffix}")
+
+
+class ResolutionCache:
+    """
+    Persisted (serviceName, characteristicType) -> uniqueId map for one host.
+
+    Lets a write go straight to PUT /api/accessories/{uniqueId} without
+    downloading the accessory list first. The file is shared by every CLI
+    invocation; it is re-read whenever another process has replaced it and
+    written atomically, so concurrent updates at worst lose an entry.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, Dict[str, str]] = {}
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._entries, self._signature = {}, None
+            return
+
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature != self._signature:
+            try:
+                with open(self.path, 'r') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+            self._signature = signature
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            atomic_write(self.path, json.dumps(self._entries))
+            stat = os.stat(self.path)
+            self._signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            # the cache is only an optimisation; without it writes resolve as before
+            self._signature = None
+
+    def get(self, name: str, charType: str) -> Optional[str]:
+        """The cached uniqueId for a service name and characteristic type, if any."""
+        with self._lock:
+            self._refresh()
+            return self._entries.get(name, {}).get(charType)
+
+    def put(self, name: str, charType: str, uniqueId: str) -> None:
+        """Remember where a service name and characteristic type resolved to."""
+        with self._lock:
+            self._refresh()
+            if self._entries.get(name, {}).get(charType) != uniqueId:
+                self._entries.setdefault(name, {})[charType] = uniqueId
+                self._save()
+
+    def discard(self, name: str, charType: str) -> None:
+        """Forget an entry, e.g. after the accessory it points to returned 404."""
+        with self._lock:
+            self._refresh()
+            types = self._entries.get(name)
+            if types is not None and types.pop(charType, None) is not None:
+                if not types:
+                    del self._entries[name]
+                self._save()
+
+
+# process-wide caches, keyed by file path
+_caches: Dict[str, ResolutionCache] = {}
+_cachesLock = threading.Lock()
+
+
+def getResolutionCache(cache_dir: str, host: str, port: int = 8581) -> ResolutionCache:
+    """Get the shared resolution cache for a host, creating it on first use."""
+    path = os.path.abspath(host_cache_path(cache_dir, host, port, '.resolve.json'))
+    cache = _caches.get(path)
+
+    if cache is None:
+        with _cachesLock:
+            cache = _caches.get(path)
+            if cache is None:
+                cache = ResolutionCache(path)
+                _caches[path] = cache
+
+    return cache
+
+
+def clearResolutionCaches() -> None:
+    """Forget the in-memory copies; the files are left alone."""
+    with _cachesLock:
+        _caches.clear()
@@ -0,0 +1,83 @@
+"""
+Background refresh of a host's saved accessory snapshot.
+
+A one-shot CLI process that answered from a stale snapshot hands the refresh
+to a detached `python -m classes.snapshot_refresh` child, so it can exit
+without waiting for the download. The client settings, token included,
+reach the child as JSON on stdin rather than on its command line, where
+other users could read them.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict
+
+from . import hbApi
+from .file_lock import FileLock
+from .snapshot_store import SnapshotStore
+
+# directory holding the classes package, for the child's import path
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def refresh_snapshot(hb: hbApi.hbApi) -> None:
+    """Download a host's accessory list into its caches, unless another invocation already is."""
+    store = hb.snapshotStore
+    lock = FileLock(store.path + '.lock') if store is not None else None
+    if lock is not None and not lock.acquire(timeout=0):
+        return
+
+    try:
+        hb.getAccessorySnapshot(maxAge=0)
+    except Exception:
+        # the old snapshot keeps being served until it is too stale, then reads fetch it themselves
+        pass
+    finally:
+        if lock is not None:
+            lock.release()
+
+
+def spawn_refresh(request: Dict[str, Any]) -> subprocess.Popen:
+    """
+    Start a detached process that refreshes one host's saved snapshot, without waiting for it.
+
+    Args:
+        request: host, port, secure, authorization, snapshotPath, and
+            optionally specPath, connectTimeout, readTimeout and
+            breakerStateDir; paths must be absolute
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in (_ROOT, env.get('PYTHONPATH')) if p)
+
+    # a session of its own, so the child outlives the terminal and shell the CLI ran in
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'classes.snapshot_refresh'],
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env=env, start_new_session=True
+    )
+    process.stdin.write(json.dumps(request).encode())
+    process.stdin.close()
+    return process
+
+
+def main() -> None:
+    request = json.load(sys.stdin)
+
+    hb = hbApi.hbApi(
+        request['host'],
+        request['port'],
+        request['secure'],
+        specPath=request.get('specPath', 'swagger.json'),
+        connectTimeout=request.get('connectTimeout', 5.0),
+        readTimeout=request.get('readTimeout', 30.0),
+        breakerStateDir=request.get('breakerStateDir')
+    )
+    hb.authorization = request['authorization']
+    hb.snapshotStore = SnapshotStore(request['snapshotPath'])
+    refresh_snapshot(hb)
+
+
+if __name__ == '__main__':
+    main()
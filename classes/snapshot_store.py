@@ -0,0 +1,51 @@
+import marshal
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .concrete_providers import atomic_write
+
+# marshal's format can change between Python versions, so files written by another one are ignored
+_HEADER = ('hbSnapshot', 1, tuple(sys.version_info[:2]))
+
+
+class SnapshotStore:
+    """
+    The last /api/accessories payload for one host, kept on disk between invocations.
+
+    Stored with marshal, which loads a large payload several times faster
+    than JSON. A missing, corrupt or foreign file reads as no snapshot.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[Tuple[float, List[Dict[str, Any]]]]:
+        """Return (unix time saved, payload), or None if there is no usable snapshot."""
+        try:
+            with open(self.path, 'rb') as f:
+                data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if not isinstance(data, tuple) or len(data) != 3 or data[0] != _HEADER:
+            return None
+        return data[1], data[2]
+
+    def save(self, payload: List[Dict[str, Any]], savedAt: Optional[float] = None) -> bool:
+        """Replace the stored snapshot; returns whether it was written."""
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            atomic_write(self.path, marshal.dumps((_HEADER, time.time() if savedAt is None else savedAt, payload)))
+            return True
+        except (OSError, ValueError):
+            # the snapshot is only an optimisation; reads fall back to the network
+            return False
+
+    def discard(self) -> None:
+        """Remove the stored snapshot, e.g. after writing to an accessory."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
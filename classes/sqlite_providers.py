@@ -0,0 +1,200 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+from .auth_providers import StorageProvider, UserSessionProvider
+from .concrete_providers import token_expires_at
+
+DEFAULT_DATABASE = '.hbCli.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    host TEXT,
+    data TEXT NOT NULL,
+    expires_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
+CREATE INDEX IF NOT EXISTS sessions_host ON sessions (host);
+CREATE TABLE IF NOT EXISTS user_sessions (
+    username TEXT NOT NULL,
+    host TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    PRIMARY KEY (username, host)
+);
+CREATE INDEX IF NOT EXISTS user_sessions_session_id ON user_sessions (session_id);
+"""
+
+
+class _SQLiteDatabase:
+    """
+    Per-thread connections to one SQLite database file.
+
+    The database runs in WAL mode so readers never block the writer, and
+    every connection waits up to busy_timeout for locks held by other
+    processes instead of failing straight away.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None:
+            # autocommit; each statement is its own transaction
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+
+            self._local.conn = conn
+
+        return conn
+
+    def close(self) -> None:
+        """Close the calling thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class SQLiteStorageProvider(StorageProvider):
+    """SQLite-backed storage provider for session data, safe for concurrent processes."""
+
+    def __init__(self, db_path: str = DEFAULT_DATABASE, busy_timeout: float = 5.0):
+        self.db = _SQLiteDatabase(db_path, busy_timeout)
+
+    def save_session(self, session_id: str, auth_data: Dict[str, Any]) -> bool:
+        """Insert or replace a session row."""
+        try:
+            self.db.connection().execute(
+                "INSERT OR REPLACE INTO sessions (session_id, host, data, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, auth_data.get('host'), json.dumps(auth_data), token_expires_at(auth_data), time.time())
+            )
+            return True
+        except Exception as e:
+            print(f"Error saving session {session_id}: {e}")
+            return False
+
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Load session data by primary key."""
+        try:
+            row = self.db.connection().execute(
+                "SELECT data FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            return json.loads(row[0]) if row is not None else None
+        except Exception as e:
+            print(f"Error loading session {session_id}: {e}")
+            return None
+
+    def delete_session(self, session_id: str) -> bool:
+        """Delete a session row."""
+        try:
+            self.db.connection().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            return True
+        except Exception as e:
+            print(f"Error deleting session {session_id}: {e}")
+            return False
+
+    def list_sessions(self) -> List[str]:
+        """List all session IDs."""
+        try:
+            return [row[0] for row in self.db.connection().execute("SELECT session_id FROM sessions")]
+        except Exception as e:
+            print(f"Error listing sessions: {e}")
+            return []
+
+    def session_exists(self, session_id: str) -> bool:
+        """Check if a session row exists."""
+        try:
+            row = self.db.connection().execute(
+                "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            return row is not None
+        except Exception as e:
+            print(f"Error checking session {session_id}: {e}")
+            return False
+
+    def list_expired_sessions(self, now: Optional[float] = None) -> List[str]:
+        """
+        List the sessions whose token has expired, using the expiry index.
+
+        Args:
+            now: Unix timestamp to compare against (default: current time)
+
+        Returns:
+            List of session IDs
+        """
+        try:
+            return [row[0] for row in self.db.connection().execute(
+                "SELECT session_id FROM sessions WHERE expires_at <= ?",
+                (time.time() if now is None else now,)
+            )]
+        except Exception as e:
+            print(f"Error listing expired sessions: {e}")
+            return []
+
+
+class SQLiteUserSessionProvider(UserSessionProvider):
+    """SQLite-backed provider for user-to-session mappings."""
+
+    def __init__(self, db_path: str = DEFAULT_DATABASE, busy_timeout: float = 5.0):
+        self.db = _SQLiteDatabase(db_path, busy_timeout)
+
+    def get_session_id(self, username: str, host: str) -> Optional[str]:
+        """Get the session ID for a user@host combination."""
+        try:
+            row = self.db.connection().execute(
+                "SELECT session_id FROM user_sessions WHERE username = ? AND host = ?", (username, host)
+            ).fetchone()
+            return row[0] if row is not None else None
+        except Exception as e:
+            print(f"Error getting session ID for {username}@{host}: {e}")
+            return None
+
+    def set_session_id(self, username: str, host: str, session_id: str) -> bool:
+        """Set the session ID for a user@host combination."""
+        try:
+            self.db.connection().execute(
+                "INSERT OR REPLACE INTO user_sessions (username, host, session_id) VALUES (?, ?, ?)",
+                (username, host, session_id)
+            )
+            return True
+        except Exception as e:
+            print(f"Error setting session ID for {username}@{host}: {e}")
+            return False
+
+    def remove_user_session(self, username: str, host: str) -> bool:
+        """Remove the session mapping for a user@host combination."""
+        try:
+            self.db.connection().execute(
+                "DELETE FROM user_sessions WHERE username = ? AND host = ?", (username, host)
+            )
+            return True
+        except Exception as e:
+            print(f"Error removing session for {username}@{host}: {e}")
+            return False
+
+    def list_user_sessions(self) -> List[Tuple[str, str, str]]:
+        """List all user@host mappings."""
+        try:
+            return [tuple(row) for row in self.db.connection().execute(
+                "SELECT username, host, session_id FROM user_sessions"
+            )]
+        except Exception as e:
+            print(f"Error listing user sessions: {e}")
+            return []
@@ -0,0 +1,77 @@
+import sys
+import threading
+from typing import Dict, Any, Callable, List, Optional, TextIO
+
+# phases recorded for every hbApi.apiRequest call, in order
+PHASES = ('route', 'connect', 'ttfb', 'download', 'decode')
+
+# process-wide callbacks, each called with the timing record of every request
+_callbacks: List[Callable[[Dict[str, Any]], None]] = []
+_callbacksLock = threading.Lock()
+
+
+def addTimingCallback(callback: Callable[[Dict[str, Any]], None]) -> None:
+    """
+    Register a callback for per-request phase timings.
+
+    The callback receives a dict with 'method', 'path', 'status_code',
+    'attempt', 'total' and one entry per phase in PHASES, all durations in
+    seconds. A retried request produces one record per attempt.
+    """
+    with _callbacksLock:
+        _callbacks.append(callback)
+
+
+def removeTimingCallback(callback: Callable[[Dict[str, Any]], None]) -> None:
+    """Unregister a callback added with addTimingCallback."""
+    with _callbacksLock:
+        if callback in _callbacks:
+            _callbacks.remove(callback)
+
+
+def emit(record: Dict[str, Any]) -> None:
+    """Pass a timing record to every registered callback."""
+    for callback in list(_callbacks):
+        try:
+            callback(record)
+        except Exception as inst:
+            print("Timing callback failed: " + str(inst), file=sys.stderr)
+
+
+class TimingRecorder:
+    """Collects timing records and prints them as a table, e.g. for --timings."""
+
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def __enter__(self) -> 'TimingRecorder':
+        addTimingCallback(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        removeTimingCallback(self)
+
+    def summary(self, stream: Optional[TextIO] = None) -> None:
+        """Print one row per request plus a total row, in milliseconds."""
+        stream = stream or sys.stderr
+        columns = PHASES + ('total',)
+        stream.write(f"{'request':<40}{'status':>7}" + "".join(f"{c:>10}" for c in columns) + "\n")
+
+        totals = dict.fromkeys(columns, 0.0)
+        for record in self.records:
+            label = f"{record['method'].upper()} {record['path']}"
+            if len(label) > 39:
+                label = label[:36] + "..."
+            stream.write(f"{label:<40}{str(record.get('status_code')):>7}")
+            for column in columns:
+                totals[column] += record.get(column, 0.0)
+                stream.write(f"{record.get(column, 0.0) * 1000:>10.2f}")
+            stream.write("\n")
+
+        stream.write(f"{'total (' + str(len(self.records)) + ' requests)':<40}{'':>7}")
+        stream.write("".join(f"{totals[c] * 1000:>10.2f}" for c in columns) + "\n")
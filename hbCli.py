@@ -1,24 +1,81 @@
-import argparse
-import json
+import os
+import sys
+import time
 
-from classes.cliExecutorRefactored import create_default_executor
-thisExec = create_default_executor()
+# HBCLI_STARTUP_REPORT=1 prints how long each startup phase took to stderr
+startupReport = os.environ.get('HBCLI_STARTUP_REPORT') not in (None, '', '0')
+phases = []
+phaseStart = time.perf_counter()
+phaseModules = len(sys.modules)
+
+def phase(name):
+    global phaseStart, phaseModules
+    now = time.perf_counter()
+    phases.append((name, now - phaseStart, len(sys.modules) - phaseModules))
+    phaseStart = now
+    phaseModules = len(sys.modules)
+
+def report():
+    if startupReport:
+        sys.stderr.write("hbCli startup phase      time (ms)  new modules\n")
+        for name, elapsed, modules in phases:
+            sys.stderr.write(f"{name:<24} {elapsed * 1000:9.2f}  {modules:11d}\n")
+        sys.stderr.write(f"{'total':<24} {sum(p[1] for p in phases) * 1000:9.2f}  {len(sys.modules):11d}\n")
+
+# imported once the timer is running, so its cost shows up in the report
+from classes import daemon
+phase("daemon import")
 
-# parse command line arguments
-clFile = "commands.json"
-with open(clFile, "r") as f:
-    commandList = json.loads(f.read())
+# hand the invocation to a running daemon if there is one; streamed output (batches, ndjson) always runs here
+argv = sys.argv[1:]
+if not daemon.runs_locally(argv):
+    forwarded = daemon.forward(argv)
+    if forwarded is not None:
+        phase("daemon round trip")
+        report()
+        sys.stdout.write(forwarded[0])
+        sys.stderr.write(forwarded[1])
+        sys.exit(forwarded[2])
+phase("daemon probe")
 
-parser = argparse.ArgumentParser()
-subparsers = parser.add_subparsers(dest='action',title='actions')
+from classes.command_spec import load_command_spec, build_parser
+
+# parse command line arguments, only building the subcommand being run
+clFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "commands.json")
+commandList = load_command_spec(clFile)
+phase("command spec")
+
+parser = build_parser(commandList, only=argv[0] if argv and argv[0] != 'daemon' else None)
+try:
+    args = parser.parse_args(argv)
+except SystemExit:
+    # --help and argument errors finish here, before anything heavy is imported
+    phase("argument parsing")
+    report()
+    raise
+phase("argument parsing")
+
+# the executor pulls in requests, so it is only imported once there is work to do
+from classes.cliExecutorRefactored import create_default_executor
+thisExec = create_default_executor()
+thisExec.command_list = commandList
+phase("executor import")
 
-subparserParser = {}
+if args.action == 'daemon':
+    # stay resident and serve invocations over the unix socket until stopped, each with its client's directory
+    import signal
 
-for i in commandList:
-    subparserParser[i[0][0]] = subparsers.add_parser(*i[0], **i[1])
-    for c in i[2]:
-        subparserParser[i[0][0]].add_argument(*c[0],**c[1])
+    def daemonExecutor(cwd):
+        executor = create_default_executor(cwd)
+        executor.command_list = commandList
+        executor.live_mirror = args.liveMirror
+        return executor
 
-# process command line arguments
-args = parser.parse_args()
-thisExec.processArgs(args)
\ No newline at end of file
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    daemon.hbCliDaemon(daemonExecutor, parser, args.socketPath).serve_forever()
+else:
+    # a refresh started by a stale read must not keep this one-shot process alive
+    thisExec.detach_refresh = True
+    thisExec.processArgs(args)
+    phase("action")
+    report()
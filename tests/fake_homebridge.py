@@ -0,0 +1,352 @@
+"""
+Local stand-in for the Homebridge UI REST API, used by the tests.
+
+Serves a configurable number of accessories over keep-alive HTTP/1.1 with an
+optional per-request latency, and records every request it receives. The
+socket.io `/accessories` namespace is served over a websocket on the same port.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+SWAGGER_DOC = {
+    'paths': {
+        '/api/auth/login': {
+            'post': {
+                'requestBody': {
+                    'required': True,
+                    'content': {'application/json': {'schema': {'type': 'object'}}}
+                }
+            }
+        },
+        '/api/auth/check': {
+            'get': {'security': [{'bearer': []}]}
+        },
+        '/api/accessories': {
+            'get': {'security': [{'bearer': []}]}
+        },
+        '/api/accessories/{uniqueId}': {
+            'get': {
+                'parameters': [{'name': 'uniqueId', 'required': True, 'in': 'path'}],
+                'security': [{'bearer': []}]
+            },
+            'put': {
+                'parameters': [{'name': 'uniqueId', 'required': True, 'in': 'path'}],
+                'requestBody': {
+                    'required': True,
+                    'content': {'application/json': {'schema': {'type': 'object'}}}
+                },
+                'security': [{'bearer': []}]
+            }
+        }
+    }
+}
+
+
+def write_swagger(directory: str) -> str:
+    """Write a minimal swagger.json into the given directory and return its path."""
+    path = os.path.join(directory, 'swagger.json')
+    with open(path, 'w') as f:
+        json.dump({'swaggerDoc': SWAGGER_DOC}, f)
+    return path
+
+
+def make_token(expires_in: int = 28800, issued_at: Optional[float] = None) -> str:
+    """Build an unsigned JWT carrying iat/exp claims like Homebridge UI issues."""
+    issued_at = int(issued_at if issued_at is not None else time.time())
+
+    def encode(data: Dict[str, Any]) -> str:
+        raw = json.dumps(data, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+    header = encode({'alg': 'HS256', 'typ': 'JWT'})
+    payload = encode({'username': 'admin', 'admin': True, 'iat': issued_at, 'exp': issued_at + expires_in})
+    return f"{header}.{payload}.signature"
+
+
+def make_accessories(count: int) -> List[Dict[str, Any]]:
+    """Build `count` lightbulb services in the /api/accessories payload format."""
+    accessories = []
+    for i in range(count):
+        name = f"Light {i}"
+        characteristics = []
+        for iid, (char_type, fmt, value) in enumerate((('On', 'bool', 0), ('Brightness', 'int', 100)), start=10):
+            characteristics.append({
+                'aid': i + 2,
+                'iid': iid,
+                'uuid': f"0000{iid:04X}-0000-1000-8000-0026BB765291",
+                'type': char_type,
+                'serviceType': 'Lightbulb',
+                'serviceName': name,
+                'description': char_type,
+                'value': value,
+                'format': fmt,
+                'perms': ['ev', 'pr', 'pw'],
+                'canRead': True,
+                'canWrite': True,
+                'ev': True
+            })
+        accessories.append({
+            'aid': i + 2,
+            'iid': 9,
+            'uuid': '00000043-0000-1000-8000-0026BB765291',
+            'type': 'Lightbulb',
+            'humanType': 'Lightbulb',
+            'serviceName': name,
+            'serviceCharacteristics': characteristics,
+            'accessoryInformation': {
+                'Manufacturer': 'Fake',
+                'Model': 'Bulb',
+                'Name': name,
+                'Serial Number': str(i),
+                'Firmware Revision': '1.0'
+            },
+            'values': {c['type']: c['value'] for c in characteristics},
+            'instance': {
+                'name': 'Homebridge',
+                'username': '0E:00:00:00:00:01',
+                'ipAddress': '127.0.0.1',
+                'port': 51826,
+                'services': [],
+                'connectionFailedCount': 0
+            },
+            'uniqueId': hashlib.sha256(name.encode()).hexdigest()
+        })
+    return accessories
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Any) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self) -> bool:
+        header = self.headers.get('Authorization', '')
+        return header == f"Bearer {self.server.fake.token}"
+
+    def _handle(self, method: str) -> None:
+        fake = self.server.fake
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        body = json.loads(raw) if raw else {}
+
+        with fake.lock:
+            fake.requests.append((method, self.path))
+            fake.arrivals.append(time.monotonic())
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        with fake.lock:
+            failure = fake.failures.pop(0) if fake.failures else None
+        if failure is not None:
+            self._send(failure, {'error': 'Service Unavailable', 'message': 'Injected failure'})
+            return
+
+        if method == 'POST' and self.path == '/api/auth/login':
+            if body.get('username') == fake.username and body.get('password') == fake.password:
+                self._send(201, {'access_token': fake.token, 'token_type': 'Bearer', 'expires_in': fake.expires_in})
+            else:
+                self._send(401, {'error': 'Unauthorized', 'message': 'Invalid credentials'})
+            return
+
+        if not self._authorized():
+            self._send(401, {'error': 'Unauthorized', 'message': 'Unauthorized'})
+            return
+
+        if method == 'GET' and self.path == '/api/auth/check':
+            self._send(200, {'status': 'OK'})
+        elif method == 'GET' and self.path == '/api/accessories':
+            with fake.lock:
+                self._send(200, fake.accessories)
+        elif self.path.startswith('/api/accessories/'):
+            unique_id = self.path[len('/api/accessories/'):]
+            with fake.lock:
+                service = fake.by_id.get(unique_id)
+                if service is None:
+                    self._send(404, {'error': 'Not Found', 'message': 'Accessory not found'})
+                elif method == 'GET':
+                    self._send(200, service)
+                else:
+                    for characteristic in service['serviceCharacteristics']:
+                        if characteristic['type'] == body.get('characteristicType'):
+                            characteristic['value'] = body.get('value')
+                            service['values'][characteristic['type']] = body.get('value')
+                    self._send(200, service)
+        else:
+            self._send(404, {'error': 'Not Found', 'message': f"Cannot {method} {self.path}"})
+
+    def _ws_send(self, text: str) -> None:
+        payload = text.encode()
+        length = len(payload)
+        if length < 126:
+            header = bytes([0x81, length])
+        elif length < 65536:
+            header = bytes([0x81, 126]) + struct.pack('!H', length)
+        else:
+            header = bytes([0x81, 127]) + struct.pack('!Q', length)
+        with self._ws_lock:
+            self.wfile.write(header + payload)
+            self.wfile.flush()
+
+    def _ws_recv(self) -> Optional[str]:
+        head = self.rfile.read(2)
+        if len(head) < 2 or head[0] & 0x0F == 0x8:
+            return None
+        length = head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self.rfile.read(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self.rfile.read(8))[0]
+        mask = self.rfile.read(4)
+        payload = self.rfile.read(length)
+        return bytes(b ^ mask[i % 4] for i, b in enumerate(payload)).decode()
+
+    def _socket_io(self) -> None:
+        """Serve the socket.io /accessories namespace over a websocket."""
+        fake = self.server.fake
+        if f"token={fake.token}" not in self.path:
+            self._send(401, {'error': 'Unauthorized', 'message': 'Unauthorized'})
+            return
+
+        key = self.headers['Sec-WebSocket-Key']
+        accept = base64.b64encode(hashlib.sha1((key + '258EAFA5-E914-47DA-95CA-C5AB0DC85B11').encode()).digest()).decode()
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.close_connection = True
+        self._ws_lock = threading.Lock()
+
+        self._ws_send('0' + json.dumps({'sid': 'fake', 'upgrades': [], 'pingInterval': 25000, 'pingTimeout': 20000}))
+        try:
+            while True:
+                packet = self._ws_recv()
+                if packet is None:
+                    break
+                if packet.startswith('40/accessories,'):
+                    self._ws_send('40/accessories,' + json.dumps({'sid': 'fake-ns'}))
+                elif packet.startswith('42/accessories,'):
+                    event = json.loads(packet[len('42/accessories,'):])
+                    if event[0] == 'get-accessories':
+                        with fake.lock:
+                            self._ws_send('42/accessories,' + json.dumps(['accessories-data', fake.accessories]))
+                            fake.sockets.append(self)
+        except OSError:
+            pass
+        finally:
+            with fake.lock:
+                if self in fake.sockets:
+                    fake.sockets.remove(self)
+
+    def do_GET(self):
+        if self.path.startswith('/socket.io/') and self.headers.get('Upgrade', '').lower() == 'websocket':
+            self._socket_io()
+            return
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+
+class FakeHomebridge:
+    """Threaded fake Homebridge UI server bound to an ephemeral localhost port."""
+
+    def __init__(self, accessory_count: int = 5, latency: float = 0.0,
+                 username: str = 'admin', password: str = 'admin', expires_in: int = 28800):
+        self.latency = latency
+        self.username = username
+        self.password = password
+        self.expires_in = expires_in
+        self.token = make_token(expires_in)
+        self.accessories = make_accessories(accessory_count)
+        self.by_id = {a['uniqueId']: a for a in self.accessories}
+        self.requests = []
+        # time.monotonic() at which each of `requests` arrived
+        self.arrivals = []
+        self.sockets = []
+        self.failures = []
+        self.lock = threading.Lock()
+        self.host = '127.0.0.1'
+        self.port = None
+        self._server = None
+        self._thread = None
+
+    def start(self) -> 'FakeHomebridge':
+        self._server = ThreadingHTTPServer((self.host, 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def push(self, unique_id: str, char_type: str, value: Any) -> None:
+        """Change a characteristic and push it to socket.io subscribers, as Homebridge does."""
+        with self.lock:
+            service = self.by_id[unique_id]
+            for characteristic in service['serviceCharacteristics']:
+                if characteristic['type'] == char_type:
+                    characteristic['value'] = value
+            service['values'][char_type] = value
+            message = '42/accessories,' + json.dumps(['accessories-data', [service]])
+            for subscriber in list(self.sockets):
+                subscriber._ws_send(message)
+
+    def fail_next(self, count: int, status: int = 503) -> None:
+        """Answer the next `count` requests with the given error status."""
+        with self.lock:
+            self.failures.extend([status] * count)
+
+    def count(self, method: str, path: str) -> int:
+        """Number of requests received for the given method and path."""
+        with self.lock:
+            return sum(1 for r in self.requests if r == (method, path))
+
+    def arrived(self, method: str, path: str) -> List[float]:
+        """Arrival times (time.monotonic()) of the requests for the given method and path."""
+        with self.lock:
+            return [t for r, t in zip(self.requests, self.arrivals) if r == (method, path)]
+
+    def session_data(self) -> Dict[str, Any]:
+        """Stored-session dictionary as the executor would save it after login."""
+        return {
+            'status_code': 201,
+            'host': self.host,
+            'port': self.port,
+            'secure': False,
+            'body': {'access_token': self.token, 'token_type': 'Bearer', 'expires_in': self.expires_in}
+        }
+
+    def __enter__(self) -> 'FakeHomebridge':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,108 @@
+"""
+Tests for the accessory snapshot cache.
+"""
+
+import unittest
+import tempfile
+import shutil
+import os
+import time
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes import hbApi
+from classes.accessory_cache import AccessoryCache, AccessorySnapshot, clearAccessoryCaches
+from tests.fake_homebridge import FakeHomebridge, make_accessories, write_swagger
+
+
+class TestAccessorySnapshot(unittest.TestCase):
+    """Test the snapshot name index."""
+    
+    def test_find_by_name(self):
+        """Test serviceName lookups."""
+        snapshot = AccessorySnapshot(make_accessories(3))
+        found = snapshot.findByName('Light 1')
+        self.assertEqual([s['serviceName'] for s in found], ['Light 1'])
+        self.assertIsNone(snapshot.findByName('Missing'))
+    
+    def test_find_characteristics(self):
+        """Test (serviceName, type) lookups, including repeated service names."""
+        payload = make_accessories(3)
+        payload.append(dict(make_accessories(2)[1], uniqueId='second'))
+        snapshot = AccessorySnapshot(payload)
+        
+        matches = snapshot.findCharacteristics('Light 1', 'Brightness')
+        self.assertEqual([(s.uniqueId, c.type) for s, c in matches],
+                         [(payload[1]['uniqueId'], 'Brightness'), ('second', 'Brightness')])
+        self.assertIsNone(snapshot.findCharacteristics('Light 1', 'Hue'))
+        self.assertIsNone(snapshot.findCharacteristics('Missing', 'On'))
+
+
+class TestAccessoryCache(unittest.TestCase):
+    """Test TTL handling and invalidation."""
+    
+    def test_ttl_expiry(self):
+        """Test that snapshots expire after the TTL."""
+        cache = AccessoryCache(ttl=0.05)
+        cache.put(make_accessories(1))
+        self.assertIsNotNone(cache.get())
+        time.sleep(0.06)
+        self.assertIsNone(cache.get())
+    
+    def test_zero_ttl_disables_cache(self):
+        """Test that a TTL of zero never serves a cached snapshot."""
+        cache = AccessoryCache(ttl=0)
+        cache.put(make_accessories(1))
+        self.assertIsNone(cache.get())
+    
+    def test_invalidate(self):
+        """Test explicit invalidation."""
+        cache = AccessoryCache(ttl=60)
+        cache.put(make_accessories(1))
+        cache.invalidate()
+        self.assertIsNone(cache.get())
+
+
+class TestFindAccessoriesByName(unittest.TestCase):
+    """Test that hbApi lookups are served from the cache."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.server = FakeHomebridge(accessory_count=5).start()
+        self.hb = hbApi.hbApi(self.server.host, self.server.port, specPath=write_swagger(self.temp_dir))
+        self.hb.authorization = self.server.session_data()
+    
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+        clearAccessoryCaches()
+    
+    def test_lookups_share_one_download(self):
+        """Test that repeated lookups download the accessory list once."""
+        self.assertEqual(len(self.hb.findAccessoriesByName('Light 0')), 1)
+        self.assertEqual(len(self.hb.findAccessoriesByName('Light 4')), 1)
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 1)
+    
+    def test_invalidate_forces_download(self):
+        """Test that invalidation after a write refetches the list."""
+        self.hb.findAccessoriesByName('Light 0')
+        self.hb.invalidateAccessories()
+        self.hb.findAccessoriesByName('Light 0')
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 2)
+    
+    def test_ttl_per_client(self):
+        """Test that a later client's TTL applies even though the cache is shared."""
+        self.hb.findAccessoriesByName('Light 0')
+        uncached = hbApi.hbApi(self.server.host, self.server.port, specPath=write_swagger(self.temp_dir), accessoryCacheTtl=0)
+        uncached.authorization = self.server.session_data()
+        
+        self.assertIs(uncached.accessoryCache, self.hb.accessoryCache)
+        uncached.findAccessoriesByName('Light 0')
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 2)
+        self.hb.findAccessoriesByName('Light 0')
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
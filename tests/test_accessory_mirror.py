@@ -0,0 +1,74 @@
+"""
+Tests for the live socket.io accessory mirror against a local stand-in server.
+"""
+
+import unittest
+import tempfile
+import shutil
+import os
+import time
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes import hbApi
+from classes.accessory_cache import clearAccessoryCaches
+from classes.accessory_mirror import AccessoryMirror
+from tests.fake_homebridge import FakeHomebridge, write_swagger
+
+
+class TestAccessoryMirror(unittest.TestCase):
+    """Test mirroring accessory state from push events."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.server = FakeHomebridge(accessory_count=4).start()
+        self.mirror = AccessoryMirror(self.server.host, self.server.port, token=self.server.token).start()
+        self.assertTrue(self.mirror.wait_ready(5))
+    
+    def tearDown(self):
+        self.mirror.stop()
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+        clearAccessoryCaches()
+    
+    def _value(self, name, char_type):
+        for service in self.mirror.snapshot().findByName(name):
+            for characteristic in service['serviceCharacteristics']:
+                if characteristic['type'] == char_type:
+                    return characteristic['value']
+    
+    def test_initial_sync(self):
+        """Test that the full accessory list is mirrored on connect."""
+        self.assertEqual(len(self.mirror.snapshot().accessories), 4)
+        self.assertEqual(self._value('Light 2', 'Brightness'), 100)
+    
+    def test_push_updates_mirror(self):
+        """Test that pushed characteristic changes reach the mirror."""
+        unique_id = self.server.accessories[1]['uniqueId']
+        self.server.push(unique_id, 'Brightness', 42)
+        
+        for _ in range(100):
+            if self._value('Light 1', 'Brightness') == 42:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self._value('Light 1', 'Brightness'), 42)
+    
+    def test_lookups_use_no_http(self):
+        """Test that hbApi lookups are answered from the mirror."""
+        hb = hbApi.hbApi(self.server.host, self.server.port, specPath=write_swagger(self.temp_dir))
+        hb.authorization = self.server.session_data()
+        
+        self.assertEqual(len(hb.findAccessoriesByName('Light 3')), 1)
+        hb.invalidateAccessories()
+        self.assertEqual(len(hb.findAccessoriesByName('Light 0')), 1)
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 0)
+    
+    def test_stop_detaches_from_cache(self):
+        """Test that a stopped mirror no longer answers lookups."""
+        self.mirror.stop()
+        self.assertIsNone(self.mirror.cache.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
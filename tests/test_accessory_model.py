@@ -0,0 +1,81 @@
+"""
+Tests for the slotted accessory model.
+"""
+
+import unittest
+import json
+import os
+import tracemalloc
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes.accessory_model import Characteristic, build_services
+from tests.fake_homebridge import make_accessories
+
+
+class TestAccessoryModel(unittest.TestCase):
+    """Test building the model from an /api/accessories payload."""
+    
+    def setUp(self):
+        # round-trip through JSON so nothing is shared the way make_accessories shares it
+        self.payload = json.loads(json.dumps(make_accessories(3)))
+        self.services = build_services(self.payload)
+    
+    def test_dict_style_access(self):
+        """Test that payload keys still work on the model."""
+        service = self.services[1]
+        self.assertEqual(service['serviceName'], 'Light 1')
+        self.assertEqual(service['uniqueId'], self.payload[1]['uniqueId'])
+        self.assertEqual(service['aid'], self.payload[1]['aid'])
+        self.assertEqual(service['values'], self.payload[1]['values'])
+        self.assertEqual(service['accessoryInformation'], self.payload[1]['accessoryInformation'])
+        
+        characteristic = service['serviceCharacteristics'][1]
+        self.assertIsInstance(characteristic, Characteristic)
+        self.assertEqual(characteristic['type'], 'Brightness')
+        self.assertEqual(characteristic.get('missing', 'default'), 'default')
+        self.assertIn('canWrite', characteristic)
+        with self.assertRaises(KeyError):
+            characteristic['missing']
+    
+    def test_round_trip(self):
+        """Test that to_dict gives back the payload entry."""
+        for service, original in zip(self.services, self.payload):
+            self.assertEqual(service.to_dict(), original)
+    
+    def test_strings_interned(self):
+        """Test that repeated strings are stored once."""
+        first, second = self.services[0], self.services[2]
+        self.assertIs(first.serviceCharacteristics[0].type, second.serviceCharacteristics[0].type)
+        self.assertIs(first.serviceCharacteristics[0].format, second.serviceCharacteristics[0].format)
+        self.assertIs(first.serviceCharacteristics[0].perms[0], second.serviceCharacteristics[0].perms[0])
+        self.assertIs(first['instance'], second['instance'])
+    
+    def test_services_grouped_by_accessory(self):
+        """Test that services with the same aid on one bridge share an accessory."""
+        payload = json.loads(json.dumps(make_accessories(1) * 2))
+        payload[1]['iid'] = 20
+        services = build_services(payload)
+        self.assertIs(services[0].accessory, services[1].accessory)
+        self.assertEqual(len(services[0].accessory.services), 2)
+    
+    def test_smaller_than_dicts(self):
+        """Test that the model takes less memory than the parsed JSON."""
+        text = json.dumps(make_accessories(200))
+        
+        tracemalloc.start()
+        try:
+            parsed = json.loads(text)
+            as_dicts = tracemalloc.get_traced_memory()[0]
+            model = build_services(json.loads(text))
+            as_model = tracemalloc.get_traced_memory()[0] - as_dicts
+        finally:
+            tracemalloc.stop()
+        
+        self.assertEqual(len(model), len(parsed))
+        self.assertLess(as_model, as_dicts * 0.75)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+"""
+Tests for the asyncio client and executor against a local fake Homebridge server.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import unittest
+import tempfile
+import shutil
+import os
+import time
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes import hbApi
+from classes.async_hb_api import AsyncHbApi
+from classes.async_cli_executor import AsyncCliExecutor
+from classes.accessory_cache import clearAccessoryCaches
+from classes.concrete_providers import (MemoryStorageProvider, MemoryUserSessionProvider,
+                                        FileStorageProvider, FileUserSessionProvider)
+from classes.timings import TimingRecorder
+from tests.fake_homebridge import FakeHomebridge, make_token, write_swagger
+
+
+class TestAsyncHbApi(unittest.IsolatedAsyncioTestCase):
+    """Test the asyncio Homebridge client."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.spec_path = write_swagger(self.temp_dir)
+        self.server = FakeHomebridge(accessory_count=3).start()
+    
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+        hbApi.closeSessions()
+        clearAccessoryCaches()
+    
+    async def test_authorize_and_find(self):
+        """Test login followed by an accessory lookup."""
+        async with AsyncHbApi(self.server.host, self.server.port, specPath=self.spec_path) as hb:
+            await hb.authorize('admin', 'admin')
+            self.assertEqual(hb.authorization['status_code'], 201)
+            
+            found = await hb.findAccessoriesByName('Light 1')
+            self.assertEqual(len(found), 1)
+            self.assertEqual(found[0]['serviceName'], 'Light 1')
+    
+    async def test_shares_the_hbapi_pool(self):
+        """Test that requests go through the same pooled session as hbApi."""
+        async with AsyncHbApi(self.server.host, self.server.port, specPath=self.spec_path) as hb:
+            hb.authorization = self.server.session_data()
+            self.assertIs(hb.client.session, hbApi.getSession(self.server.host, self.server.port))
+            
+            for _ in range(3):
+                result = await hb.apiRequest('/api/auth/check', 'get')
+                self.assertEqual(result['status_code'], 200)
+    
+    async def test_timings_recorded(self):
+        """Test that async requests report their phase timings."""
+        async with AsyncHbApi(self.server.host, self.server.port, specPath=self.spec_path) as hb:
+            hb.authorization = self.server.session_data()
+            with TimingRecorder() as recorder:
+                await hb.apiRequest('/api/auth/check', 'get')
+            
+            self.assertEqual([(r['path'], r['status_code']) for r in recorder.records], [('/api/auth/check', 200)])
+    
+    async def test_requests_overlap_up_to_pool_size(self):
+        """Test that poolSize requests are in flight at once, beyond the loop's default executor."""
+        self.server.latency = 0.2
+        hb = AsyncHbApi(self.server.host, self.server.port, specPath=self.spec_path, poolSize=40, coalesce=False)
+        hb.authorization = self.server.session_data()
+        try:
+            results = await asyncio.gather(*(hb.apiRequest('/api/auth/check', 'get') for _ in range(40)))
+        finally:
+            await hb.close()
+        
+        self.assertTrue(all(r['status_code'] == 200 for r in results))
+        # every request arrived before the first one was answered
+        arrivals = self.server.arrived('GET', '/api/auth/check')
+        self.assertLess(max(arrivals) - min(arrivals), 0.2)
+        self.assertIsNone(hb._workers)
+    
+    async def test_concurrent_gets_coalesced(self):
+        """Test that identical GETs issued together reach the server once."""
+        self.server.latency = 0.2
+        async with AsyncHbApi(self.server.host, self.server.port, specPath=self.spec_path) as hb:
+            hb.authorization = self.server.session_data()
+            results = await asyncio.gather(*(hb.apiRequest('/api/accessories', 'get') for _ in range(5)))
+            
+            self.assertEqual(self.server.count('GET', '/api/accessories'), 1)
+            self.assertTrue(all(r['status_code'] == 200 for r in results))
+
+
+class TestAsyncCliExecutor(unittest.IsolatedAsyncioTestCase):
+    """Test the asyncio executor."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.server = FakeHomebridge(accessory_count=10, latency=0.1).start()
+        self.storage = MemoryStorageProvider()
+        self.storage.save_session('session', self.server.session_data())
+        self.executor = AsyncCliExecutor(
+            storage_provider=self.storage,
+            user_session_provider=MemoryUserSessionProvider(),
+            spec_path=write_swagger(self.temp_dir)
+        )
+    
+    async def asyncTearDown(self):
+        await self.executor.close()
+    
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+        clearAccessoryCaches()
+    
+    async def test_concurrent_reads_overlap(self):
+        """Test that reads for many accessories run concurrently."""
+        argsList = [
+            argparse.Namespace(action='accessorycharvalues', sessionId='session', name=f"Light {i}", charSet=['On'])
+            for i in range(10)
+        ]
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            results = await self.executor.run(argsList)
+            elapsed = time.perf_counter() - start
+        
+        self.assertEqual(results, [{'On': 0}] * 10)
+        # the token is validated locally, so only the list fetches hit the server
+        self.assertEqual(self.server.count('GET', '/api/auth/check'), 0)
+        self.assertLess(elapsed, 0.1 * 11 / 2)
+    
+    async def test_setaccessorychar(self):
+        """Test writing a characteristic."""
+        args = argparse.Namespace(action='setaccessorychar', sessionId='session', name='Light 2', charSet=['On', '1'])
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = await self.executor.processArgs(args)
+        
+        self.assertEqual(result['status_code'], 200)
+        self.assertEqual(result['body']['values']['On'], 1)
+    
+    async def test_unknown_session(self):
+        """Test that a missing session fails cleanly."""
+        args = argparse.Namespace(action='accessorycharvalues', sessionId='missing', name='Light 0', charSet=['On'])
+        
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            result = await self.executor.processArgs(args)
+        
+        self.assertIsNone(result)
+        self.assertIn('Session load failed', output.getvalue())
+
+
+class TestAsyncAuthorize(unittest.IsolatedAsyncioTestCase):
+    """Test authorization through the asyncio executor."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.spec_path = write_swagger(self.temp_dir)
+        self.server = FakeHomebridge(accessory_count=3).start()
+    
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+        hbApi.closeSessions()
+        clearAccessoryCaches()
+    
+    def make_executor(self):
+        return AsyncCliExecutor(
+            storage_provider=FileStorageProvider(os.path.join(self.temp_dir, '.sessionStore')),
+            user_session_provider=FileUserSessionProvider(os.path.join(self.temp_dir, '.authStore')),
+            spec_path=self.spec_path
+        )
+    
+    def authorize_args(self):
+        return argparse.Namespace(action='authorize', configFile=None, host=self.server.host, port=self.server.port,
+                                  username=self.server.username, password=self.server.password, secure=False)
+    
+    async def test_concurrent_logins_share_one_login(self):
+        """Test that a burst of authorize calls logs in only once."""
+        self.server.latency = 0.05
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = await asyncio.gather(*(self.make_executor().authorize(self.authorize_args()) for _ in range(8)))
+        
+        self.assertEqual(self.server.count('POST', '/api/auth/login'), 1)
+        self.assertEqual(len({r['sessionId'] for r in results}), 1)
+    
+    async def test_revoked_token_is_replaced(self):
+        """Test that authorize logs in again when the server no longer accepts an unexpired token."""
+        with contextlib.redirect_stdout(io.StringIO()):
+            await self.make_executor().authorize(self.authorize_args())
+            self.server.token = make_token(self.server.expires_in, time.time() - 10)
+            executor = self.make_executor()
+            session_id = (await executor.authorize(self.authorize_args()))['sessionId']
+            args = argparse.Namespace(action='accessorycharvalues', sessionId=session_id, name='Light 1', charSet=['On'])
+            result = await executor.processArgs(args)
+        
+        self.assertEqual(self.server.count('POST', '/api/auth/login'), 2)
+        self.assertEqual(result, {'On': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,8 +18,10 @@ from classes.concrete_providers import (
     FileUserSessionProvider,
     MemoryStorageProvider,
     MemoryUserSessionProvider,
-    generate_session_id
+    generate_session_id,
+    token_expires_at
 )
+from tests.fake_homebridge import make_token
 
 
 class TestHomebridgeAuthProvider(unittest.TestCase):
@@ -60,6 +62,49 @@ class TestHomebridgeAuthProvider(unittest.TestCase):
         
         self.auth_provider.set_token(token_data)
         self.assertEqual(self.auth_provider.get_token(), token_data)
+    
+    def _token_data(self, expires_in):
+        return {
+            'status_code': 201,
+            'host': 'localhost',
+            'port': 8581,
+            'secure': False,
+            'body': {'access_token': make_token(expires_in), 'token_type': 'Bearer', 'expires_in': expires_in}
+        }
+    
+    def test_is_valid_checks_expiry_locally(self):
+        """Test that a token far from expiry is accepted without a network call."""
+        self.auth_provider.set_token(self._token_data(3600))
+        with patch.object(self.auth_provider.hb_api, 'apiRequest') as api_request:
+            self.assertTrue(self.auth_provider.is_valid())
+            api_request.assert_not_called()
+    
+    def test_is_valid_expired_token(self):
+        """Test that an expired token is rejected without a network call."""
+        self.auth_provider.set_token(self._token_data(-10))
+        with patch.object(self.auth_provider.hb_api, 'apiRequest') as api_request:
+            self.assertFalse(self.auth_provider.is_valid())
+            api_request.assert_not_called()
+    
+    def test_is_valid_near_expiry_uses_network(self):
+        """Test that a token inside the safety margin is checked with the server."""
+        self.auth_provider.set_token(self._token_data(30))
+        with patch.object(self.auth_provider.hb_api, 'apiRequest', return_value={'status_code': 200}) as api_request:
+            self.assertTrue(self.auth_provider.is_valid())
+            api_request.assert_called_once_with("/api/auth/check", "get")
+    
+    def test_is_valid_after_rejection_uses_network(self):
+        """Test that a 401 from the server forces a network check."""
+        self.auth_provider.set_token(self._token_data(3600))
+        self.auth_provider.hb_api.authRejected = True
+        with patch.object(self.auth_provider.hb_api, 'apiRequest', return_value={'status_code': 401}):
+            self.assertFalse(self.auth_provider.is_valid())
+    
+    def test_token_expires_at_from_expires_in(self):
+        """Test the expires_in fallback for tokens without an exp claim."""
+        token_data = {'issued_at': 1000, 'body': {'access_token': 'opaque', 'expires_in': 60}}
+        self.assertEqual(token_expires_at(token_data), 1060)
+        self.assertIsNone(token_expires_at({'body': {'access_token': 'opaque'}}))
 
 
 class TestFileStorageProvider(unittest.TestCase):
@@ -136,6 +181,38 @@ class TestFileStorageProvider(unittest.TestCase):
         """Test loading a session that doesn't exist."""
         result = self.storage_provider.load_session("nonexistent_session")
         self.assertIsNone(result)
+    
+    def test_save_leaves_no_temp_files(self):
+        """Test that atomic writes clean up after themselves."""
+        self.storage_provider.save_session("session_1", {'test': 'data'})
+        self.storage_provider.save_session("session_1", {'test': 'more'})
+        self.assertEqual(os.listdir(self.temp_dir), ["session_1.json"])
+    
+    def test_load_uses_cache_while_unchanged(self):
+        """Test that an unchanged file is not parsed again."""
+        self.storage_provider.save_session("session_1", {'test': 'data'})
+        
+        with patch('classes.concrete_providers.json.load', wraps=json.load) as load:
+            for _ in range(3):
+                self.assertEqual(self.storage_provider.load_session("session_1"), {'test': 'data'})
+            self.assertEqual(load.call_count, 0)
+    
+    def test_load_sees_changes_from_other_writers(self):
+        """Test that a file replaced by another process is read again."""
+        self.storage_provider.save_session("session_1", {'test': 'data'})
+        self.storage_provider.load_session("session_1")
+        
+        FileStorageProvider(self.temp_dir).save_session("session_1", {'test': 'changed'})
+        self.assertEqual(self.storage_provider.load_session("session_1"), {'test': 'changed'})
+        
+        os.remove(os.path.join(self.temp_dir, "session_1.json"))
+        self.assertIsNone(self.storage_provider.load_session("session_1"))
+    
+    def test_loaded_data_is_a_copy(self):
+        """Test that mutating loaded data does not change the cache."""
+        self.storage_provider.save_session("session_1", {'body': {'token': 'a'}})
+        self.storage_provider.load_session("session_1")['body']['token'] = 'b'
+        self.assertEqual(self.storage_provider.load_session("session_1"), {'body': {'token': 'a'}})
 
 
 class TestFileUserSessionProvider(unittest.TestCase):
@@ -185,6 +262,13 @@ class TestFileUserSessionProvider(unittest.TestCase):
         result = self.user_provider.remove_user_session(username, host)
         self.assertTrue(result)
         self.assertIsNone(self.user_provider.get_session_id(username, host))
+    
+    def test_list_user_sessions(self):
+        """Test listing mappings while skipping lock and temp files."""
+        self.user_provider.set_session_id("user", "host.local", "session_1")
+        open(os.path.join(self.temp_dir, "user@host.local.lock"), 'w').close()
+        
+        self.assertEqual(self.user_provider.list_user_sessions(), [("user", "host.local", "session_1")])
 
 
 class TestMemoryStorageProvider(unittest.TestCase):
@@ -294,6 +378,11 @@ class TestMemoryUserSessionProvider(unittest.TestCase):
         result = self.user_provider.remove_user_session(username, host)
         self.assertTrue(result)
         self.assertIsNone(self.user_provider.get_session_id(username, host))
+    
+    def test_list_user_sessions(self):
+        """Test listing mappings."""
+        self.user_provider.set_session_id("user", "host", "session_1")
+        self.assertEqual(self.user_provider.list_user_sessions(), [("user", "host", "session_1")])
 
 
 class TestUtilityFunctions(unittest.TestCase):
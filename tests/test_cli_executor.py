@@ -0,0 +1,618 @@
+"""
+Tests for the refactored cliExecutor against a local fake Homebridge server.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import unittest
+import tempfile
+import shutil
+import threading
+import socket
+import time
+import os
+from unittest.mock import patch
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes import hbApi
+from classes.accessory_cache import clearAccessoryCaches
+from classes.resilience import clearCircuitBreakers
+from classes.resolution_cache import clearResolutionCaches, getResolutionCache
+from classes.cliExecutorRefactored import cliExecutor
+from classes.concrete_providers import FileStorageProvider, FileUserSessionProvider, clear_session_cache
+from classes.file_lock import FileLock
+from classes import daemon
+from classes.command_spec import DEFAULT_SPEC_PATH, load_command_spec, build_parser
+from classes.cliExecutorRefactored import create_default_executor
+from classes.snapshot_store import SnapshotStore
+from tests.fake_homebridge import FakeHomebridge, write_swagger, make_token
+
+
+class TestFileLock(unittest.TestCase):
+    """Test the cross-process login lock."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'user@host.lock')
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def test_exclusive(self):
+        """Test that a second holder times out while the lock is held."""
+        with FileLock(self.path) as first:
+            self.assertTrue(first.acquired)
+            self.assertFalse(FileLock(self.path).acquire(timeout=0.1))
+        
+        with FileLock(self.path, timeout=0.1) as again:
+            self.assertTrue(again.acquired)
+
+
+class ExecutorTestCase(unittest.TestCase):
+    """Fake server, swagger file and file-backed stores in a scratch directory."""
+    
+    accessory_count = 5
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.previous_cwd = os.getcwd()
+        # hbApi reads swagger.json from the working directory
+        os.chdir(self.temp_dir)
+        write_swagger(self.temp_dir)
+        self.server = FakeHomebridge(accessory_count=self.accessory_count).start()
+    
+    def tearDown(self):
+        self.server.stop()
+        os.chdir(self.previous_cwd)
+        shutil.rmtree(self.temp_dir)
+        hbApi.closeSessions()
+        clearAccessoryCaches()
+        clearCircuitBreakers()
+        clearResolutionCaches()
+        clear_session_cache()
+    
+    def make_executor(self, **kwargs):
+        return cliExecutor(
+            storage_provider=FileStorageProvider(os.path.join(self.temp_dir, '.sessionStore')),
+            user_session_provider=FileUserSessionProvider(os.path.join(self.temp_dir, '.authStore')),
+            **kwargs
+        )
+    
+    def authorize_args(self):
+        return argparse.Namespace(action='authorize', configFile=None, host=self.server.host, port=self.server.port,
+                                  username=self.server.username, password=self.server.password, secure=False)
+    
+    def run_quietly(self, fn, *args):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            result = fn(*args)
+        return result, output.getvalue()
+
+
+class TestAuthorize(ExecutorTestCase):
+    """Test authorization and session reuse."""
+    
+    def test_reuses_valid_session(self):
+        """Test that a second authorize reuses the stored token."""
+        first, _ = self.run_quietly(self.make_executor().authorize, self.authorize_args())
+        second, _ = self.run_quietly(self.make_executor().authorize, self.authorize_args())
+        
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.count('POST', '/api/auth/login'), 1)
+    
+    def test_revoked_token_is_replaced(self):
+        """Test that authorize logs in again when the server no longer accepts an unexpired token."""
+        self.run_quietly(self.make_executor().authorize, self.authorize_args())
+        self.server.token = make_token(self.server.expires_in, time.time() - 10)
+        executor = self.make_executor()
+        session_id = self.run_quietly(executor.authorize, self.authorize_args())[0]['sessionId']
+        
+        self.assertEqual(self.server.count('POST', '/api/auth/login'), 2)
+        args = argparse.Namespace(action='accessorycharvalues', name='Light 1', charSet=['On'], sessionId=session_id)
+        self.assertEqual(self.run_quietly(executor.accessorycharvalues, args)[0], {'On': False})
+    
+    def test_rejected_token_checked_on_reload(self):
+        """Test that reloading a session whose token got a 401 checks it with the server."""
+        executor = self.make_executor()
+        executor.storage_provider.save_session('session', self.server.session_data())
+        self.assertTrue(self.run_quietly(executor.loadSession, 'session')[0])
+        
+        self.server.token = make_token(self.server.expires_in, time.time() - 10)
+        executor.hb.apiRequest('/api/auth/check', 'get')
+        self.assertTrue(executor.hb.authRejected)
+        
+        loaded, output = self.run_quietly(executor.loadSession, 'session')
+        self.assertFalse(loaded)
+        self.assertIn('no longer valid', output)
+    
+    def test_login_within_deadline(self):
+        """Test that the login request is cut short by the command's deadline."""
+        self.server.latency = 2.0
+        args = self.authorize_args()
+        args.deadline = '200ms'
+        
+        start = time.perf_counter()
+        result, output = self.run_quietly(self.make_executor().processArgs, args)
+        
+        self.assertLess(time.perf_counter() - start, 1.5)
+        self.assertIn('Authorization failure', output)
+    
+    def test_concurrent_logins_share_one_login(self):
+        """Test that a burst of authorize calls logs in only once."""
+        self.server.latency = 0.05
+        results = []
+        
+        def authorize():
+            results.append(self.make_executor().authorize(self.authorize_args()))
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            threads = [threading.Thread(target=authorize) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        
+        self.assertEqual(self.server.count('POST', '/api/auth/login'), 1)
+        self.assertEqual(len(results), 8)
+        self.assertEqual(len({r['sessionId'] for r in results}), 1)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, '.authStore', f"admin@{self.server.host}.lock")))
+
+
+class TestSessions(ExecutorTestCase):
+    """Test the sessions validate-and-prune action."""
+    
+    def setUp(self):
+        super().setUp()
+        self.executor = self.make_executor()
+        storage = self.executor.storage_provider
+        users = self.executor.user_session_provider
+        
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            closed_port = s.getsockname()[1]
+        
+        expired = self.server.session_data()
+        expired['body'] = dict(expired['body'], access_token=make_token(60, time.time() - 120))
+        # no expiry information, so these two need the auth check
+        rejected = self.server.session_data()
+        rejected['body'] = {'access_token': 'bogus', 'token_type': 'Bearer'}
+        unreachable = dict(rejected, port=closed_port)
+        
+        storage.save_session('valid', self.server.session_data())
+        storage.save_session('expired', expired)
+        storage.save_session('rejected', rejected)
+        storage.save_session('unreachable', unreachable)
+        users.set_session_id('alice', 'hb', 'valid')
+        users.set_session_id('bob', 'hb', 'expired')
+        users.set_session_id('carol', 'hb', 'gone')
+    
+    def sessions_args(self, dry_run=False):
+        return argparse.Namespace(action='sessions', dryRun=dry_run, workers='4')
+    
+    def test_prunes_invalid_sessions(self):
+        """Test that expired and rejected sessions and their mappings are removed."""
+        result, _ = self.run_quietly(self.executor.sessions, self.sessions_args())
+        
+        self.assertEqual(result['checked'], 4)
+        self.assertEqual(result['valid'], ['valid'])
+        self.assertEqual(result['expired'], ['expired'])
+        self.assertEqual(result['invalid'], ['rejected'])
+        self.assertEqual(result['unreachable'], ['unreachable'])
+        self.assertEqual(result['mappingsRemoved'], ['bob@hb', 'carol@hb'])
+        
+        self.assertEqual(sorted(self.executor.storage_provider.list_sessions()), ['unreachable', 'valid'])
+        self.assertEqual(self.executor.user_session_provider.list_user_sessions(), [('alice', 'hb', 'valid')])
+        # the valid session is trusted on its expiry, only the two without one are checked
+        self.assertEqual(self.server.count('GET', '/api/auth/check'), 1)
+    
+    def test_dry_run_keeps_everything(self):
+        """Test that --dry-run reports without deleting."""
+        result, _ = self.run_quietly(self.executor.sessions, self.sessions_args(dry_run=True))
+        
+        self.assertEqual(result['pruned'], ['expired', 'rejected'])
+        self.assertEqual(len(self.executor.storage_provider.list_sessions()), 4)
+        self.assertEqual(len(self.executor.user_session_provider.list_user_sessions()), 3)
+
+
+class TestFanout(ExecutorTestCase):
+    """Test running one action across several hosts."""
+    
+    def setUp(self):
+        super().setUp()
+        self.other = FakeHomebridge(accessory_count=2, latency=0.3).start()
+        self.server.latency = 0.3
+        self.executor = self.make_executor()
+        self.executor.storage_provider.save_session('first', self.server.session_data())
+        self.executor.storage_provider.save_session('second', self.other.session_data())
+        self.executor.user_session_provider.set_session_id('admin', 'other', 'second')
+    
+    def tearDown(self):
+        self.other.stop()
+        super().tearDown()
+    
+    def test_results_per_target(self):
+        """Test that each target gets its own result, in order and in parallel."""
+        args = argparse.Namespace(action='accessorycharvalues', name='Light 1', charSet=['On'], sessionId=None,
+                                  sessionIds=['first'], hosts=['admin@other', 'nobody@nowhere'], parallel='4')
+        
+        _, output = self.run_quietly(self.executor.processArgs, args)
+        results = json.loads(output)
+        
+        self.assertEqual([r['target'] for r in results], ['first', 'admin@other', 'nobody@nowhere'])
+        self.assertEqual([r['ok'] for r in results], [True, True, False])
+        self.assertEqual(results[0]['host'], self.server.host)
+        self.assertEqual(results[1]['result'], {'On': False})
+        self.assertIn('No session found', results[2]['output'])
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 1)
+        self.assertEqual(self.other.count('GET', '/api/accessories'), 1)
+        # both hosts are queried at the same time: each list request arrives while the other is still being served
+        first = self.server.arrived('GET', '/api/accessories')[0]
+        second = self.other.arrived('GET', '/api/accessories')[0]
+        self.assertLess(abs(first - second), 0.3)
+    
+    def test_failed_lookup_stays_in_its_entry(self):
+        """Test that an error reported by a worker's client is captured in that target's entry."""
+        self.server.fail_next(1, 500)
+        args = argparse.Namespace(action='accessorycharvalues', name='Light 1', charSet=['On'], sessionId=None,
+                                  sessionIds=['first', 'second'], hosts=None, parallel='2')
+        
+        _, output = self.run_quietly(self.executor.processArgs, args)
+        results = json.loads(output)
+        
+        self.assertEqual([r['ok'] for r in results], [False, True])
+        self.assertIn('Callout error', results[0]['output'])
+        self.assertNotIn('Callout error', results[1]['output'])
+    
+    def test_unsupported_action(self):
+        """Test that actions without a session are refused."""
+        args = argparse.Namespace(action='sessions', sessionIds=['first'], hosts=None)
+        _, output = self.run_quietly(self.executor.fanout, args)
+        self.assertIn('cannot run across several sessions', output)
+
+
+class TestDaemonExecutor(ExecutorTestCase):
+    """Test invocations run by the daemon for a client in another directory."""
+    
+    def test_streams_kept_apart(self):
+        """Test that --timings goes to stderr and the stores of the client's directory are used."""
+        executor = create_default_executor(self.temp_dir)
+        executor.storage_provider.save_session('session', self.server.session_data())
+        hb_daemon = daemon.hbCliDaemon(create_default_executor, build_parser(load_command_spec(DEFAULT_SPEC_PATH)))
+        
+        # the daemon runs somewhere else; only the client's directory has the stores and swagger.json
+        os.chdir(self.previous_cwd)
+        output, errors, exit_code = hb_daemon.run(
+            ['accessorycharvalues', '-N', 'Light 1', '-X', 'On', '-S', 'session', '--timings'], self.temp_dir
+        )
+        
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(json.loads(output), {'On': False})
+        self.assertIn('/api/accessories', errors)
+    
+    def test_unchanged_session_parsed_once(self):
+        """Test that the daemon reuses a parsed session file across invocations."""
+        create_default_executor(self.temp_dir).storage_provider.save_session('session', self.server.session_data())
+        clear_session_cache()
+        hb_daemon = daemon.hbCliDaemon(create_default_executor, build_parser(load_command_spec(DEFAULT_SPEC_PATH)))
+        parsed = []
+        load = json.load
+        
+        def counting_load(f, *args, **kwargs):
+            parsed.append(os.path.basename(f.name))
+            return load(f, *args, **kwargs)
+        
+        with patch('json.load', counting_load):
+            for _ in range(3):
+                output, _, exit_code = hb_daemon.run(['accessorycharvalues', '-N', 'Light 1', '-X', 'On', '-S', 'session'], self.temp_dir)
+                self.assertEqual(exit_code, 0)
+        
+        self.assertEqual(parsed.count('session.json'), 1)
+
+
+class TestBatch(ExecutorTestCase):
+    """Test running JSONL command streams over one session."""
+    
+    def setUp(self):
+        super().setUp()
+        self.executor = self.make_executor()
+        self.executor.storage_provider.save_session('session', self.server.session_data())
+        self.input = os.path.join(self.temp_dir, 'commands.jsonl')
+    
+    def run_batch(self, lines, deadline=None):
+        with open(self.input, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        args = argparse.Namespace(action='batch', sessionId='session', inputFile=self.input, deadline=deadline)
+        _, output = self.run_quietly(self.executor.processArgs, args)
+        return [json.loads(line) for line in output.splitlines()]
+    
+    def test_results_stream_in_order(self):
+        """Test that each command gets one result line, in order."""
+        results = self.run_batch([
+            json.dumps({'action': 'accessorycharvalues', 'name': 'Light 1', 'charSet': ['On', 'Brightness']}),
+            json.dumps({'action': 'setaccessorychar', 'name': 'Light 1', 'charSet': ['Brightness', '40']}),
+            '',
+            json.dumps({'action': 'accessorycharvalues', 'name': 'Light 1', 'charSet': ['Brightness']}),
+            json.dumps({'action': 'request', 'endpoint': '/api/auth/check', 'method': 'get'})
+        ])
+        
+        self.assertEqual([r['line'] for r in results], [1, 2, 4, 5])
+        self.assertTrue(all(r['ok'] for r in results))
+        self.assertEqual(results[2]['result'], {'Brightness': 40})
+        self.assertEqual(results[3]['result']['status_code'], 200)
+    
+    def test_bad_commands_do_not_stop_the_batch(self):
+        """Test that invalid lines are reported and the rest still runs."""
+        results = self.run_batch([
+            'not json',
+            json.dumps({'action': 'authorize'}),
+            json.dumps({'action': 'accessorycharvalues', 'name': 'Light 1'}),
+            json.dumps({'action': 'accessorycharvalues', 'name': 'Light 2', 'charSet': ['On']})
+        ])
+        
+        self.assertEqual([r['ok'] for r in results], [False, False, False, True])
+        self.assertIn('cannot be used in a batch', results[1]['output'])
+        self.assertIn('charSet', results[2]['output'])
+    
+    def test_session_loaded_once(self):
+        """Test that the client is set up once for the whole batch."""
+        command = json.dumps({'action': 'accessorycharvalues', 'name': 'Light 1', 'charSet': ['On']})
+        with patch.object(self.executor.storage_provider, 'load_session',
+                          wraps=self.executor.storage_provider.load_session) as load:
+            self.run_batch([command] * 5)
+        
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 1)
+    
+    def test_batch_deadline_applies_per_command(self):
+        """Test that the batch's --deadline is each command's budget, not the whole stream's."""
+        self.server.latency = 0.2
+        check = json.dumps({'action': 'request', 'endpoint': '/api/auth/check', 'method': 'get'})
+        results = self.run_batch([check] * 4, deadline='500ms')
+        self.assertEqual([r['ok'] for r in results], [True] * 4)
+    
+    def test_command_deadline(self):
+        """Test that a command's own deadline overrides the batch's."""
+        self.server.latency = 0.2
+        results = self.run_batch([
+            json.dumps({'action': 'request', 'endpoint': '/api/auth/check', 'method': 'get', 'deadline': '50ms'}),
+            json.dumps({'action': 'request', 'endpoint': '/api/auth/check', 'method': 'get'}),
+            json.dumps({'action': 'request', 'endpoint': '/api/auth/check', 'method': 'get', 'deadline': 'soon'})
+        ], deadline='5s')
+        
+        self.assertEqual([r['ok'] for r in results], [False, True, False])
+        self.assertIn('Deadline exceeded', results[0]['output'])
+        self.assertIn('Invalid deadline', results[2]['output'])
+    
+    def test_command_timings(self):
+        """Test that timings are reported for the commands that ask for them."""
+        self.executor.err = io.StringIO()
+        self.run_batch([
+            json.dumps({'action': 'request', 'endpoint': '/api/auth/check', 'method': 'get', 'timings': True}),
+            json.dumps({'action': 'accessorycharvalues', 'name': 'Light 1', 'charSet': ['On']})
+        ])
+        
+        report = self.executor.err.getvalue()
+        self.assertIn('GET /api/auth/check', report)
+        self.assertNotIn('/api/accessories', report)
+    
+    def test_failed_lookup_stays_in_its_record(self):
+        """Test that an error reported by the client goes to the command's output, not the stream."""
+        self.server.fail_next(1, 500)
+        command = json.dumps({'action': 'accessorycharvalues', 'name': 'Light 1', 'charSet': ['On']})
+        results = self.run_batch([command, command])
+        
+        self.assertEqual([r['ok'] for r in results], [False, True])
+        self.assertIn('Callout error', results[0]['output'])
+    
+    def test_options_that_cannot_apply(self):
+        """Test that unknown options and a per-command session are rejected."""
+        results = self.run_batch([
+            json.dumps({'action': 'accessorycharvalues', 'name': 'Light 1', 'charSet': ['On'], 'endpoint': '/api'}),
+            json.dumps({'action': 'accessorycharvalues', 'name': 'Light 1', 'charSet': ['On'], 'sessionId': 'other'})
+        ])
+        
+        self.assertEqual([r['ok'] for r in results], [False, False])
+        self.assertIn('endpoint cannot be used with accessorycharvalues', results[0]['output'])
+        self.assertIn("batch's session", results[1]['output'])
+
+
+class TestNdjsonFormat(ExecutorTestCase):
+    """Test the streaming --format ndjson output."""
+    
+    def setUp(self):
+        super().setUp()
+        self.executor = self.make_executor()
+        self.executor.storage_provider.save_session('session', self.server.session_data())
+    
+    def test_accessorycharvalues(self):
+        """Test one line per requested characteristic."""
+        args = argparse.Namespace(action='accessorycharvalues', name='Light 1', charSet=['On', 'Brightness'],
+                                  sessionId='session', format='ndjson')
+        count, output = self.run_quietly(self.executor.accessorycharvalues, args)
+        records = [json.loads(line) for line in output.splitlines()]
+        
+        self.assertEqual(count, 2)
+        self.assertEqual({r['type'] for r in records}, {'On', 'Brightness'})
+        self.assertTrue(all(r['serviceName'] == 'Light 1' and r['uniqueId'] for r in records))
+    
+    def test_listaccessorychars(self):
+        """Test one line per characteristic with its permissions."""
+        args = argparse.Namespace(action='listaccessorychars', name='Light 1', sessionId='session', format='ndjson')
+        count, output = self.run_quietly(self.executor.listaccessorychars, args)
+        records = [json.loads(line) for line in output.splitlines()]
+        
+        self.assertEqual(count, len(records))
+        self.assertEqual(set(records[0]), {'serviceName', 'uniqueId', 'type', 'value', 'canRead', 'canWrite'})
+
+
+class TestResolutionCache(ExecutorTestCase):
+    """Test the on-disk name -> uniqueId cache used by setaccessorychar."""
+    
+    def setUp(self):
+        super().setUp()
+        self.executor = self.make_executor()
+        self.executor.storage_provider.save_session('session', self.server.session_data())
+        self.light_id = next(a['uniqueId'] for a in self.server.accessories if a['serviceName'] == 'Light 1')
+    
+    def set_brightness(self, value):
+        # a new invocation: nothing from the previous one is held in memory
+        hbApi.closeSessions()
+        clearAccessoryCaches()
+        clearResolutionCaches()
+        args = argparse.Namespace(action='setaccessorychar', name='Light 1', charSet=['Brightness', value],
+                                  sessionId='session')
+        result, _ = self.run_quietly(self.make_executor().setaccessorychar, args)
+        return result
+    
+    def test_second_write_is_one_put(self):
+        """Test that a resolved name is reused by later invocations."""
+        self.assertEqual(self.set_brightness('40')['status_code'], 200)
+        self.assertEqual(self.set_brightness('50')['status_code'], 200)
+        
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 1)
+        self.assertEqual(self.server.count('PUT', f'/api/accessories/{self.light_id}'), 2)
+        self.assertEqual(self.server.by_id[self.light_id]['values']['Brightness'], 50)
+    
+    def test_stale_entry_is_resolved_again(self):
+        """Test that a 404 drops the cached uniqueId and the name is looked up again."""
+        cache = getResolutionCache('.hbCache', self.server.host, self.server.port)
+        cache.put('Light 1', 'Brightness', 'removed-accessory')
+        
+        self.assertEqual(self.set_brightness('30')['status_code'], 200)
+        
+        self.assertEqual(self.server.count('PUT', '/api/accessories/removed-accessory'), 1)
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 1)
+        self.assertEqual(getResolutionCache('.hbCache', self.server.host, self.server.port).get('Light 1', 'Brightness'),
+                         self.light_id)
+    
+    def test_used_when_accessory_cache_disabled(self):
+        """Test that a snapshot the client's TTL does not allow is not preferred over the resolution cache."""
+        executor = self.make_executor(accessory_cache_ttl=0)
+        write = argparse.Namespace(action='setaccessorychar', name='Light 1', charSet=['Brightness', '40'],
+                                   sessionId='session')
+        read = argparse.Namespace(action='accessorycharvalues', name='Light 1', charSet=['Brightness'],
+                                  sessionId='session', maxStale=None, format='text')
+        
+        self.run_quietly(executor.setaccessorychar, write)
+        # leaves a just-downloaded snapshot in the shared cache
+        self.run_quietly(executor.accessorycharvalues, read)
+        self.assertEqual(self.run_quietly(executor.setaccessorychar, write)[0]['status_code'], 200)
+        
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 2)
+        self.assertEqual(self.server.count('PUT', f'/api/accessories/{self.light_id}'), 2)
+    
+    def test_disabled(self):
+        """Test that no cache file is written when the cache is turned off."""
+        args = argparse.Namespace(action='setaccessorychar', name='Light 1', charSet=['On', '1'], sessionId='session')
+        self.run_quietly(self.make_executor(resolution_cache_dir=None).setaccessorychar, args)
+        self.assertFalse(os.path.exists(getResolutionCache('.hbCache', self.server.host, self.server.port).path))
+
+
+class TestStaleSnapshot(ExecutorTestCase):
+    """Test answering reads from the on-disk snapshot within --max-stale."""
+    
+    def setUp(self):
+        super().setUp()
+        self.executor = self.make_executor()
+        self.executor.storage_provider.save_session('session', self.server.session_data())
+        self.store = SnapshotStore(os.path.join('.hbCache', f"{self.server.host}_{self.server.port}.snapshot"))
+    
+    def read_on(self, max_stale=None):
+        # a new invocation: only what is on disk carries over
+        hbApi.closeSessions()
+        clearAccessoryCaches()
+        self.executor = self.make_executor()
+        args = argparse.Namespace(action='accessorycharvalues', name='Light 1', charSet=['Brightness'],
+                                  sessionId='session', maxStale=max_stale)
+        result, _ = self.run_quietly(self.executor.accessorycharvalues, args)
+        return result
+    
+    def set_value(self, value):
+        with self.server.lock:
+            service = next(a for a in self.server.accessories if a['serviceName'] == 'Light 1')
+            service['serviceCharacteristics'][1]['value'] = value
+    
+    def test_snapshot_saved_by_stale_reads(self):
+        """Test that a fetched accessory list is written to disk only while stale reads are in use."""
+        self.assertEqual(self.read_on(), {'Brightness': 100})
+        self.assertIsNone(self.store.load())
+        
+        self.assertEqual(self.read_on('1m'), {'Brightness': 100})
+        saved_at, payload = self.store.load()
+        self.assertLess(time.time() - saved_at, 5)
+        self.assertEqual(len(payload), self.accessory_count)
+    
+    def test_stale_while_revalidate(self):
+        """Test that an old snapshot is served at once and refreshed in the background."""
+        self.read_on('1m')
+        self.store.save(self.store.load()[1], savedAt=time.time() - 30)
+        self.set_value(42)
+        
+        self.assertEqual(self.read_on('1m'), {'Brightness': 100})
+        self.executor._refresh_thread.join(5)
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 2)
+        
+        self.assertEqual(self.read_on('1m'), {'Brightness': 42})
+        self.assertIsNone(self.executor._refresh_thread)
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 2)
+    
+    def test_detached_refresh(self):
+        """Test that a one-shot process hands the refresh to a child and does not wait for it."""
+        self.read_on('1m')
+        self.store.save(self.store.load()[1], savedAt=time.time() - 30)
+        self.set_value(42)
+        self.server.latency = 0.5
+        
+        hbApi.closeSessions()
+        clearAccessoryCaches()
+        executor = self.make_executor(detach_refresh=True)
+        args = argparse.Namespace(action='accessorycharvalues', name='Light 1', charSet=['Brightness'],
+                                  sessionId='session', maxStale='1m')
+        result, _ = self.run_quietly(executor.accessorycharvalues, args)
+        
+        # answered from the old snapshot while the child is still downloading
+        self.assertEqual(result, {'Brightness': 100})
+        self.assertIsNone(executor._refresh_process.poll())
+        self.assertIsNone(executor._refresh_thread)
+        
+        executor._refresh_process.wait(10)
+        self.assertLess(time.time() - self.store.load()[0], 10)
+        self.assertEqual(self.read_on('1m'), {'Brightness': 42})
+    
+    def test_too_stale_or_not_allowed(self):
+        """Test that the snapshot is ignored past the bound or without --max-stale."""
+        self.read_on('1m')
+        self.store.save(self.store.load()[1], savedAt=time.time() - 30)
+        self.set_value(42)
+        
+        self.assertEqual(self.read_on('10s'), {'Brightness': 42})
+        self.assertEqual(self.read_on(), {'Brightness': 42})
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 3)
+    
+    def test_write_discards_snapshot(self):
+        """Test that writing to an accessory drops the stored snapshot."""
+        self.read_on('1m')
+        args = argparse.Namespace(action='setaccessorychar', name='Light 1', charSet=['Brightness', '10'],
+                                  sessionId='session')
+        # from an invocation that does not read stale itself
+        self.run_quietly(self.make_executor().setaccessorychar, args)
+        
+        self.assertIsNone(self.store.load())
+        self.assertEqual(self.read_on('1m'), {'Brightness': 10})
+    
+    def test_corrupt_snapshot(self):
+        """Test that an unreadable file counts as no snapshot."""
+        os.makedirs('.hbCache', exist_ok=True)
+        with open(self.store.path, 'wb') as f:
+            f.write(b'not a snapshot')
+        
+        self.assertIsNone(self.store.load())
+        self.assertEqual(self.read_on('1m'), {'Brightness': 100})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+Tests for the cached commands.json loader.
+"""
+
+import unittest
+import tempfile
+import shutil
+import os
+import json
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes.command_spec import load_command_spec, build_parser
+
+
+COMMANDS = [
+    [["first"], {"help": "First action"}, [[["-N", "--name"], {"dest": "name", "required": True}]]],
+    [["second"], {"help": "Second action"}, []]
+]
+
+
+class TestCommandSpec(unittest.TestCase):
+    """Test loading and caching the CLI definition."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'commands.json')
+        self._write(COMMANDS)
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def _write(self, commands, mtime=None):
+        with open(self.path, 'w') as f:
+            json.dump(commands, f)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+    
+    def test_cache_written_and_used(self):
+        """Test that the second load comes from the cache."""
+        self.assertEqual(load_command_spec(self.path), COMMANDS)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, '__pycache__', 'commands.json.cache')))
+        self.assertEqual(load_command_spec(self.path), COMMANDS)
+    
+    def test_cache_invalidated_by_mtime(self):
+        """Test that editing commands.json invalidates the cache."""
+        self._write(COMMANDS, mtime=1000000)
+        load_command_spec(self.path)
+        changed = COMMANDS[:1]
+        self._write(changed, mtime=2000000)
+        self.assertEqual(load_command_spec(self.path), changed)
+    
+    def test_build_single_action_parser(self):
+        """Test building only the requested subcommand."""
+        parser = build_parser(COMMANDS, only='first')
+        self.assertEqual(parser.parse_args(['first', '-N', 'x']).name, 'x')
+        with self.assertRaises(SystemExit):
+            parser.parse_args(['second'])
+    
+    def test_build_full_parser_for_unknown_action(self):
+        """Test that an unknown action falls back to the full parser."""
+        parser = build_parser(COMMANDS, only='bogus')
+        self.assertEqual(parser.parse_args(['second']).action, 'second')
+
+
+if __name__ == '__main__':
+    unittest.main()
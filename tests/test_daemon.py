@@ -0,0 +1,128 @@
+"""
+Tests for the resident daemon and its forwarding client.
+"""
+
+import argparse
+import unittest
+import tempfile
+import shutil
+import os
+import threading
+import time
+import socket
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes import daemon
+
+
+class EchoExecutor:
+    """Executor stand-in that prints the action and the working directory it was built for."""
+    
+    def __init__(self):
+        self.calls = []
+        self.cwd = None
+        self.delay = 0.0
+        self.out = None
+        self.err = None
+    
+    def __call__(self, cwd):
+        self.cwd = cwd
+        return self
+    
+    def processArgs(self, args):
+        self.calls.append(args)
+        time.sleep(self.delay)
+        print(f"{args.action} {args.name} {self.cwd}", file=self.out)
+        print("diagnostics", file=self.err)
+
+
+class TestDaemon(unittest.TestCase):
+    """Test forwarding invocations to a running daemon."""
+    
+    def setUp(self):
+        self.temp_dir = os.path.realpath(tempfile.mkdtemp())
+        self.socket_path = os.path.join(self.temp_dir, 'hb.sock')
+        
+        parser = argparse.ArgumentParser()
+        subparsers = parser.add_subparsers(dest='action')
+        subparsers.add_parser('listaccessorychars').add_argument('-N', dest='name', required=True)
+        
+        self.executor = EchoExecutor()
+        self.daemon = daemon.hbCliDaemon(self.executor, parser, self.socket_path)
+        self.thread = threading.Thread(target=self.daemon.serve_forever, daemon=True)
+        self.thread.start()
+        
+        for _ in range(100):
+            if os.path.exists(self.socket_path):
+                break
+            time.sleep(0.01)
+    
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.thread.join()
+        shutil.rmtree(self.temp_dir)
+    
+    def test_forward_runs_command(self):
+        """Test that output and exit code come back from the daemon."""
+        output, errors, exit_code = daemon.forward(['listaccessorychars', '-N', 'Porch'], self.socket_path)
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(output, f"listaccessorychars Porch {os.getcwd()}\n")
+        self.assertEqual(errors, "diagnostics\n")
+    
+    def test_forward_argument_error(self):
+        """Test that argparse errors are reported with their exit code."""
+        output, errors, exit_code = daemon.forward(['listaccessorychars'], self.socket_path)
+        self.assertEqual(exit_code, 2)
+        self.assertEqual(output, '')
+        self.assertIn('required', errors)
+        self.assertEqual(self.executor.calls, [])
+    
+    def test_socket_removed_on_shutdown(self):
+        """Test that the socket file is cleaned up."""
+        self.daemon.shutdown()
+        self.thread.join()
+        self.assertFalse(os.path.exists(self.socket_path))
+    
+    def test_forward_without_daemon(self):
+        """Test that forwarding reports no daemon when the socket is missing."""
+        self.assertIsNone(daemon.forward(['listaccessorychars', '-N', 'x'], os.path.join(self.temp_dir, 'none.sock')))
+    
+    def test_forward_to_stale_socket(self):
+        """Test that a socket file nobody listens on counts as no daemon."""
+        self.daemon.shutdown()
+        self.thread.join()
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket_path)
+        stale.close()
+        self.assertIsNone(daemon.forward(['listaccessorychars', '-N', 'x'], self.socket_path))
+    
+    def test_no_reply_is_not_run_again(self):
+        """Test that a command sent to the daemon is reported, not handed back, when the reply is late."""
+        self.executor.delay = 0.5
+        result = daemon.forward(['listaccessorychars', '-N', 'Porch'], self.socket_path, timeout=0.1)
+        
+        self.assertIsNotNone(result)
+        self.assertEqual(result[2], 1)
+        self.assertIn('may still have run', result[1])
+        time.sleep(0.6)
+        self.assertEqual(len(self.executor.calls), 1)
+    
+    def test_streaming_commands_run_locally(self):
+        """Test that commands whose output streams are not forwarded."""
+        self.assertTrue(daemon.runs_locally(['batch', '-S', 'session']))
+        self.assertTrue(daemon.runs_locally(['accessorycharvalues', '-N', 'Porch', '--format', 'ndjson']))
+        self.assertTrue(daemon.runs_locally(['listaccessorychars', '-N', 'Porch', '--format=ndjson']))
+        self.assertFalse(daemon.runs_locally(['listaccessorychars', '-N', 'Porch', '--format', 'text']))
+        self.assertFalse(daemon.runs_locally(['listaccessorychars', '-N', 'ndjson']))
+    
+    def test_reply_timeout(self):
+        """Test that the client waits for the command's deadline plus a grace period."""
+        self.assertIsNone(daemon.reply_timeout(['listaccessorychars', '-N', 'Porch']))
+        self.assertEqual(daemon.reply_timeout(['listaccessorychars', '--deadline', '2s']), 2 + daemon.REPLY_GRACE)
+        self.assertEqual(daemon.reply_timeout(['listaccessorychars', '--deadline=500ms']), 0.5 + daemon.REPLY_GRACE)
+
+
+if __name__ == '__main__':
+    unittest.main()
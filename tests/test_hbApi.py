@@ -0,0 +1,309 @@
+"""
+Unit tests for the hbApi client.
+"""
+
+import unittest
+import tempfile
+import shutil
+import os
+import time
+import threading
+import types
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes import hbApi
+from classes.accessory_cache import clearAccessoryCaches
+from classes.timings import TimingRecorder, PHASES
+from classes.deadline import Deadline, DeadlineExceeded
+from tests.fake_homebridge import FakeHomebridge, write_swagger
+
+
+class TestSpecCache(unittest.TestCase):
+    """Test the process-wide swagger spec cache."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.spec_path = write_swagger(self.temp_dir)
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        hbApi._specCache.pop(os.path.abspath(self.spec_path), None)
+    
+    def test_spec_shared_between_clients(self):
+        """Test that clients share a single parsed spec."""
+        first = hbApi.hbApi("localhost", specPath=self.spec_path)
+        second = hbApi.hbApi("otherhost", specPath=self.spec_path)
+        self.assertIs(first.spec, second.spec)
+        self.assertIs(first.apiJsonDef, second.apiJsonDef)
+    
+    def test_operations_indexed_by_path_and_method(self):
+        """Test operation lookup by (path, method)."""
+        spec = hbApi.loadSpec(self.spec_path)
+        self.assertIn('security', spec.operation('/api/accessories', 'get'))
+        self.assertIn('requestBody', spec.operation('/api/accessories/{uniqueId}', 'PUT'))
+        self.assertIsNone(spec.operation('/api/accessories', 'delete'))
+    
+    def test_spec_is_immutable(self):
+        """Test that the shared spec cannot be modified by a client."""
+        spec = hbApi.loadSpec(self.spec_path)
+        with self.assertRaises(TypeError):
+            spec.operations[('/api/foo', 'get')] = {}
+        with self.assertRaises(TypeError):
+            spec.operation('/api/accessories', 'get')['security'] = []
+
+
+class TestRoutes(unittest.TestCase):
+    """Test the compiled route table."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.spec = hbApi.loadSpec(write_swagger(self.temp_dir))
+        self.authorization = {'body': {'token_type': 'Bearer', 'access_token': 'abc'}}
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        hbApi._specCache.pop(self.spec.path, None)
+    
+    def test_build_static_path(self):
+        """Test that a path without parameters is returned unchanged."""
+        route = self.spec.route('/api/accessories', 'get')
+        self.assertEqual(route.buildPath({}), '/api/accessories')
+    
+    def test_build_templated_path(self):
+        """Test filling in path parameters."""
+        route = self.spec.route('/api/accessories/{uniqueId}', 'put')
+        self.assertEqual(route.buildPath({'uniqueId': 'abc123'}), '/api/accessories/abc123')
+        self.assertTrue(route.bodyRequired)
+        self.assertEqual(route.contentType, 'application/json')
+    
+    def test_missing_parameters(self):
+        """Test that missing path parameters are rejected."""
+        route = self.spec.route('/api/accessories/{uniqueId}', 'get')
+        with self.assertRaises(Exception):
+            route.buildPath({})
+        with self.assertRaises(Exception):
+            route.buildPath({'other': 'value'})
+    
+    def test_auth_header(self):
+        """Test the authorization header strategy."""
+        secured = self.spec.route('/api/accessories', 'get')
+        self.assertEqual(secured.authHeader(self.authorization), 'Bearer abc')
+        with self.assertRaises(Exception):
+            secured.authHeader(None)
+        
+        unsecured = self.spec.route('/api/auth/login', 'post')
+        self.assertIsNone(unsecured.authHeader(None))
+
+
+class TestSessionPool(unittest.TestCase):
+    """Test the process-wide connection pool registry."""
+    
+    def tearDown(self):
+        hbApi.closeSessions()
+    
+    def test_session_shared_per_host(self):
+        """Test that clients for the same host share a pooled session."""
+        first = hbApi.hbApi("localhost", 8581, False, specPath="missing.json")
+        second = hbApi.hbApi("localhost", 8581, False, specPath="missing.json")
+        self.assertIs(first.session, second.session)
+    
+    def test_session_per_host_port_secure(self):
+        """Test that distinct endpoints get distinct pools."""
+        session = hbApi.getSession("localhost", 8581, False)
+        self.assertIsNot(session, hbApi.getSession("localhost", 8582, False))
+        self.assertIsNot(session, hbApi.getSession("localhost", 8581, True))
+        self.assertIsNot(session, hbApi.getSession("otherhost", 8581, False))
+    
+    def test_pool_grows_for_larger_client(self):
+        """Test that a later client asking for more connections gets a larger pool."""
+        session = hbApi.getSession("localhost", 8581, False, poolSize=2)
+        self.assertIs(hbApi.getSession("localhost", 8581, False, poolSize=20), session)
+        self.assertEqual(session.get_adapter("http://localhost:8581")._pool_maxsize, 20)
+        hbApi.getSession("localhost", 8581, False, poolSize=5)
+        self.assertEqual(session.get_adapter("http://localhost:8581")._pool_maxsize, 20)
+
+
+class TestTimings(unittest.TestCase):
+    """Test per-request phase timing callbacks."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.server = FakeHomebridge(accessory_count=2).start()
+        self.hb = hbApi.hbApi(self.server.host, self.server.port, specPath=write_swagger(self.temp_dir))
+        self.hb.authorization = self.server.session_data()
+    
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+        hbApi.closeSessions()
+    
+    def test_phases_recorded(self):
+        """Test that every phase is reported, with connect only on a new connection."""
+        with TimingRecorder() as recorder:
+            self.hb.apiRequest('/api/auth/check', 'get')
+            self.hb.apiRequest('/api/auth/check', 'get')
+        
+        self.assertEqual(len(recorder.records), 2)
+        first, second = recorder.records
+        for phase in PHASES + ('total',):
+            self.assertGreaterEqual(first[phase], 0.0)
+        self.assertEqual(first['status_code'], 200)
+        self.assertGreater(first['connect'], 0.0)
+        self.assertEqual(second['connect'], 0.0)
+    
+    def test_recorder_detached_after_exit(self):
+        """Test that callbacks stop receiving records once removed."""
+        with TimingRecorder() as recorder:
+            pass
+        self.hb.apiRequest('/api/auth/check', 'get')
+        self.assertEqual(recorder.records, [])
+
+
+class TestDeadline(unittest.TestCase):
+    """Test deadline parsing and request timeouts."""
+    
+    def test_parse(self):
+        """Test the accepted duration formats."""
+        self.assertAlmostEqual(Deadline.parse('2s').seconds, 2.0)
+        self.assertAlmostEqual(Deadline.parse('500ms').seconds, 0.5)
+        self.assertAlmostEqual(Deadline.parse('1m').seconds, 60.0)
+        self.assertAlmostEqual(Deadline.parse('1.5').seconds, 1.5)
+        self.assertIsNone(Deadline.parse(None))
+        with self.assertRaises(ValueError):
+            Deadline.parse('soon')
+    
+    def test_cap(self):
+        """Test that timeouts are shortened to the remaining budget."""
+        connect, read = Deadline(1.0).cap((5.0, 30.0))
+        self.assertLessEqual(connect, 1.0)
+        self.assertLessEqual(read, 1.0)
+        with self.assertRaises(DeadlineExceeded):
+            Deadline(0).cap((5.0, 30.0))
+    
+    def test_request_respects_deadline(self):
+        """Test that a slow server cannot hold a request past the deadline."""
+        temp_dir = tempfile.mkdtemp()
+        server = FakeHomebridge(accessory_count=1, latency=1.0).start()
+        try:
+            hb = hbApi.hbApi(server.host, server.port, specPath=write_swagger(temp_dir))
+            hb.authorization = server.session_data()
+            hb.deadline = Deadline(0.2)
+            
+            start = time.perf_counter()
+            result = hb.apiRequest('/api/auth/check', 'get')
+            self.assertEqual(result['status_code'], 0)
+            self.assertEqual(result['body']['error'], 'Deadline exceeded')
+            self.assertLess(time.perf_counter() - start, 0.8)
+        finally:
+            server.stop()
+            shutil.rmtree(temp_dir)
+            hbApi.closeSessions()
+
+
+class TestCoalescing(unittest.TestCase):
+    """Test single-flight deduplication of concurrent GETs."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.spec_path = write_swagger(self.temp_dir)
+        self.server = FakeHomebridge(accessory_count=3, latency=0.2).start()
+    
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+        hbApi.closeSessions()
+        clearAccessoryCaches()
+    
+    def fetch_concurrently(self, clients):
+        results = [None] * len(clients)
+        
+        def fetch(i):
+            results[i] = clients[i].apiRequest('/api/accessories', 'get')
+        
+        threads = [threading.Thread(target=fetch, args=(i,)) for i in range(len(clients))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+    
+    def client(self, **kwargs):
+        hb = hbApi.hbApi(self.server.host, self.server.port, specPath=self.spec_path, **kwargs)
+        hb.authorization = self.server.session_data()
+        return hb
+    
+    def test_concurrent_gets_share_one_request(self):
+        """Test that concurrent identical GETs reach the server once."""
+        results = self.fetch_concurrently([self.client() for i in range(10)])
+        
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 1)
+        for result in results:
+            self.assertEqual(result['status_code'], 200)
+            self.assertEqual(len(result['body']), 3)
+        self.assertEqual(hbApi._inflight, {})
+    
+    def test_different_credentials_not_shared(self):
+        """Test that requests with different tokens are not merged."""
+        clients = [self.client() for i in range(2)]
+        other = self.server.session_data()
+        other['body'] = dict(other['body'], access_token='other')
+        clients[1].authorization = other
+        
+        results = self.fetch_concurrently(clients)
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 2)
+        self.assertEqual(results[1]['status_code'], 401)
+        self.assertTrue(clients[1].authRejected)
+    
+    def test_concurrent_snapshots_built_once(self):
+        """Test that concurrent snapshot lookups share one download, model build and disk write."""
+        saved = []
+        clients = [self.client() for i in range(10)]
+        for hb in clients:
+            hb.snapshotStore = types.SimpleNamespace(save=saved.append)
+        results = [None] * len(clients)
+        
+        def lookup(i):
+            results[i] = clients[i].getAccessorySnapshot()
+        
+        threads = [threading.Thread(target=lookup, args=(i,)) for i in range(len(clients))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 1)
+        self.assertTrue(all(snapshot is results[0] for snapshot in results))
+        self.assertEqual(len(saved), 1)
+        self.assertEqual(hbApi._snapshotFlights, {})
+    
+    def test_failed_snapshot_shared(self):
+        """Test that callers waiting on a failed fetch get its error."""
+        self.server.fail_next(1, 500)
+        errors = []
+        
+        def lookup():
+            try:
+                self.client().getAccessorySnapshot()
+            except Exception as inst:
+                errors.append(str(inst))
+        
+        threads = [threading.Thread(target=lookup) for i in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 1)
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(all('Callout error' in e for e in errors))
+    
+    def test_coalescing_can_be_disabled(self):
+        """Test that coalesce=False sends every request."""
+        self.fetch_concurrently([self.client(coalesce=False) for i in range(3)])
+        self.assertEqual(self.server.count('GET', '/api/accessories'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
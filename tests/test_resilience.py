@@ -0,0 +1,250 @@
+"""
+Unit tests for request retries and the per-host circuit breaker.
+"""
+
+import json
+import multiprocessing
+import unittest
+import tempfile
+import shutil
+import socket
+import os
+import time
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes import hbApi
+from classes.resilience import RetryPolicy, CircuitBreaker, getCircuitBreaker, clearCircuitBreakers
+from classes.deadline import Deadline
+from tests.fake_homebridge import FakeHomebridge, write_swagger
+
+
+def record_failure(path, start):
+    start.wait()
+    CircuitBreaker(failureThreshold=100, resetTimeout=10, statePath=path).recordFailure()
+
+
+def try_trial(path, start, allowed):
+    start.wait()
+    allowed.put(CircuitBreaker(resetTimeout=10, statePath=path).allow())
+
+
+def unused_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """Test the backoff schedule."""
+    
+    def test_delay_is_bounded(self):
+        """Test that jittered delays stay within the exponential cap."""
+        policy = RetryPolicy(baseDelay=0.1, maxDelay=0.3)
+        for attempt in range(6):
+            for i in range(20):
+                delay = policy.delay(attempt)
+                self.assertGreaterEqual(delay, 0)
+                self.assertLessEqual(delay, min(0.3, 0.1 * 2 ** attempt))
+    
+    def test_only_idempotent_methods(self):
+        """Test that POST is not retried by default."""
+        policy = RetryPolicy()
+        self.assertTrue(policy.retryable('get'))
+        self.assertTrue(policy.retryable('put'))
+        self.assertFalse(policy.retryable('post'))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test the breaker state machine."""
+    
+    def test_opens_after_threshold(self):
+        """Test that consecutive failures open the circuit."""
+        breaker = CircuitBreaker(failureThreshold=2, resetTimeout=60)
+        breaker.recordFailure()
+        self.assertTrue(breaker.allow())
+        breaker.recordFailure()
+        self.assertFalse(breaker.allow())
+    
+    def test_success_resets_count(self):
+        """Test that a success in between keeps the circuit closed."""
+        breaker = CircuitBreaker(failureThreshold=2, resetTimeout=60)
+        breaker.recordFailure()
+        breaker.recordSuccess()
+        breaker.recordFailure()
+        self.assertTrue(breaker.allow())
+    
+    def test_half_open_trial(self):
+        """Test that one trial call is let through after the reset timeout."""
+        breaker = CircuitBreaker(failureThreshold=1, resetTimeout=0.05)
+        breaker.recordFailure()
+        self.assertFalse(breaker.allow())
+        
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        
+        # a failed trial reopens the circuit, a successful one closes it
+        breaker.recordFailure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.recordSuccess()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_inconclusive_trial_is_released(self):
+        """Test that a trial which says nothing about the host lets the next call try again."""
+        breaker = CircuitBreaker(failureThreshold=1, resetTimeout=60)
+        breaker.recordFailure()
+        breaker.openedAt -= 60
+        
+        self.assertTrue(breaker.allow())
+        breaker.release()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertTrue(breaker.allow())
+    
+    def test_abandoned_trial(self):
+        """Test that a trial which never reports back is given up on after the reset timeout."""
+        breaker = CircuitBreaker(failureThreshold=1, resetTimeout=0.05)
+        breaker.recordFailure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+    
+    def test_state_shared_through_file(self):
+        """Test that failures recorded by one process's breaker trip another's."""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'hb.breaker.json')
+            first = CircuitBreaker(failureThreshold=2, resetTimeout=60, statePath=path)
+            second = CircuitBreaker(failureThreshold=2, resetTimeout=60, statePath=path)
+            
+            first.recordFailure()
+            second.recordFailure()
+            self.assertFalse(first.allow())
+            self.assertGreater(second.retryAfter(), 0)
+            
+            # a success anywhere closes it everywhere
+            first.recordSuccess()
+            self.assertTrue(second.allow())
+        finally:
+            shutil.rmtree(temp_dir)
+    
+    @unittest.skipUnless(hasattr(os, 'fork'), "needs fork")
+    def test_concurrent_processes(self):
+        """Test that processes updating the shared file at once lose no failures and share one trial."""
+        context = multiprocessing.get_context('fork')
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'hb.breaker.json')
+            
+            start = context.Event()
+            workers = [context.Process(target=record_failure, args=(path, start)) for _ in range(30)]
+            for worker in workers:
+                worker.start()
+            start.set()
+            for worker in workers:
+                worker.join()
+            with open(path) as f:
+                self.assertEqual(json.load(f)['failures'], 30)
+            
+            with open(path, 'w') as f:
+                json.dump({'state': 'open', 'failures': 5, 'openedAt': time.time() - 20, 'trialStartedAt': 0.0}, f)
+            start, allowed = context.Event(), context.Queue()
+            workers = [context.Process(target=try_trial, args=(path, start, allowed)) for _ in range(30)]
+            for worker in workers:
+                worker.start()
+            start.set()
+            results = [allowed.get(timeout=10) for _ in workers]
+            for worker in workers:
+                worker.join()
+            self.assertEqual(results.count(True), 1)
+        finally:
+            shutil.rmtree(temp_dir)
+    
+    def test_shared_per_host(self):
+        """Test that clients of the same host share a breaker."""
+        self.assertIs(getCircuitBreaker('hb.local', 8581), getCircuitBreaker('hb.local', '8581'))
+        self.assertIsNot(getCircuitBreaker('hb.local', 8581), getCircuitBreaker('hb.local', 8582))
+        clearCircuitBreakers()
+
+
+class TestRequestResilience(unittest.TestCase):
+    """Test retries and fail-fast behaviour of hbApi.apiRequest."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.spec_path = write_swagger(self.temp_dir)
+        self.policy = RetryPolicy(attempts=3, baseDelay=0.01, maxDelay=0.02)
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        hbApi.closeSessions()
+        clearCircuitBreakers()
+    
+    def test_retries_transient_status(self):
+        """Test that a GET succeeds after transient 503s."""
+        with FakeHomebridge(accessory_count=1) as server:
+            hb = hbApi.hbApi(server.host, server.port, specPath=self.spec_path, retryPolicy=self.policy)
+            hb.authorization = server.session_data()
+            server.fail_next(2)
+            
+            result = hb.apiRequest('/api/auth/check', 'get')
+            self.assertEqual(result['status_code'], 200)
+            self.assertEqual(server.count('GET', '/api/auth/check'), 3)
+    
+    def test_post_is_not_retried(self):
+        """Test that a non-idempotent request is attempted once."""
+        with FakeHomebridge(accessory_count=1) as server:
+            hb = hbApi.hbApi(server.host, server.port, specPath=self.spec_path, retryPolicy=self.policy)
+            server.fail_next(1)
+            
+            result = hb.apiRequest('/api/auth/login', 'post', requestBody={'username': 'admin', 'password': 'admin'})
+            self.assertEqual(result['status_code'], 503)
+            self.assertEqual(server.count('POST', '/api/auth/login'), 1)
+    
+    def test_connection_error_returns_response(self):
+        """Test that an unreachable host gives an error response instead of None."""
+        port = unused_port()
+        hb = hbApi.hbApi('127.0.0.1', port, specPath=self.spec_path, retryPolicy=self.policy)
+        
+        result = hb.apiRequest('/api/auth/login', 'post', requestBody={'username': 'admin', 'password': 'admin'})
+        self.assertEqual(result['status_code'], 0)
+        self.assertEqual(result['body']['error'], 'Connection error')
+    
+    def test_open_circuit_fails_fast(self):
+        """Test that repeated failures stop further calls to the host."""
+        port = unused_port()
+        getCircuitBreaker('127.0.0.1', port).failureThreshold = 3
+        hb = hbApi.hbApi('127.0.0.1', port, specPath=self.spec_path, retryPolicy=self.policy)
+        
+        self.assertEqual(hb.apiRequest('/api/auth/check', 'get')['body']['error'], 'Connection error')
+        self.assertEqual(hb.breaker.state, CircuitBreaker.OPEN)
+        
+        result = hb.apiRequest('/api/auth/check', 'get')
+        self.assertEqual(result['status_code'], 0)
+        self.assertEqual(result['body']['error'], 'Circuit open')
+    
+    def test_trial_cut_short_by_deadline(self):
+        """Test that a trial ended by the caller's deadline does not keep the circuit half-open."""
+        with FakeHomebridge(accessory_count=1, latency=0.5) as server:
+            hb = hbApi.hbApi(server.host, server.port, specPath=self.spec_path, retryPolicy=self.policy)
+            hb.authorization = server.session_data()
+            hb.breaker.recordFailure()
+            hb.breaker.state, hb.breaker.openedAt = CircuitBreaker.OPEN, time.time() - hb.breaker.resetTimeout
+            
+            result = hb.apiRequest('/api/auth/check', 'get', deadline=Deadline(0.2))
+            self.assertEqual(result['body']['error'], 'Deadline exceeded')
+            self.assertNotEqual(hb.breaker.state, CircuitBreaker.HALF_OPEN)
+            
+            server.latency = 0
+            self.assertEqual(hb.apiRequest('/api/auth/check', 'get')['status_code'], 200)
+            self.assertEqual(hb.breaker.state, CircuitBreaker.CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+Unit tests for the SQLite storage and user session providers.
+"""
+
+import unittest
+import tempfile
+import shutil
+import sqlite3
+import threading
+import subprocess
+import time
+import os
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes.sqlite_providers import SQLiteStorageProvider, SQLiteUserSessionProvider
+from tests.fake_homebridge import make_token
+
+
+def session_data(expires_in=28800, issued_at=None):
+    return {
+        'status_code': 201,
+        'host': 'localhost',
+        'port': 8581,
+        'secure': False,
+        'body': {'access_token': make_token(expires_in, issued_at), 'token_type': 'Bearer', 'expires_in': expires_in}
+    }
+
+
+class TestSQLiteStorageProvider(unittest.TestCase):
+    """Test the SQLite session storage."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'hbCli.db')
+        self.provider = SQLiteStorageProvider(self.db_path)
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def test_save_and_load_session(self):
+        """Test saving and loading session data."""
+        data = session_data()
+        self.assertTrue(self.provider.save_session('abc', data))
+        self.assertEqual(self.provider.load_session('abc'), data)
+        self.assertIsNone(self.provider.load_session('missing'))
+    
+    def test_replace_session(self):
+        """Test that saving again replaces the stored data."""
+        self.provider.save_session('abc', session_data())
+        updated = session_data(expires_in=60)
+        self.provider.save_session('abc', updated)
+        self.assertEqual(self.provider.load_session('abc'), updated)
+        self.assertEqual(self.provider.list_sessions(), ['abc'])
+    
+    def test_exists_delete_and_list(self):
+        """Test session_exists, delete_session and list_sessions."""
+        self.provider.save_session('one', session_data())
+        self.provider.save_session('two', session_data())
+        self.assertTrue(self.provider.session_exists('one'))
+        self.assertEqual(sorted(self.provider.list_sessions()), ['one', 'two'])
+        
+        self.assertTrue(self.provider.delete_session('one'))
+        self.assertFalse(self.provider.session_exists('one'))
+        self.assertEqual(self.provider.list_sessions(), ['two'])
+    
+    def test_list_expired_sessions(self):
+        """Test that expired tokens are found through the expiry column."""
+        self.provider.save_session('fresh', session_data())
+        self.provider.save_session('stale', session_data(expires_in=60, issued_at=time.time() - 120))
+        self.assertEqual(self.provider.list_expired_sessions(), ['stale'])
+    
+    def test_wal_mode(self):
+        """Test that the database is switched to WAL journaling."""
+        self.provider.save_session('abc', session_data())
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+    
+    def test_concurrent_writers(self):
+        """Test concurrent writes from threads and another process."""
+        script = (
+            "import sys; sys.path.insert(0, sys.argv[1]);"
+            "from classes.sqlite_providers import SQLiteStorageProvider;"
+            "p = SQLiteStorageProvider(sys.argv[2]);"
+            "[p.save_session(f'proc-{i}', {'host': 'h'}) for i in range(50)]"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        proc = subprocess.Popen([sys.executable, '-c', script, root, self.db_path])
+        
+        def write(n):
+            provider = SQLiteStorageProvider(self.db_path)
+            for i in range(50):
+                self.assertTrue(provider.save_session(f'thread-{n}-{i}', {'host': 'h'}))
+        
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(proc.wait(), 0)
+        
+        self.assertEqual(len(self.provider.list_sessions()), 250)
+
+
+class TestSQLiteUserSessionProvider(unittest.TestCase):
+    """Test the SQLite user-to-session mappings."""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.provider = SQLiteUserSessionProvider(os.path.join(self.temp_dir, 'hbCli.db'))
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def test_set_and_get_session_id(self):
+        """Test setting, replacing and getting session IDs."""
+        self.assertTrue(self.provider.set_session_id('user', 'host', 'one'))
+        self.assertEqual(self.provider.get_session_id('user', 'host'), 'one')
+        self.provider.set_session_id('user', 'host', 'two')
+        self.assertEqual(self.provider.get_session_id('user', 'host'), 'two')
+        self.assertIsNone(self.provider.get_session_id('user', 'other'))
+    
+    def test_remove_user_session(self):
+        """Test removing a user session mapping."""
+        self.provider.set_session_id('user', 'host', 'one')
+        self.assertTrue(self.provider.remove_user_session('user', 'host'))
+        self.assertIsNone(self.provider.get_session_id('user', 'host'))
+    
+    def test_list_user_sessions(self):
+        """Test listing all mappings."""
+        self.provider.set_session_id('user', 'host', 'one')
+        self.provider.set_session_id('other', 'host', 'two')
+        self.assertEqual(sorted(self.provider.list_user_sessions()), [('other', 'host', 'two'), ('user', 'host', 'one')])
+    
+    def test_shares_database_with_storage(self):
+        """Test that both providers can use the same database file."""
+        storage = SQLiteStorageProvider(self.provider.db.path)
+        storage.save_session('one', session_data())
+        self.provider.set_session_id('user', 'localhost', 'one')
+        self.assertEqual(storage.load_session(self.provider.get_session_id('user', 'localhost'))['host'], 'localhost')
+
+
+if __name__ == '__main__':
+    unittest.main()